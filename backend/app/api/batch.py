@@ -1,32 +1,65 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request, Query
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
-from app.database.db import get_db
+from typing import List, Literal, Optional, Union
+from datetime import datetime
+from app.database.db import get_db, SessionLocal
 from app.schemas import batch as batch_schema
 from app.schemas import transaction as transaction_schema
 from app.crud import batch as batch_crud
 from app.crud import transaction as transaction_crud
 from app.crud import user as user_crud
 from app.crud import wallet as wallet_crud
-from app.core import security
+from app.core import security, events
+from app.core.conditional import make_etag, is_not_modified, not_modified_response
+from app.core.pagination import decode_cursor, paginate, page_headers
+from app.core.money import format_amount
 from app.schemas import user as user_schema
 from app.database.models import BatchStatus, BatchRowStatus
-import io
-import csv
+from app.services.batch_scheduler import batch_scheduler
+from app.services import payout_files
+import hashlib
+import asyncio
+import json
 
 router = APIRouter()
 
-@router.get("/", response_model=List[batch_schema.Batch])
+SSE_KEEPALIVE_SECONDS = 15
+UPLOAD_CHUNK_BYTES = 1 << 20
+
+@router.get("/", response_model=Union[List[batch_schema.Batch], List[batch_schema.BatchSummary]])
 def list_batches(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    status: Optional[List[BatchStatus]] = Query(None),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    view: Literal["full", "summary"] = "full",
     db: Session = Depends(get_db),
     current_user: user_schema.User = Depends(security.get_current_user)
 ):
+    """
+    KEYSET PAGINATION (newest first):
+    - Pass the `X-Next-Cursor` response header back as `cursor` for the next page;
+      no header means this was the last page
+    - Filters (`status`, repeatable; `since` <= timestamp < `until`) run in SQL
+    - `view=summary` returns the list-view projection without rows
+    """
     user = user_crud.get_user_by_username(db, username=current_user.username)
-    return batch_crud.get_batches_by_user(db, user_id=user.id)
+    fetch = batch_crud.get_batch_summaries_by_user if view == "summary" else batch_crud.get_batch_rows_by_user
+    rows = fetch(
+        db, user_id=user.id, limit=limit + 1, before=decode_cursor(cursor, (datetime, int)),
+        statuses=status, since=since, until=until
+    )
+    page, next_cursor = paginate(rows, limit, key=lambda b: (b["timestamp"], b["id"]))
+    # Trusted DB output: skip response_model validation, encode with orjson
+    return ORJSONResponse(page, headers=page_headers(next_cursor))
 
 @router.get("/{batch_id}", response_model=batch_schema.Batch)
 def get_batch_details(
     batch_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: user_schema.User = Depends(security.get_current_user)
 ):
@@ -37,8 +70,101 @@ def get_batch_details(
     user = user_crud.get_user_by_username(db, username=current_user.username)
     if batch.user_id != user.id:
         raise HTTPException(status_code=403, detail="Not authorized to view this batch")
-        
-    return batch
+
+    # Version marker: checkpoint, status, counters and a per-status aggregate of the rows
+    # (rows change on compensation/retry without touching the counters). Checked before the rows are loaded.
+    etag = make_etag(
+        "batch", batch.id, batch.status.value, batch.last_processed_index,
+        batch.item_count, batch.success_count, batch.failure_count, batch.reserved_amount, batch.content_digest,
+        batch_crud.get_batch_rows_version(db, batch_id)
+    )
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+
+    body = batch_schema.Batch.model_validate(batch).model_dump(mode="json")
+    return ORJSONResponse(body, headers={"ETag": etag})
+
+def _batch_state_event(batch_id: int):
+    db = SessionLocal()
+    try:
+        batch = batch_crud.get_batch(db, batch_id=batch_id)
+        if not batch:
+            return None
+        finished = batch.status not in (BatchStatus.PENDING, BatchStatus.PROCESSING)
+        return {
+            "event": "finished" if finished else "snapshot",
+            "batch_id": batch_id,
+            "status": batch.status.value,
+            "last_processed_index": batch.last_processed_index,
+            "success_count": batch.success_count,
+            "failure_count": batch.failure_count,
+        }
+    finally:
+        db.close()
+
+@router.get("/{batch_id}/events")
+async def stream_batch_events(
+    batch_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: user_schema.User = Depends(security.get_current_user)
+):
+    """
+    LIVE PROGRESS (Server-Sent Events):
+    Ownership is verified once, then progress is pushed by the executor
+    in-process instead of being polled from the database.
+    """
+    batch = batch_crud.get_batch(db, batch_id=batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    user = user_crud.get_user_by_username(db, username=current_user.username)
+    if batch.user_id != user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to view this batch")
+
+    queue = events.progress_broker.subscribe(batch_id)
+    snapshot = events.progress_broker.latest(batch_id) or {
+        "event": "snapshot",
+        "batch_id": batch_id,
+        "status": batch.status.value,
+        "last_processed_index": batch.last_processed_index,
+        "success_count": batch.success_count,
+        "failure_count": batch.failure_count,
+    }
+    is_running = batch.status in (BatchStatus.PENDING, BatchStatus.PROCESSING)
+    # Release the pooled connection: the stream itself never touches the DB
+    db.close()
+
+    async def event_stream():
+        try:
+            yield events.format_sse(snapshot)
+            if not is_running:
+                return
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if events.progress_broker.latest(batch_id) is None:
+                        # Executed by another worker process: fall back to the DB state
+                        event = await run_in_threadpool(_batch_state_event, batch_id)
+                        if event:
+                            yield events.format_sse(event)
+                            if event["event"] == "finished":
+                                break
+                            continue
+                    yield ": keep-alive\n\n"
+                    continue
+                yield events.format_sse(event)
+                if event["event"] == "finished":
+                    break
+        finally:
+            events.progress_broker.unsubscribe(batch_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @router.post("/", response_model=batch_schema.Batch)
 def create_new_batch(
@@ -49,14 +175,37 @@ def create_new_batch(
     user = user_crud.get_user_by_username(db, username=current_user.username)
     return batch_crud.create_batch(db, batch=batch, user_id=user.id)
 
-@router.post("/{batch_id}/execute")
-async def execute_batch(
-    batch_id: int,
-    file: UploadFile = File(...),
-    pin: str = Form(...),
-    db: Session = Depends(get_db),
-    current_user: user_schema.User = Depends(security.get_current_user)
-):
+async def _read_upload(file: UploadFile) -> str:
+    """Reads the upload in chunks, hashing while it streams. Returns the sha256 hex digest."""
+    digest = hashlib.sha256()
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        digest.update(chunk)
+    return digest.hexdigest()
+
+async def _parse_upload(file: UploadFile) -> payout_files.PayoutRows:
+    """
+    Payout file -> recipient_id / amount (minor units) columns. Format is sniffed
+    from the content (CSV, gzip/zstd CSV, Parquet, Arrow IPC); decoding runs off
+    the event loop, straight from the spooled upload file.
+    """
+    await file.seek(0)
+    try:
+        return await run_in_threadpool(payout_files.read_payout_rows, file.file)
+    except payout_files.UnsupportedFormat as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _prepare_batch_execution(batch_id: int, file: UploadFile, pin: str, db: Session, current_user: user_schema.User,
+                                   allow_duplicate: bool = False):
+    """
+    Shared gate for execute/schedule: ownership, PIN, status check,
+    upload fingerprint, payout file parse & BatchRow sync, non-binding funds pre-check.
+    Returns (batch, upload info, pre-check warning).
+    """
     # 1. Verify Batch & Ownership
     batch = batch_crud.get_batch(db, batch_id=batch_id)
     if not batch:
@@ -77,88 +226,103 @@ async def execute_batch(
     if batch.status not in [BatchStatus.PENDING, BatchStatus.PROCESSING]:
         raise HTTPException(status_code=400, detail=f"Batch cannot be executed in current status: {batch.status}")
 
-    # 2. Parse CSV & Create/Sync Rows
-    content = await file.read()
-    decoded = content.decode('utf-8')
-    csv_reader = csv.DictReader(io.StringIO(decoded))
-    rows = list(csv_reader)
-    
-    # Sync database BatchRow records if they don't exist (first time)
-    if not batch.rows:
-        for index, row in enumerate(rows):
-            batch_crud.create_batch_row(
-                db, 
-                batch_id=batch_id, 
-                index=index, 
-                recipient_id=int(row['recipient_id']), 
-                amount=float(row['amount'])
+    # 2. Fingerprint the upload while it streams in
+    row_count, total_batch_amount = batch_crud.get_batch_row_totals(db, batch_id)
+    digest = await _read_upload(file)
+    duplicate_of = []
+
+    if row_count:
+        # Resume/retry: rows are already persisted, so the file is not parsed again
+        if batch.content_digest and batch.content_digest != digest:
+            raise HTTPException(status_code=409, detail="This batch was synced from a different file. Re-upload the original file.")
+    else:
+        # First upload: flag the same file already synced into another batch (double payout)
+        duplicate_of = batch_crud.find_batches_by_digest(db, batch.user_id, digest, exclude_batch_id=batch_id)
+        if duplicate_of and not allow_duplicate:
+            raise HTTPException(
+                status_code=409,
+                detail=f"An identical file was already uploaded to batch {', '.join(map(str, duplicate_of))}. Pass allow_duplicate=true to proceed."
             )
-        db.refresh(batch)
+        parsed = await _parse_upload(file)
+        if not parsed:
+            # Checked before the claim: an empty file must not lock the batch to its digest
+            raise HTTPException(status_code=400, detail="The uploaded file contains no payout rows")
+        if not batch_crud.create_batch_rows(db, batch_id, parsed, digest):
+            raise HTTPException(status_code=409, detail="Batch rows are already being synced by another upload")
+        row_count, total_batch_amount = len(parsed), parsed.total()
+    db.refresh(batch)
 
-    # 3. OPTIONAL PRE-CHECK (Non-binding)
-    total_batch_amount = sum(float(row['amount']) for row in rows)
+    # 3. OPTIONAL PRE-CHECK (Non-binding), exact integer sum of minor units
     source_wallet = wallet_crud.get_wallet(db, batch.source_wallet_id)
     pre_check_warning = None
     if source_wallet.balance < total_batch_amount:
-        pre_check_warning = f"Warning: Source wallet has {source_wallet.balance}, but batch requires {total_batch_amount}. Execution will proceed but may fail mid-way."
+        pre_check_warning = f"Warning: Source wallet has {format_amount(source_wallet.balance)}, but batch requires {format_amount(total_batch_amount)}. Execution will proceed but may fail mid-way."
 
-    # 4. Update Status to PROCESSING
-    if batch.status == BatchStatus.PENDING:
-        batch_crud.update_batch_progress(db, batch_id, status=BatchStatus.PROCESSING)
+    upload = {"total": row_count, "content_digest": digest, "duplicate_of": duplicate_of}
+    return batch, upload, pre_check_warning
 
-    # 5. Process Rows starting from last_processed_index + 1
-    # This provides RESUMABILITY if the server crashed previously
-    start_index = batch.last_processed_index + 1
-    
-    for index in range(start_index, len(rows)):
-        row_data = rows[index]
-        db_row = batch.rows[index] # Assumes rows are fetched in index order
-        
-        try:
-            recipient_id = int(row_data['recipient_id'])
-            amount = float(row_data['amount'])
-            
-            # Idempotency Key: batch_{id}_row_{index}
-            # Reuse logic to ensure retries are safe
-            idempotency_key = f"batch_{batch_id}_row_{index}"
-            
-            tx_data = transaction_schema.TransactionCreate(
-                from_wallet_id=batch.source_wallet_id,
-                to_wallet_id=recipient_id,
-                amount=amount,
-                idempotency_key=idempotency_key,
-                batch_id=batch_id,
-                pin="BATCH_EXECUTION"
-            )
-            
-            # Core transfer logic (Hardened)
-            tx = transaction_crud.create_transfer_secure(db, tx_data)
-            
-            # Update row tracking
-            batch_crud.update_batch_row(db, db_row.id, status=BatchRowStatus.SUCCESS, transaction_id=tx.id)
-            # Update batch progress
-            batch_crud.update_batch_progress(db, batch_id, success=True, amount=amount, is_item=True, last_index=index)
-            
-        except Exception as e:
-            # Individual row failure: Track error but don't stop the whole batch
-            batch_crud.update_batch_row(db, db_row.id, status=BatchRowStatus.FAILED, error_message=str(e))
-            batch_crud.update_batch_progress(db, batch_id, success=False, is_item=True, last_index=index)
+@router.post("/{batch_id}/execute")
+async def execute_batch(
+    batch_id: int,
+    file: UploadFile = File(...),
+    pin: str = Form(...),
+    allow_duplicate: bool = Form(False),
+    db: Session = Depends(get_db),
+    current_user: user_schema.User = Depends(security.get_current_user)
+):
+    batch, upload, pre_check_warning = await _prepare_batch_execution(batch_id, file, pin, db, current_user, allow_duplicate)
 
-    # 6. Final Status Transition
-    final_status = BatchStatus.COMPLETED if batch.failure_count == 0 else BatchStatus.PARTIALLY_FAILED
-    batch_crud.update_batch_progress(db, batch_id, status=final_status)
+    # 4. Run through the scheduler and wait: batches sharing this source wallet
+    # are serialized, other sources keep running in parallel
+    source_wallet_id, user_id = batch.source_wallet_id, batch.user_id
+    # End the read transaction first; it must not stay open while the batch runs
+    db.commit()
+    future = batch_scheduler.submit(batch_id, source_wallet_id, user_id)
+    final_status = await asyncio.wrap_future(future)
+    db.expire_all()
     
     return {
         "status": f"Batch processing finished with state: {final_status}", 
         "batch_id": batch_id,
         "pre_check_warning": pre_check_warning,
+        "content_digest": upload["content_digest"],
+        "duplicate_of": upload["duplicate_of"],
         "summary": {
-            "total": len(rows),
+            "total": upload["total"],
             "success": batch.success_count,
             "failed": batch.failure_count
         }
     }
 
+@router.post("/{batch_id}/schedule", status_code=202)
+async def schedule_batch(
+    batch_id: int,
+    file: UploadFile = File(...),
+    pin: str = Form(...),
+    allow_duplicate: bool = Form(False),
+    db: Session = Depends(get_db),
+    current_user: user_schema.User = Depends(security.get_current_user)
+):
+    """
+    ASYNCHRONOUS EXECUTION:
+    Same checks as /execute, but returns immediately once the batch is queued.
+    Follow progress via GET /batches/{batch_id}/events.
+    """
+    batch, upload, pre_check_warning = await _prepare_batch_execution(batch_id, file, pin, db, current_user, allow_duplicate)
+    source_wallet_id, user_id = batch.source_wallet_id, batch.user_id
+    db.commit()
+    batch_scheduler.submit(batch_id, source_wallet_id, user_id)
+
+    return {
+        "status": "Batch queued",
+        "batch_id": batch_id,
+        "pre_check_warning": pre_check_warning,
+        "content_digest": upload["content_digest"],
+        "duplicate_of": upload["duplicate_of"],
+        "queue_position": batch_scheduler.queue_position(batch_id),
+        "total": upload["total"]
+    }
+
 @router.post("/{batch_id}/compensate")
 def compensate_batch(
     batch_id: int,
@@ -186,25 +350,28 @@ def compensate_batch(
         raise HTTPException(status_code=403, detail="Invalid Transaction PIN")
 
     results = []
-    db_rows = batch_crud.get_batch_rows(db, batch_id)
-    
+    # Plain values: every reversal commits, which expires ORM rows (one reload per access)
+    source_wallet_id = batch.source_wallet_id
+    db_rows = [(row.status, row.transaction_id, row.recipient_id, row.amount) for row in batch_crud.get_batch_rows(db, batch_id)]
+
     for idx in request.row_indices:
         if idx < 0 or idx >= len(db_rows):
             results.append({"index": idx, "status": "Error", "detail": "Invalid index"})
             continue
             
-        row = db_rows[idx]
-        if row.status != BatchRowStatus.SUCCESS or not row.transaction_id:
+        row_status, transaction_id, recipient_id, amount = db_rows[idx]
+        if row_status != BatchRowStatus.SUCCESS or not transaction_id:
             results.append({"index": idx, "status": "Skipped", "detail": "Row was not successful"})
             continue
 
         try:
             # Create a REVERSAL transfer
             # From: Original Recipient -> To: Original Source
-            rev_tx_data = transaction_schema.TransactionCreate(
-                from_wallet_id=row.recipient_id,
-                to_wallet_id=batch.source_wallet_id,
-                amount=row.amount,
+            # Stored minor units: already exact, so skip the decimal request parser
+            rev_tx_data = transaction_schema.TransactionCreate.model_construct(
+                from_wallet_id=recipient_id,
+                to_wallet_id=source_wallet_id,
+                amount=amount,
                 idempotency_key=f"reversal_batch_{batch_id}_row_{idx}",
                 pin="COMPENSATION"
             )
@@ -214,3 +381,75 @@ def compensate_batch(
             results.append({"index": idx, "status": "Failed", "detail": str(e)})
 
     return {"batch_id": batch_id, "compensation_results": results}
+
+@router.post("/{batch_id}/compensate/bulk")
+def compensate_batch_bulk(
+    batch_id: int,
+    request: batch_schema.BatchBulkCompensationRequest,
+    db: Session = Depends(get_db),
+    current_user: user_schema.User = Depends(security.get_current_user)
+):
+    """
+    BULK COMPENSATION:
+    Reverses an index range (or every successful row) in chunked, set-based
+    DB transactions and streams per-row results back as NDJSON.
+    Reversal keys match the single-row endpoint, so both modes are mutually idempotent.
+    """
+    batch = batch_crud.get_batch(db, batch_id=batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    user = user_crud.get_user_by_username(db, username=current_user.username)
+    if batch.user_id != user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    # PIN Authorization
+    if not user.transaction_pin_hash:
+        raise HTTPException(status_code=403, detail="Transaction PIN not set. Please set it via /users/me/pin")
+
+    if not security.verify_transaction_pin(request.pin, user.transaction_pin_hash):
+        raise HTTPException(status_code=403, detail="Invalid Transaction PIN")
+
+    source_wallet_id = batch.source_wallet_id
+
+    def result_stream():
+        # Own session: the request-scoped one is closed before the body is streamed
+        stream_db = SessionLocal()
+        summary = {"Compensated": 0, "Failed": 0, "Skipped": 0, "Error": 0}
+        try:
+            if request.all_successful:
+                rows = batch_crud.get_compensable_rows(stream_db, batch_id)
+            else:
+                # Clamp to the rows that exist: the output is bounded by the batch, not the request
+                row_count = batch_crud.count_batch_rows(stream_db, batch_id)
+                last_index = min(request.end_index, row_count - 1)
+                rows = batch_crud.get_compensable_rows(stream_db, batch_id, request.start_index, last_index)
+                if request.end_index >= row_count:
+                    summary["Error"] += 1
+                    yield json.dumps({
+                        "start_index": max(request.start_index, row_count), "end_index": request.end_index,
+                        "status": "Error", "detail": f"Invalid index range: batch has {row_count} rows"
+                    }) + "\n"
+                compensable = {row.row_index for row in rows}
+                for idx in range(request.start_index, last_index + 1):
+                    if idx in compensable:
+                        continue
+                    summary["Skipped"] += 1
+                    yield json.dumps({"index": idx, "status": "Skipped", "detail": "Row was not successful"}) + "\n"
+
+            for offset in range(0, len(rows), request.chunk_size):
+                chunk = rows[offset:offset + request.chunk_size]
+                try:
+                    results = transaction_crud.create_reversals_bulk(stream_db, batch_id, source_wallet_id, chunk)
+                except Exception as e:
+                    detail = e.detail if isinstance(e, HTTPException) else str(e)
+                    results = [{"index": row.row_index, "status": "Failed", "detail": detail} for row in chunk]
+                for result in results:
+                    summary[result["status"]] += 1
+                    yield json.dumps(result) + "\n"
+
+            yield json.dumps({"batch_id": batch_id, "summary": summary}) + "\n"
+        finally:
+            stream_db.close()
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
@@ -0,0 +1,74 @@
+import asyncio
+from typing import List, Optional
+
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect, status
+from starlette.concurrency import run_in_threadpool
+
+from app.core import security
+from app.core.notifications import hub
+from app.crud import user as user_crud
+from app.crud import wallet as wallet_crud
+from app.database.db import SessionLocal
+
+router = APIRouter()
+
+def _owned_wallet_ids(username: str) -> Optional[List[int]]:
+    db = SessionLocal()
+    try:
+        user = user_crud.get_user_by_username(db, username=username)
+        if not user:
+            return None
+        return [w.id for w in wallet_crud.get_wallets_by_user(db, user_id=user.id)]
+    finally:
+        db.close()
+
+@router.websocket("/wallets")
+async def wallet_events(
+    websocket: WebSocket,
+    token: str = Query(...),
+    wallet_id: Optional[List[int]] = Query(None)
+):
+    """
+    REAL-TIME WALLET PUSH:
+    - Auth: JWT in the `token` query parameter (browsers cannot set headers on WebSockets)
+    - Scope: the caller's wallets, optionally narrowed with repeated `wallet_id`
+    - Messages: {"type": "transaction", ...} and {"type": "balance", "wallet_id", "balance"},
+      only for committed changes (Postgres LISTEN/NOTIFY, fanned out per worker)
+    """
+    token_data = security.decode_access_token(token)
+    if token_data is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    owned = await run_in_threadpool(_owned_wallet_ids, token_data.username)
+    if owned is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    wallet_ids = [w for w in owned if w in set(wallet_id)] if wallet_id else owned
+    if wallet_id and len(wallet_ids) != len(set(wallet_id)):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    queue = hub.subscribe(wallet_ids)
+    await websocket.send_json({"type": "subscribed", "wallet_ids": wallet_ids})
+
+    # The client never needs to send anything; reading only detects the disconnect
+    receiver = asyncio.ensure_future(websocket.receive())
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                getter.cancel()
+                message = receiver.result()
+                if message["type"] == "websocket.disconnect":
+                    break
+                receiver = asyncio.ensure_future(websocket.receive())
+                continue
+            await websocket.send_json(getter.result())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        hub.unsubscribe(wallet_ids, queue)
@@ -1,15 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Header
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from app.database.db import get_db
+from app.database.db import get_db, SessionLocal
 from app.schemas import transaction as transaction_schema
 from app.crud import transaction as transaction_crud
 from app.core import security
+from app.core.conditional import make_etag, is_not_modified, not_modified_response
+from app.core.admission import admit_transfer
 from app.schemas import user as user_schema
+from app.services import bulk_transfer
+from app.core import config
 from typing import List
+import asyncio
+import json
 
 router = APIRouter()
 
-@router.post("/", response_model=transaction_schema.Transaction)
+@router.post("/", response_model=transaction_schema.Transaction, dependencies=[Depends(admit_transfer)])
 def transfer_money(
     transaction: transaction_schema.TransactionCreate, 
     db: Session = Depends(get_db),
@@ -20,12 +28,12 @@ def transfer_money(
     from app.crud import wallet as wallet_crud
     
     user = user_crud.get_user_by_username(db, username=current_user.username)
-    wallet = wallet_crud.get_wallet(db, wallet_id=transaction.from_wallet_id)
+    wallet = wallet_crud.get_wallet_snapshot(db, wallet_id=transaction.from_wallet_id)
     
     if not wallet:
         raise HTTPException(status_code=404, detail="Source wallet not found")
     
-    if wallet.user_id != user.id:
+    if wallet["user_id"] != user.id:
         raise HTTPException(status_code=403, detail="You do not own the source wallet")
     
     # 2. PIN Authorization
@@ -37,21 +45,151 @@ def transfer_money(
 
     return transaction_crud.create_transfer_secure(db=db, transaction=transaction)
 
+@router.post("/multi", response_model=transaction_schema.MultiTransfer, dependencies=[Depends(admit_transfer)])
+def transfer_multi(
+    transfer: transaction_schema.MultiTransferCreate,
+    db: Session = Depends(get_db),
+    current_user: user_schema.User = Depends(security.get_current_user)
+):
+    """
+    ATOMIC MULTI-LEG TRANSFER:
+    N legs (e.g. buyer -> seller, buyer -> platform fee, buyer -> tax) commit
+    together or not at all, with one lock round and one commit.
+    Every debited wallet must belong to the caller.
+    """
+    from app.crud import user as user_crud
+    from app.crud import wallet as wallet_crud
+
+    user = user_crud.get_user_by_username(db, username=current_user.username)
+    for wallet_id in sorted({leg.from_wallet_id for leg in transfer.legs}):
+        wallet = wallet_crud.get_wallet_snapshot(db, wallet_id=wallet_id)
+        if not wallet:
+            raise HTTPException(status_code=404, detail=f"Source wallet {wallet_id} not found")
+        if wallet["user_id"] != user.id:
+            raise HTTPException(status_code=403, detail=f"You do not own source wallet {wallet_id}")
+
+    if not user.transaction_pin_hash:
+        raise HTTPException(status_code=403, detail="Transaction PIN not set. Please set it via /users/me/pin")
+
+    if not security.verify_transaction_pin(transfer.pin, user.transaction_pin_hash):
+        raise HTTPException(status_code=403, detail="Invalid Transaction PIN")
+
+    transactions = transaction_crud.create_multi_transfer_secure(db=db, transfer=transfer)
+    return {"idempotency_key": transfer.idempotency_key, "transactions": transactions}
+
+@router.post("/bulk")
+async def transfer_bulk(
+    request: Request,
+    x_transaction_pin: str = Header(..., description="Transaction PIN, verified once for the whole stream"),
+    db: Session = Depends(get_db),
+    current_user: user_schema.User = Depends(security.get_current_user)
+):
+    """
+    STREAMING BULK TRANSFERS:
+    Body is NDJSON, one TransactionCreate per line (without `pin`).
+    Auth + PIN are verified once; items are read, parsed and executed in
+    pipelined chunks (the next chunk is parsed while the current one commits)
+    and per-item results stream back as NDJSON as soon as their chunk commits.
+    """
+    from app.crud import user as user_crud
+
+    user = user_crud.get_user_by_username(db, username=current_user.username)
+    if not user.transaction_pin_hash:
+        raise HTTPException(status_code=403, detail="Transaction PIN not set. Please set it via /users/me/pin")
+
+    pin_ok = await run_in_threadpool(security.verify_transaction_pin, x_transaction_pin, user.transaction_pin_hash)
+    if not pin_ok:
+        raise HTTPException(status_code=403, detail="Invalid Transaction PIN")
+
+    user_id = user.id
+    # Release the request-scoped connection; the stream uses its own session
+    db.close()
+
+    chunk_size = config.BULK_TRANSFER_CHUNK_SIZE
+
+    async def read_chunks(queue: asyncio.Queue):
+        chunk, buffer, line_no = [], b"", 0
+        try:
+            async for data in request.stream():
+                buffer += data
+                *lines, buffer = buffer.split(b"\n")
+                for raw in lines:
+                    line_no += 1
+                    if not raw.strip():
+                        continue
+                    item, error = bulk_transfer.parse_item(line_no, raw, x_transaction_pin)
+                    chunk.append((line_no, error or item))
+                    if len(chunk) >= chunk_size:
+                        await queue.put(chunk)
+                        chunk = []
+            if buffer.strip():
+                line_no += 1
+                item, error = bulk_transfer.parse_item(line_no, buffer, x_transaction_pin)
+                chunk.append((line_no, error or item))
+            if chunk:
+                await queue.put(chunk)
+        finally:
+            await queue.put(None)
+
+    async def result_stream():
+        # maxsize=2: at most one chunk parsed ahead of the one being executed
+        queue = asyncio.Queue(maxsize=2)
+        reader = asyncio.create_task(read_chunks(queue))
+        stream_db = SessionLocal()
+        owned = {}
+        summary = {"Committed": 0, "Failed": 0, "Invalid": 0}
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    break
+                results = await run_in_threadpool(bulk_transfer.process_transfer_chunk, stream_db, user_id, chunk, owned)
+                for result in results:
+                    summary[result["status"]] += 1
+                yield "".join(json.dumps(result) + "\n" for result in results)
+            await reader
+            yield json.dumps({"summary": summary}) + "\n"
+        finally:
+            reader.cancel()
+            stream_db.close()
+
+    return DuplexStreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse for endpoints that keep reading the request body while
+    responding. The stock class polls `receive` for disconnects concurrently,
+    which would steal body messages; here the body reader sees the disconnect instead.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
 @router.get("/history/{wallet_id}", response_model=List[transaction_schema.Transaction])
 def get_history(
     wallet_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: user_schema.User = Depends(security.get_current_user)
 ):
     # Verification: Ensure current_user owns the wallet
     from app.crud import wallet as wallet_crud
-    wallet = wallet_crud.get_wallet(db, wallet_id=wallet_id)
+    wallet = wallet_crud.get_wallet_snapshot(db, wallet_id=wallet_id)
     if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
     
     from app.crud import user as user_crud
     user = user_crud.get_user_by_username(db, username=current_user.username)
-    if wallet.user_id != user.id:
+    if wallet["user_id"] != user.id:
         raise HTTPException(status_code=403, detail="Not authorized to view this wallet's history")
         
-    return transaction_crud.get_transactions_by_wallet(db, wallet_id=wallet_id)
+    # The ledger is append-only: newest id + count is a complete version marker
+    last_id, count = transaction_crud.get_wallet_history_version(db, wallet_id=wallet_id)
+    etag = make_etag("history", wallet_id, last_id, count)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+
+    # Trusted DB output: skip response_model validation, encode with orjson
+    return ORJSONResponse(transaction_crud.get_transaction_rows_by_wallet(db, wallet_id=wallet_id), headers={"ETag": etag})
@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from sqlalchemy.orm import Session
-from app.database.db import get_db
+from app.database.db import get_db, SessionLocal
 from app.schemas import user as user_schema
 from app.crud import user as user_crud
-from typing import List
+from typing import List, Optional
 from fastapi.security import OAuth2PasswordRequestForm
 from app.core import security
+from app.core.pagination import decode_cursor, paginate, page_headers
 from app.database import models
+from app.services import provisioning
+import io
+import json
+import shutil
+import tempfile
 
 router = APIRouter()
 
@@ -58,7 +65,45 @@ def set_transaction_pin(
 def create_user(user: user_schema.UserCreate, db: Session = Depends(get_db)):
     return user_crud.create_user(db=db, user=user)
 
+@router.post("/bulk")
+def provision_users_bulk(
+    file: UploadFile = File(...),
+    current_user: user_schema.User = Depends(security.get_current_user)
+):
+    """
+    BULK PROVISIONING:
+    CSV upload (username,email,password[,pin]) -> users + wallets in chunked
+    multi-row INSERTs. Per-row results (Created / Conflict / Invalid) stream back as NDJSON.
+    Same pipeline as `python -m app.cli provision-users`.
+    """
+    # The upload is closed once the handler returns; hand the stream its own spooled copy
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    shutil.copyfileobj(file.file, spool)
+    spool.seek(0)
+
+    def result_stream():
+        # Own session: the request-scoped one is closed before the body is streamed
+        db = SessionLocal()
+        try:
+            source = io.TextIOWrapper(spool, encoding="utf-8", newline="")
+            for result in provisioning.provision_users(db, source):
+                yield json.dumps(result) + "\n"
+        finally:
+            db.close()
+            spool.close()
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
 @router.get("/", response_model=List[user_schema.User])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = user_crud.get_users(db, skip=skip, limit=limit)
-    return users
+def read_users(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    skip: int = Query(0, ge=0, deprecated=True),
+    db: Session = Depends(get_db)
+):
+    # Keyset pages by id: follow the X-Next-Cursor header instead of growing `skip`
+    after = decode_cursor(cursor, (int,))
+    rows = user_crud.get_user_rows(db, limit=limit + 1, after_id=after[0] if after else None, skip=skip)
+    page, next_cursor = paginate(rows, limit, key=lambda u: (u["id"],))
+    # Trusted DB output: skip response_model validation, encode with orjson
+    return ORJSONResponse(page, headers=page_headers(next_cursor))
@@ -1,11 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import ORJSONResponse
+from typing import List, Optional
+from datetime import date
 from sqlalchemy.orm import Session
 from app.database.db import get_db
 from app.schemas import wallet as wallet_schema
 from app.crud import wallet as wallet_crud
 from app.core import security
+from app.core.conditional import make_etag, is_not_modified, not_modified_response
+from app.core.money import major_fields
 from app.schemas import user as user_schema
+from app.services import rollups
 
 router = APIRouter()
 
@@ -41,18 +46,82 @@ def create_wallet(
     return wallet_crud.create_wallet(db=db, wallet=wallet)
 
 @router.get("/{wallet_id}", response_model=wallet_schema.Wallet)
-def read_wallet(wallet_id: int, db: Session = Depends(get_db)):
-    db_wallet = wallet_crud.get_wallet(db, wallet_id=wallet_id)
+def read_wallet(wallet_id: int, request: Request, db: Session = Depends(get_db)):
+    # Cached snapshot: a warm If-None-Match check never touches the DB
+    db_wallet = wallet_crud.get_wallet_snapshot(db, wallet_id=wallet_id)
     if db_wallet is None:
         raise HTTPException(status_code=404, detail="Wallet not found")
-    return db_wallet
+
+    etag = make_etag("wallet", db_wallet["id"], db_wallet["balance"], db_wallet["status"])
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    # Copy: the snapshot may be the cached object itself
+    return ORJSONResponse(major_fields(dict(db_wallet), "balance"), headers={"ETag": etag})
 
 @router.post("/{wallet_id}/deposit", response_model=wallet_schema.Wallet)
 def deposit(wallet_id: int, deposit: wallet_schema.WalletDeposit, db: Session = Depends(get_db)):
-    updated_wallet = wallet_crud.deposit_wallet(db, wallet_id=wallet_id, amount=deposit.amount)
+    updated_wallet = wallet_crud.deposit_wallet(db, wallet_id=wallet_id, amount=deposit.amount, idempotency_key=deposit.idempotency_key)
     if not updated_wallet:
          raise HTTPException(status_code=404, detail="Wallet not found")
     return updated_wallet
+
+@router.post("/deposits/bulk")
+def deposit_bulk(request: wallet_schema.WalletBulkDeposit, db: Session = Depends(get_db)):
+    """
+    BULK FUNDING:
+    Applies N deposits in chunked set-based statements; returns per-item results.
+    """
+    results = wallet_crud.deposit_wallets_bulk(db, request.deposits)
+    return {
+        "deposited": sum(1 for r in results if r["status"] == "Deposited"),
+        "failed": sum(1 for r in results if r["status"] == "Failed"),
+        "results": results
+    }
+
 @router.post("/balances", response_model=List[wallet_schema.Wallet])
 def read_wallets_balances(wallet_ids: List[int], db: Session = Depends(get_db)):
-    return wallet_crud.get_wallets_balances(db, wallet_ids=wallet_ids)
+    # Trusted DB output: skip response_model validation, encode with orjson
+    return ORJSONResponse(wallet_crud.get_wallet_rows_balances(db, wallet_ids=wallet_ids))
+
+def _statement_days(db: Session, wallet_id: int, since: Optional[date], until: Optional[date], current_user: user_schema.User):
+    from app.crud import user as user_crud
+    wallet = wallet_crud.get_wallet_snapshot(db, wallet_id=wallet_id)
+    if not wallet:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+    user = user_crud.get_user_by_username(db, username=current_user.username)
+    if wallet["user_id"] != user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to view this wallet's statement")
+    if since and until and since >= until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    # The statement reads on its own snapshot session; end this read-only one first
+    # (on SQLite its open transaction holds the write lock)
+    db.rollback()
+    return rollups.wallet_daily_totals(wallet_id, since, until)
+
+@router.get("/{wallet_id}/statement", response_model=wallet_schema.WalletStatement)
+def read_wallet_statement(
+    wallet_id: int,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    db: Session = Depends(get_db),
+    current_user: user_schema.User = Depends(security.get_current_user)
+):
+    """
+    DAILY STATEMENT (since <= day < until, UTC days):
+    Per-day inflow/outflow/counts from the pre-aggregated rollups plus the
+    not-yet-rolled-up tail; the ledger itself is never rescanned.
+    """
+    days = _statement_days(db, wallet_id, since, until, current_user)
+    return {"wallet_id": wallet_id, "since": since, "until": until, "days": days, "totals": rollups.sum_totals(days)}
+
+@router.get("/{wallet_id}/totals", response_model=wallet_schema.WalletTotals)
+def read_wallet_totals(
+    wallet_id: int,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    db: Session = Depends(get_db),
+    current_user: user_schema.User = Depends(security.get_current_user)
+):
+    """Date-range totals only (analytics), same source as /statement."""
+    days = _statement_days(db, wallet_id, since, until, current_user)
+    return {"wallet_id": wallet_id, "since": since, "until": until, "totals": rollups.sum_totals(days)}
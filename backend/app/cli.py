@@ -0,0 +1,106 @@
+"""
+Operational CLI for jobs that talk to the database directly.
+Run from the backend directory:  python -m app.cli <command> --help
+"""
+import argparse
+import json
+import sys
+
+from app.database import models, db
+
+def provision_users_command(args):
+    from app.services import provisioning
+    session = db.SessionLocal()
+    try:
+        with open(args.file, encoding="utf-8", newline="") as source:
+            for result in provisioning.provision_users(session, source, chunk_size=args.chunk_size, processes=args.processes):
+                sys.stdout.write(json.dumps(result) + "\n")
+    finally:
+        session.close()
+        provisioning.shutdown_pool()
+
+def dispatch_outbox_command(args):
+    from app.services.outbox_dispatcher import OutboxDispatcher, build_sink
+    sink = build_sink(args.sink)
+    if sink is None:
+        raise SystemExit(f"Unknown sink: {args.sink}")
+    dispatcher = OutboxDispatcher(sink, batch_size=args.batch_size)
+    if not args.once:
+        dispatcher.start()
+        try:
+            dispatcher._thread.join()
+        except KeyboardInterrupt:
+            dispatcher.stop()
+        return
+    session = db.SessionLocal()
+    try:
+        delivered = dispatcher.drain(session)
+        sys.stdout.write(json.dumps({"delivered": delivered, "purged": dispatcher.purge(session)}) + "\n")
+    finally:
+        session.close()
+
+def reconcile_command(args):
+    from app.services import reconciliation
+    session = db.SessionLocal()
+    try:
+        report = reconciliation.reconcile(
+            session, full=args.full, chunk_size=args.chunk_size,
+            settle_seconds=args.settle_seconds, tolerance=args.tolerance
+        )
+    finally:
+        session.close()
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    sys.stdout.write(payload + "\n")
+    # Non-zero exit for cron/CI when the ledger and balances disagree
+    if not report["ok"]:
+        sys.exit(1)
+
+def rollup_wallets_command(args):
+    from app.services import rollups
+    session = db.SessionLocal()
+    try:
+        advance = rollups.rebuild_rollups if args.rebuild else rollups.advance_rollups
+        result = advance(session, chunk_size=args.chunk_size, settle_seconds=args.settle_seconds)
+    finally:
+        session.close()
+    sys.stdout.write(json.dumps(result) + "\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="G-Wallet operational commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    provision = commands.add_parser("provision-users", help="Bulk-create users and wallets from a CSV (username,email,password[,pin])")
+    provision.add_argument("file")
+    provision.add_argument("--chunk-size", type=int, default=None)
+    provision.add_argument("--processes", type=int, default=None)
+    provision.set_defaults(handler=provision_users_command)
+
+    dispatch = commands.add_parser("dispatch-outbox", help="Deliver pending outbox events and purge old dispatched ones (--once drains the backlog and exits)")
+    dispatch.add_argument("--sink", default=None, help="file, queue or webhook (default: OUTBOX_SINK)")
+    dispatch.add_argument("--batch-size", type=int, default=None)
+    dispatch.add_argument("--once", action="store_true")
+    dispatch.set_defaults(handler=dispatch_outbox_command)
+
+    reconcile = commands.add_parser("reconcile", help="Check wallet balances and batch counters against the ledger (incremental)")
+    reconcile.add_argument("--full", action="store_true", help="Drop the checkpoint and re-scan the whole ledger")
+    reconcile.add_argument("--chunk-size", type=int, default=None)
+    reconcile.add_argument("--settle-seconds", type=int, default=None)
+    reconcile.add_argument("--tolerance", type=int, default=None, help="Allowed difference in minor units (default 0)")
+    reconcile.add_argument("--output", default=None, help="Also write the JSON report to this file")
+    reconcile.set_defaults(handler=reconcile_command)
+
+    rollup = commands.add_parser("rollup-wallets", help="Fold settled transactions into the per-wallet daily rollups (incremental)")
+    rollup.add_argument("--rebuild", action="store_true", help="Drop the rollups and checkpoint and re-fold the whole ledger")
+    rollup.add_argument("--chunk-size", type=int, default=None)
+    rollup.add_argument("--settle-seconds", type=int, default=None)
+    rollup.set_defaults(handler=rollup_wallets_command)
+
+    args = parser.parse_args(argv)
+    db.init_schema()
+    args.handler(args)
+
+if __name__ == "__main__":
+    main()
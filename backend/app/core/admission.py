@@ -0,0 +1,166 @@
+import asyncio
+import math
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+from app.core import config
+from app.core.metrics import metrics
+
+class AdmissionController:
+    """
+    ADMISSION CONTROL (per worker, runs on the event loop):
+    - Concurrency: at most `max_in_flight` requests execute at once (keep it at or
+      below the DB pool size, so admitted requests never wait for a connection),
+      and at most `max_per_source` per source wallet (they serialize on its row lock anyway)
+    - Queue: up to `max_queue` requests wait in FIFO order, without holding a thread
+      or a DB connection
+    - Shedding: 503 when the queue is full or a request waited longer than
+      `queue_timeout`; 429 when one source wallet already has its share queued.
+      Both carry Retry-After derived from the observed service time.
+    """
+
+    def __init__(self, name: str, max_in_flight: int, max_per_source: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_per_source = max_per_source
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._in_flight = 0
+        self._per_source: Dict[int, int] = defaultdict(int)
+        self._queued_per_source: Dict[int, int] = defaultdict(int)
+        self._waiters: Deque[Tuple[Optional[int], asyncio.Future]] = deque()
+        # Exponentially weighted service time, seeds Retry-After
+        self._service_time = 0.05
+
+    def _can_run(self, source: Optional[int]) -> bool:
+        if self._in_flight >= self.max_in_flight:
+            return False
+        return source is None or self._per_source.get(source, 0) < self.max_per_source
+
+    def _start(self, source: Optional[int]):
+        self._in_flight += 1
+        if source is not None:
+            self._per_source[source] += 1
+
+    def _grant(self):
+        # FIFO, but a waiter blocked only by its own source limit does not block others
+        for entry in list(self._waiters):
+            if self._in_flight >= self.max_in_flight:
+                break
+            source, future = entry
+            if not future.done() and self._can_run(source):
+                self._waiters.remove(entry)
+                self._dequeued(source)
+                self._start(source)
+                future.set_result(True)
+
+    def _dequeued(self, source: Optional[int]):
+        if source is not None:
+            self._queued_per_source[source] -= 1
+            if not self._queued_per_source[source]:
+                del self._queued_per_source[source]
+
+    def _abandon(self, entry):
+        self._waiters.remove(entry)
+        self._dequeued(entry[0])
+        entry[1].cancel()
+
+    def retry_after(self) -> int:
+        backlog = len(self._waiters) + self._in_flight
+        return max(1, math.ceil(backlog * self._service_time / max(self.max_in_flight, 1)))
+
+    def _reject(self, status_code: int, reason: str):
+        metrics.inc(f"admission.{self.name}.rejected_{status_code}")
+        raise HTTPException(status_code=status_code, detail=reason, headers={"Retry-After": str(self.retry_after())})
+
+    async def acquire(self, source: Optional[int]) -> float:
+        """Waits for a slot; returns the time spent queued. Raises 429/503 instead of queueing without bound."""
+        if not self._waiters and self._can_run(source):
+            self._start(source)
+            metrics.inc(f"admission.{self.name}.admitted")
+            return 0.0
+
+        if len(self._waiters) >= self.max_queue:
+            self._reject(503, "Server busy, please retry")
+        if source is not None and self._queued_per_source.get(source, 0) >= self.max_per_source:
+            self._reject(429, "Too many concurrent transfers from this wallet")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (source, future)
+        self._waiters.append(entry)
+        if source is not None:
+            self._queued_per_source[source] += 1
+        # The queue may only hold waiters blocked by their own source limit: if this one
+        # can run now it is granted here instead of waiting for the next release
+        self._grant()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait({future}, timeout=self.queue_timeout)
+        except BaseException:
+            # The client went away while queued
+            if future.done():
+                self.release(source, 0.0)
+            else:
+                self._abandon(entry)
+            raise
+        if not future.done():
+            self._abandon(entry)
+        waited = time.perf_counter() - started
+        metrics.observe(f"admission.{self.name}.queue_seconds", waited)
+        if future.cancelled():
+            self._reject(503, "Server busy, please retry")
+        metrics.inc(f"admission.{self.name}.admitted")
+        return waited
+
+    def release(self, source: Optional[int], service_time: float):
+        self._in_flight -= 1
+        if source is not None:
+            self._per_source[source] -= 1
+            if not self._per_source[source]:
+                del self._per_source[source]
+        self._service_time = 0.9 * self._service_time + 0.1 * service_time
+        self._grant()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self._in_flight,
+            "queued": len(self._waiters),
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "busy_sources": len(self._per_source),
+            "service_time_ewma": round(self._service_time, 4),
+        }
+
+transfer_admission = AdmissionController(
+    "transfer",
+    max_in_flight=config.ADMISSION_MAX_IN_FLIGHT,
+    max_per_source=config.ADMISSION_MAX_PER_SOURCE,
+    max_queue=config.ADMISSION_MAX_QUEUE,
+    queue_timeout=config.ADMISSION_QUEUE_TIMEOUT,
+)
+
+async def admit_transfer(request: Request):
+    """
+    Yield dependency for POST /transfer/ and /transfer/multi: holds an admission
+    slot for the duration of the request. The JSON body is already parsed (and
+    cached) by FastAPI at this point, so reading the source wallet here is free.
+    Multi-leg transfers are keyed by the source of their first leg.
+    """
+    try:
+        body = await request.json()
+        if "legs" in body:
+            body = body["legs"][0]
+        source = int(body.get("from_wallet_id"))
+    except (ValueError, TypeError, AttributeError, KeyError, IndexError):
+        # Malformed bodies are rejected by validation; do not key them by source
+        source = None
+
+    await transfer_admission.acquire(source)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        transfer_admission.release(source, time.perf_counter() - started)
@@ -0,0 +1,221 @@
+import itertools
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core import config
+from app.core.metrics import metrics
+
+class LRUBackend:
+    """
+    In-process LRU store.
+    Every key carries a version; invalidation bumps it, and a reader may only
+    populate a key if its version did not move while it was reading from the DB.
+    This closes the "stale read-through after a concurrent commit" race.
+    Entries older than `ttl` seconds are misses: commits in other processes or
+    containers never reach this invalidation, so that is how stale they can get.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._values: OrderedDict = OrderedDict()
+        self._versions: OrderedDict = OrderedDict()
+        self._clock = itertools.count(1)
+        # Versions of evicted keys are folded into this floor (never goes back)
+        self._floor = 0
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._values:
+                return None
+            value, stored_at = self._values[key]
+            if self.ttl and time.monotonic() - stored_at > self.ttl:
+                return None
+            self._values.move_to_end(key)
+            return value
+
+    def version(self, key) -> int:
+        with self._lock:
+            return self._versions.get(key, self._floor)
+
+    def set_if_version(self, key, value, version: int) -> bool:
+        with self._lock:
+            if self._versions.get(key, self._floor) != version:
+                return False
+            self._values[key] = (value, time.monotonic())
+            self._values.move_to_end(key)
+            while len(self._values) > self.max_entries:
+                self._values.popitem(last=False)
+            return True
+
+    def invalidate(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+            self._versions[key] = next(self._clock)
+            self._versions.move_to_end(key)
+            while len(self._versions) > self.max_entries:
+                _, evicted = self._versions.popitem(last=False)
+                self._floor = max(self._floor, evicted)
+
+class SQLiteBackend:
+    """
+    Host-local shared store (e.g. a file on /dev/shm), so every worker process
+    on the machine sees the same entries and the same invalidations.
+    Same versioning and TTL contract as LRUBackend. Size: every `max_entries // 100`
+    populates a process trims the table back to `max_entries`, oldest first. A
+    trimmed key restarts at version 0, which can let a read that began before the
+    trim populate a stale value; the TTL bounds how long such an entry lives.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000, ttl: float = 0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._trim_every = max(1, max_entries // 100)
+        self._populates = itertools.count(1)
+        self._local = threading.local()
+        conn = self._conn()
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(cache)")]
+        if columns and "stored_at" not in columns:
+            # Written by an older release; it is only a cache
+            conn.execute("DROP TABLE cache")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, version INTEGER NOT NULL, stored_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_stored_at ON cache (stored_at)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def after_fork(self):
+        # SQLite connections must never be shared with the parent process
+        self._local = threading.local()
+
+    def get(self, key):
+        # Wall clock, not monotonic: entries are shared between processes
+        oldest = time.time() - self.ttl if self.ttl else 0
+        row = self._conn().execute(
+            "SELECT value FROM cache WHERE key = ? AND stored_at >= ?", (str(key), oldest)
+        ).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def version(self, key) -> int:
+        row = self._conn().execute("SELECT version FROM cache WHERE key = ?", (str(key),)).fetchone()
+        return row[0] if row else 0
+
+    def set_if_version(self, key, value, version: int) -> bool:
+        conn = self._conn()
+        payload = json.dumps(value)
+        now = time.time()
+        if version == 0:
+            # Absent, or still at version 0 with an expired value
+            cursor = conn.execute(
+                "INSERT INTO cache (key, value, version, stored_at) VALUES (?, ?, 0, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, stored_at = excluded.stored_at WHERE cache.version = 0",
+                (str(key), payload, now)
+            )
+        else:
+            cursor = conn.execute(
+                "UPDATE cache SET value = ?, stored_at = ? WHERE key = ? AND version = ?", (payload, now, str(key), version)
+            )
+        if next(self._populates) % self._trim_every == 0:
+            self.trim()
+        return cursor.rowcount == 1
+
+    def trim(self):
+        """Deletes the oldest entries beyond `max_entries`."""
+        self._conn().execute(
+            "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def invalidate(self, key):
+        self._conn().execute(
+            "INSERT INTO cache (key, value, version, stored_at) VALUES (?, NULL, 1, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = NULL, version = version + 1, stored_at = excluded.stored_at",
+            (str(key), time.time())
+        )
+
+class WalletCache:
+    """
+    WALLET READ CACHE:
+    Read-through cache of wallet snapshots (plain dicts, never ORM objects).
+    Entries are invalidated in the session `after_commit` hook for every wallet
+    whose balance/status changed in that DB transaction.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or LRUBackend(config.WALLET_CACHE_MAX_ENTRIES, config.WALLET_CACHE_TTL_SECONDS)
+
+    def after_fork(self):
+        if hasattr(self.backend, "after_fork"):
+            self.backend.after_fork()
+
+    def get_or_load(self, wallet_id: int, loader: Callable[[], Optional[dict]]) -> Optional[dict]:
+        cached = self.backend.get(wallet_id)
+        if cached is not None:
+            metrics.inc("wallet_cache.hits")
+            return cached
+
+        metrics.inc("wallet_cache.misses")
+        version = self.backend.version(wallet_id)
+        value = loader()
+        if value is not None:
+            self.backend.set_if_version(wallet_id, value, version)
+        return value
+
+    def invalidate(self, wallet_ids: Iterable[int]):
+        for wallet_id in wallet_ids:
+            self.backend.invalidate(wallet_id)
+            metrics.inc("wallet_cache.invalidations")
+
+def _build_backend():
+    if config.WALLET_CACHE_BACKEND == "sqlite":
+        return SQLiteBackend(config.WALLET_CACHE_PATH, config.WALLET_CACHE_MAX_ENTRIES, config.WALLET_CACHE_TTL_SECONDS)
+    return LRUBackend(config.WALLET_CACHE_MAX_ENTRIES, config.WALLET_CACHE_TTL_SECONDS)
+
+wallet_cache = WalletCache(_build_backend())
+
+# --- Commit-time invalidation -------------------------------------------------
+
+_DIRTY_KEY = "dirty_wallet_ids"
+
+def mark_wallets_dirty(db: Session, wallet_ids: Iterable[int]):
+    """
+    For balance changes made with bulk UPDATE statements, which bypass the
+    ORM unit of work. Invalidation still happens only once the DB commits.
+    """
+    db.info.setdefault(_DIRTY_KEY, set()).update(wallet_ids)
+
+@event.listens_for(Session, "after_flush")
+def _collect_dirty_wallets(session, flush_context):
+    from app.database.models import Wallet
+    changed = [
+        obj.id for obj in itertools.chain(session.dirty, session.deleted)
+        if isinstance(obj, Wallet) and obj.id is not None
+    ]
+    if changed:
+        mark_wallets_dirty(session, changed)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_wallets(session):
+    dirty = session.info.pop(_DIRTY_KEY, None)
+    if dirty:
+        wallet_cache.invalidate(dirty)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_dirty_wallets(session):
+    session.info.pop(_DIRTY_KEY, None)
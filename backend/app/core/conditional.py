@@ -0,0 +1,52 @@
+import hashlib
+from fastapi import Request, Response
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+
+def make_etag(*version_parts) -> str:
+    """Weak ETag from cheap version markers (never from the serialized body)."""
+    digest = hashlib.blake2b(repr(version_parts).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison (RFC 9110 13.1.2): ignore the W/ prefix on both sides
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """
+    GZip for large one-shot payloads only. Streamed responses (SSE, NDJSON
+    result streams, anything sent in several body messages) pass through
+    uncompressed: the streaming compressor never flushes, so it would hold
+    events and result lines back until enough output accumulates.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and "gzip" in Headers(scope=scope).get("accept-encoding", ""):
+            responder = _OneShotGZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+            await responder(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+STREAMING_MEDIA_TYPES = ("text/event-stream", "application/x-ndjson")
+
+class _OneShotGZipResponder(GZipResponder):
+    async def send_with_gzip(self, message):
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            await super().send_with_gzip(message)
+            # Reuse Starlette's pass-through path for bodies that must not be compressed
+            if content_type.startswith(STREAMING_MEDIA_TYPES):
+                self.content_encoding_set = True
+            return
+        if message["type"] == "http.response.body" and not self.started and message.get("more_body", False):
+            self.content_encoding_set = True
+        await super().send_with_gzip(message)
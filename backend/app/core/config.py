@@ -1 +1,105 @@
-# Config placeholder
+import os
+
+# Runtime tuning knobs. LOADED FROM ENVIRONMENT so they can be changed per deployment.
+
+# Batch progress aggregation: counters are accumulated in memory by the executor
+# and flushed to the `batches` row every N rows or every T seconds (whichever first).
+BATCH_PROGRESS_FLUSH_ROWS = int(os.getenv("BATCH_PROGRESS_FLUSH_ROWS", "50"))
+BATCH_PROGRESS_FLUSH_SECONDS = float(os.getenv("BATCH_PROGRESS_FLUSH_SECONDS", "1.0"))
+# "increment" -> atomic `SET x = x + :n` deltas, "derived" -> recount from batch_rows
+BATCH_PROGRESS_MODE = os.getenv("BATCH_PROGRESS_MODE", "increment")
+
+# Batch scheduler: worker budget for concurrently running batches (one per source wallet).
+# Keep below the DB pool size; each running batch holds one connection.
+BATCH_SCHEDULER_WORKERS = int(os.getenv("BATCH_SCHEDULER_WORKERS", "4"))
+# Every N seconds (and at startup) each worker resumes PROCESSING batches nobody is running,
+# e.g. left behind by a recycled or crashed worker. 0 disables the sweep
+BATCH_RECOVERY_INTERVAL = float(os.getenv("BATCH_RECOVERY_INTERVAL", "60"))
+
+# Parallel recipient fan-out inside one batch. 0/1 = sequential row loop.
+# Each fan-out worker holds its own DB connection while crediting a recipient.
+BATCH_FANOUT_WORKERS = int(os.getenv("BATCH_FANOUT_WORKERS", "0"))
+BATCH_FANOUT_CHUNK_SIZE = int(os.getenv("BATCH_FANOUT_CHUNK_SIZE", "200"))
+
+# Wallet read cache: "memory" (per-process LRU) or "sqlite" (host-local file shared by all workers)
+WALLET_CACHE_BACKEND = os.getenv("WALLET_CACHE_BACKEND", "memory")
+WALLET_CACHE_MAX_ENTRIES = int(os.getenv("WALLET_CACHE_MAX_ENTRIES", "100000"))
+# Invalidation only reaches workers on this host; bounds how stale a balance changed
+# from another container can be served (0 = no expiry)
+WALLET_CACHE_TTL_SECONDS = float(os.getenv("WALLET_CACHE_TTL_SECONDS", "5"))
+WALLET_CACHE_PATH = os.getenv("WALLET_CACHE_PATH", "/dev/shm/gwallet-wallet-cache.sqlite")
+
+# Bulk user provisioning: rows per INSERT/commit, and hashing processes (default: all cores)
+PROVISIONING_CHUNK_SIZE = int(os.getenv("PROVISIONING_CHUNK_SIZE", "1000"))
+PROVISIONING_PROCESSES = int(os.getenv("PROVISIONING_PROCESSES", "0")) or os.cpu_count()
+
+# Streaming bulk transfers (POST /transfer/bulk): items executed per pipelined chunk
+BULK_TRANSFER_CHUNK_SIZE = int(os.getenv("BULK_TRANSFER_CHUNK_SIZE", "100"))
+
+# Transactional outbox: background dispatcher and its sink ("file", "queue", "webhook" or "none").
+# Off unless enabled: delivery needs a deliberately chosen sink, not a local file on every worker
+OUTBOX_DISPATCHER_ENABLED = os.getenv("OUTBOX_DISPATCHER_ENABLED", "0") == "1"
+# Events are only written when something delivers them: the in-process dispatcher above, or
+# OUTBOX_WRITE_EVENTS=1 for a separate `python -m app.cli dispatch-outbox` process
+OUTBOX_WRITE_EVENTS = os.getenv("OUTBOX_WRITE_EVENTS", "1" if OUTBOX_DISPATCHER_ENABLED else "0") == "1"
+# Dispatched events are deleted after this many seconds (0 keeps them), every OUTBOX_PURGE_INTERVAL
+OUTBOX_RETENTION_SECONDS = int(os.getenv("OUTBOX_RETENTION_SECONDS", "86400"))
+OUTBOX_PURGE_INTERVAL = float(os.getenv("OUTBOX_PURGE_INTERVAL", "60"))
+OUTBOX_SINK = os.getenv("OUTBOX_SINK", "file")
+OUTBOX_FILE_PATH = os.getenv("OUTBOX_FILE_PATH", "outbox-events.ndjson")
+OUTBOX_WEBHOOK_URL = os.getenv("OUTBOX_WEBHOOK_URL", "")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))
+
+# Multi-worker serving (gunicorn.conf.py). DB_POOL_SIZE/DB_MAX_OVERFLOW are derived
+# per worker from DB_CONNECTION_BUDGET by the launcher; unset means SQLAlchemy defaults.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "0")) or None
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "-1"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Directory where every worker publishes its metrics snapshot (GET /metrics aggregates it)
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+METRICS_SHARE_INTERVAL = float(os.getenv("METRICS_SHARE_INTERVAL", "5"))
+
+# Admission control for POST /transfer/ (per worker). Keep ADMISSION_MAX_IN_FLIGHT
+# at or below the DB pool size so admitted requests never queue on pool checkout.
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "0")) or (DB_POOL_SIZE or 10)
+ADMISSION_MAX_PER_SOURCE = int(os.getenv("ADMISSION_MAX_PER_SOURCE", "2"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "200"))
+# Queue-time budget (seconds) before a waiting request is shed with 503
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2.0"))
+
+# In-process per-wallet lock stripes taken before a transfer checks out a DB connection
+WALLET_LOCK_STRIPES = int(os.getenv("WALLET_LOCK_STRIPES", "1024"))
+
+# Transfer transaction runner: lock_timeout per statement (Postgres) and retries of
+# transient failures (deadlock, serialization failure, lock/statement timeout)
+DB_LOCK_TIMEOUT_MS = int(os.getenv("DB_LOCK_TIMEOUT_MS", "2000"))
+TRANSFER_RETRY_ATTEMPTS = int(os.getenv("TRANSFER_RETRY_ATTEMPTS", "4"))
+TRANSFER_RETRY_BASE_DELAY = float(os.getenv("TRANSFER_RETRY_BASE_DELAY", "0.02"))
+TRANSFER_RETRY_MAX_DELAY = float(os.getenv("TRANSFER_RETRY_MAX_DELAY", "0.5"))
+
+# Upper bound on legs in one POST /transfer/multi (all wallets are locked together)
+TRANSFER_MAX_LEGS = int(os.getenv("TRANSFER_MAX_LEGS", "50"))
+
+# Ledger reconciliation (python -m app.cli reconcile)
+RECONCILE_CHUNK_SIZE = int(os.getenv("RECONCILE_CHUNK_SIZE", "200000"))
+# Only transactions older than this are folded into the checkpoint (in-flight commits may still fill id gaps)
+RECONCILE_SETTLE_SECONDS = int(os.getenv("RECONCILE_SETTLE_SECONDS", "60"))
+# Allowed difference in minor units; money is stored as exact integers, so 0 by default
+RECONCILE_TOLERANCE = int(os.getenv("RECONCILE_TOLERANCE", "0"))
+
+# Per-wallet daily rollups (statements): a background job in every worker, of which one per round
+# (a Postgres advisory try-lock) advances the checkpoint. Set to 0 to advance it from cron instead
+# (python -m app.cli rollup-wallets)
+ROLLUP_JOB_ENABLED = os.getenv("ROLLUP_JOB_ENABLED", "1") == "1"
+ROLLUP_INTERVAL_SECONDS = float(os.getenv("ROLLUP_INTERVAL_SECONDS", "30"))
+# Transaction ids folded per DB transaction
+ROLLUP_CHUNK_SIZE = int(os.getenv("ROLLUP_CHUNK_SIZE", "50000"))
+# Same reasoning as RECONCILE_SETTLE_SECONDS; newer rows are aggregated live by the statement endpoints
+ROLLUP_SETTLE_SECONDS = int(os.getenv("ROLLUP_SETTLE_SECONDS", "60"))
+
+# Embedded SQLite profile (DATABASE_URL=sqlite:///path.db): local benchmarks and app.harness.
+# How long a connection waits for the write lock before "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# NORMAL is durable against application crashes in WAL mode; FULL also survives power loss
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Set, Tuple
+
+class ProgressBroker:
+    """
+    In-process pub/sub for batch progress.
+    Executors publish from worker threads; SSE subscribers consume on the event loop.
+    Events are cumulative snapshots, so a slow subscriber may safely drop old ones.
+    """
+
+    def __init__(self, max_queue: int = 100):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers: Dict[int, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = defaultdict(set)
+        self._latest: Dict[int, dict] = {}
+
+    def subscribe(self, batch_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers[batch_id].add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, batch_id: int, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(batch_id, set())
+            for entry in [s for s in subscribers if s[1] is queue]:
+                subscribers.discard(entry)
+            if not subscribers:
+                self._subscribers.pop(batch_id, None)
+
+    def latest(self, batch_id: int) -> Optional[dict]:
+        with self._lock:
+            return self._latest.get(batch_id)
+
+    def publish(self, batch_id: int, event: dict):
+        with self._lock:
+            if event.get("event") == "finished":
+                self._latest.pop(batch_id, None)
+            else:
+                self._latest[batch_id] = event
+            subscribers = list(self._subscribers.get(batch_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                # Subscriber's loop already closed
+                pass
+
+def _offer(queue: asyncio.Queue, event: dict):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+progress_broker = ProgressBroker()
+
+class BatchProgressReporter:
+    """
+    Turns flushed counter deltas into progress events
+    (processed index, counts, throughput in rows/s, ETA).
+    """
+
+    def __init__(self, batch_id: int, total_rows: int, start_index: int, success_count: int, failure_count: int, broker: ProgressBroker = progress_broker):
+        self.batch_id = batch_id
+        self.total_rows = total_rows
+        self.start_index = start_index
+        self.success_count = success_count
+        self.failure_count = failure_count
+        self.last_index = start_index - 1
+        self.broker = broker
+        self._started = time.monotonic()
+
+    def snapshot(self, event: str = "progress", **extra) -> dict:
+        elapsed = time.monotonic() - self._started
+        processed_this_run = self.last_index - self.start_index + 1
+        throughput = processed_this_run / elapsed if elapsed > 0 else 0.0
+        remaining = self.total_rows - (self.last_index + 1)
+        eta = remaining / throughput if throughput > 0 else None
+        data = {
+            "event": event,
+            "batch_id": self.batch_id,
+            "last_processed_index": self.last_index,
+            "total_rows": self.total_rows,
+            "success_count": self.success_count,
+            "failure_count": self.failure_count,
+            "rows_per_second": round(throughput, 2),
+            "eta_seconds": round(eta, 2) if eta is not None else None,
+        }
+        data.update(extra)
+        return data
+
+    def started(self):
+        self.broker.publish(self.batch_id, self.snapshot("started"))
+
+    def on_flush(self, items: int, success: int, failure: int, amount: int, last_index: int):
+        self.success_count += success
+        self.failure_count += failure
+        self.last_index = last_index
+        self.broker.publish(self.batch_id, self.snapshot())
+
+    def finished(self, status: str):
+        self.broker.publish(self.batch_id, self.snapshot("finished", status=status))
+
+def format_sse(event: dict) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
@@ -0,0 +1,140 @@
+import glob
+import json
+import os
+import threading
+from collections import defaultdict
+from typing import Callable, Dict
+
+class Metrics:
+    """
+    Minimal in-process metrics registry (counters, gauges, timings).
+    Exposed as JSON on GET /metrics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._timings: Dict[str, dict] = {}
+        self._collectors: Dict[str, Callable[[], dict]] = {}
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            timing = self._timings.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+            timing["count"] += 1
+            timing["sum"] += value
+            timing["max"] = max(timing["max"], value)
+
+    def register_collector(self, name: str, collector: Callable[[], dict]):
+        """Collectors are called at snapshot time, e.g. for queue depths."""
+        self._collectors[name] = collector
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            data = {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings": {name: dict(timing) for name, timing in self._timings.items()},
+            }
+        for name, collector in list(self._collectors.items()):
+            data[name] = collector()
+        return data
+
+    # Cross-worker sharing -------------------------------------------------------
+
+    def write_snapshot(self, directory: str):
+        """Atomically publishes this process' snapshot as <directory>/worker-<pid>.json."""
+        path = os.path.join(directory, f"worker-{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f, default=str)
+        os.replace(tmp, path)
+
+    def start_sharing(self, directory: str, interval: float):
+        """Background publisher, one per worker process (started after fork)."""
+        os.makedirs(directory, exist_ok=True)
+        stop = threading.Event()
+
+        def publish():
+            while not stop.wait(interval):
+                try:
+                    self.write_snapshot(directory)
+                except OSError:
+                    pass
+
+        threading.Thread(target=publish, name="metrics-publisher", daemon=True).start()
+        return stop
+
+def _merge_totals(into: dict, data: dict):
+    """Adds a snapshot's counters and timings to `into` (counters must be a defaultdict(float))."""
+    for key, value in data.get("counters", {}).items():
+        into["counters"][key] += value
+    for key, timing in data.get("timings", {}).items():
+        merged = into["timings"].setdefault(key, {"count": 0, "sum": 0.0, "max": 0.0})
+        merged["count"] += timing["count"]
+        merged["sum"] += timing["sum"]
+        merged["max"] = max(merged["max"], timing["max"])
+
+def aggregate_snapshots(directory: str) -> dict:
+    """
+    MULTI-WORKER VIEW:
+    - counters and timings are summed across every worker file, including
+      workers that already exited (recycled), so totals never go backwards
+    - gauges take the max over live workers
+    - collector output (queues, connections) is reported per live worker
+    """
+    result = {"counters": defaultdict(float), "gauges": {}, "timings": {}, "workers": {}}
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        name = os.path.basename(path)[:-len(".json")]
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        _merge_totals(result, data)
+        if name.startswith("worker-"):
+            for key, value in data.get("gauges", {}).items():
+                result["gauges"][key] = max(result["gauges"].get(key, value), value)
+            result["workers"][name[len("worker-"):]] = {
+                key: value for key, value in data.items() if key not in ("counters", "gauges", "timings")
+            }
+    result["counters"] = dict(result["counters"])
+    return result
+
+EXITED_SNAPSHOT = "exited.json"
+
+def retire_worker_snapshot(directory: str, pid: int):
+    """
+    Called by the master when a worker exits: its counters and timings are folded
+    into one exited.json (so totals survive recycling without a file per worker),
+    then its live file is removed. Only the master writes exited.json.
+    """
+    path = os.path.join(directory, f"worker-{pid}.json")
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return
+    totals_path = os.path.join(directory, EXITED_SNAPSHOT)
+    totals = {"counters": defaultdict(float), "timings": {}}
+    try:
+        with open(totals_path) as f:
+            _merge_totals(totals, json.load(f))
+    except (OSError, ValueError):
+        pass
+    _merge_totals(totals, data)
+    tmp = f"{totals_path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"counters": dict(totals["counters"]), "timings": totals["timings"]}, f)
+    os.replace(tmp, totals_path)
+    os.remove(path)
+
+metrics = Metrics()
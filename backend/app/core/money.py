@@ -0,0 +1,61 @@
+from decimal import Decimal, InvalidOperation
+from typing import Annotated
+
+from pydantic import BeforeValidator, PlainSerializer, WithJsonSchema
+
+# MONEY REPRESENTATION:
+# - Stored, compared and summed as integer minor units (cents) in BIGINT columns
+# - The API keeps its decimal JSON format (10.5 in, 10.5 out); conversion happens
+#   only at the edges: request parsing, CSV parsing, responses and published events
+MINOR_DIGITS = 2
+SCALE = 10 ** MINOR_DIGITS
+MAX_MINOR = 2 ** 63 - 1
+
+def to_minor(value) -> int:
+    """
+    Exact decimal amount -> integer minor units. Accepts str (CSV cells, JSON
+    strings), Decimal, int and JSON floats (taken by their shortest repr, so
+    10.1 is 1010, never 1009). Rejects sub-cent precision instead of rounding.
+    """
+    if isinstance(value, bool):
+        raise ValueError("Invalid amount")
+    if isinstance(value, int):
+        minor = value * SCALE
+    else:
+        try:
+            amount = Decimal(repr(value) if isinstance(value, float) else str(value).strip())
+        except InvalidOperation:
+            raise ValueError(f"Invalid amount: {value!r}")
+        if not amount.is_finite():
+            raise ValueError(f"Invalid amount: {value!r}")
+        scaled = amount.scaleb(MINOR_DIGITS)
+        if scaled != scaled.to_integral_value():
+            raise ValueError(f"Amount {value} has more than {MINOR_DIGITS} decimal places")
+        minor = int(scaled)
+    if abs(minor) > MAX_MINOR:
+        raise ValueError("Amount out of range")
+    return minor
+
+def to_major(minor: int) -> float:
+    """
+    Integer minor units -> JSON number. IEEE division is correctly rounded, so
+    the shortest repr of the result is the exact decimal (1050 -> 10.5) for any
+    |minor| < 2**53.
+    """
+    return minor / SCALE
+
+def major_fields(row: dict, *fields: str) -> dict:
+    """FAST PATHS (plain dicts that skip the response schema): converts `fields` in place."""
+    for field in fields:
+        if row.get(field) is not None:
+            row[field] = to_major(row[field])
+    return row
+
+def format_amount(minor: int) -> str:
+    """Minor units -> fixed-point text for messages ("10.50")."""
+    return str(Decimal(minor).scaleb(-MINOR_DIGITS))
+
+# Request fields: decimal in, minor units on the model
+MoneyIn = Annotated[int, BeforeValidator(to_minor), WithJsonSchema({"type": "number"})]
+# Response fields: minor units on the model, decimal JSON out
+Money = Annotated[int, PlainSerializer(to_major, return_type=float)]
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from app.core.metrics import metrics
+from app.core.money import to_major
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "wallet_events"
+_PENDING_KEY = "pending_wallet_events"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more; balance events are split below this
+NOTIFY_MAX_BYTES = 7900
+
+# --- Emission (inside the writing DB transaction) ------------------------------
+
+def emit_transaction_event(db: Session, transaction_id: Optional[int], from_wallet_id: Optional[int], to_wallet_id: int,
+                           amount: int, batch_id: Optional[int] = None, balances: Optional[Dict[int, int]] = None):
+    """
+    Queues a compact ledger event on the session. Nothing leaves the process
+    unless the DB transaction commits: on Postgres it is sent with NOTIFY inside
+    the transaction (delivered atomically on commit); elsewhere it is published
+    to the local hub from the after_commit hook. Amounts are minor units and
+    go out in the API's decimal format.
+    """
+    db.info.setdefault(_PENDING_KEY, []).append({
+        "type": "transaction",
+        "transaction_id": transaction_id,
+        "from_wallet_id": from_wallet_id,
+        "to_wallet_id": to_wallet_id,
+        "amount": to_major(amount),
+        "batch_id": batch_id,
+        "balances": {str(k): to_major(v) for k, v in (balances or {}).items()},
+    })
+
+def emit_balance_event(db: Session, balances: Dict[int, int]):
+    """
+    Queues balance pushes for any number of wallets. A bulk chunk can touch
+    thousands of wallets, so the balances are split over as many events as
+    needed to keep every serialized payload under NOTIFY_MAX_BYTES.
+    """
+    pending = db.info.setdefault(_PENDING_KEY, [])
+    empty_size = len(json.dumps({"type": "balance", "balances": {}}))
+    part, size = {}, empty_size
+    for wallet_id, balance in balances.items():
+        key, value = str(wallet_id), to_major(balance)
+        # "key": value, (the separator is counted for every entry, so this is an upper bound)
+        entry_size = len(json.dumps(key)) + len(json.dumps(value)) + 4
+        if part and size + entry_size > NOTIFY_MAX_BYTES:
+            pending.append({"type": "balance", "balances": part})
+            part, size = {}, empty_size
+        part[key] = value
+        size += entry_size
+    if part:
+        pending.append({"type": "balance", "balances": part})
+
+def _is_postgres(session: Session) -> bool:
+    bind = session.get_bind()
+    return bind is not None and bind.dialect.name == "postgresql"
+
+@event.listens_for(Session, "before_commit")
+def _notify_pending_events(session):
+    pending = session.info.get(_PENDING_KEY)
+    if not pending or not _is_postgres(session):
+        return
+    for payload in pending:
+        session.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": json.dumps(payload)})
+    # Delivered by Postgres on commit; the hub's LISTEN picks them up
+    session.info.pop(_PENDING_KEY, None)
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending_events(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        for payload in pending:
+            hub.dispatch(payload)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_events(session):
+    session.info.pop(_PENDING_KEY, None)
+
+# --- Fan-out hub (one per worker process) ---------------------------------------
+
+class NotificationHub:
+    """
+    Per-worker fan-out: one LISTEN connection (Postgres) or direct local
+    publication, dispatched to WebSocket subscribers keyed by wallet id.
+    A subscriber only ever sees the balance of its own wallets.
+    """
+
+    def __init__(self, max_queue: int = 256):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers: Dict[int, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = defaultdict(set)
+        self._listener: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def subscribe(self, wallet_ids: Iterable[int]) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.max_queue)
+        entry = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            for wallet_id in wallet_ids:
+                self._subscribers[wallet_id].add(entry)
+        metrics.inc("notifications.subscriptions")
+        return queue
+
+    def unsubscribe(self, wallet_ids: Iterable[int], queue: asyncio.Queue):
+        with self._lock:
+            for wallet_id in wallet_ids:
+                subscribers = self._subscribers.get(wallet_id, set())
+                for entry in [s for s in subscribers if s[1] is queue]:
+                    subscribers.discard(entry)
+                if not subscribers:
+                    self._subscribers.pop(wallet_id, None)
+
+    def dispatch(self, payload: dict):
+        balances = payload.get("balances") or {}
+        wallet_ids = {int(w) for w in balances}
+        if payload["type"] == "transaction":
+            wallet_ids.update(w for w in (payload["from_wallet_id"], payload["to_wallet_id"]) if w is not None)
+
+        with self._lock:
+            targets = [(w, list(self._subscribers.get(w, ()))) for w in wallet_ids]
+
+        for wallet_id, subscribers in targets:
+            if not subscribers:
+                continue
+            for message in self._messages_for(wallet_id, payload, balances):
+                for loop, queue in subscribers:
+                    try:
+                        loop.call_soon_threadsafe(_offer, queue, message)
+                    except RuntimeError:
+                        pass
+                metrics.inc("notifications.delivered", len(subscribers))
+
+    @staticmethod
+    def _messages_for(wallet_id: int, payload: dict, balances: dict):
+        if payload["type"] == "transaction" and wallet_id in (payload["from_wallet_id"], payload["to_wallet_id"]):
+            yield {key: payload[key] for key in ("type", "transaction_id", "from_wallet_id", "to_wallet_id", "amount", "batch_id")}
+        if str(wallet_id) in balances:
+            yield {"type": "balance", "wallet_id": wallet_id, "balance": balances[str(wallet_id)]}
+
+    def stats(self) -> dict:
+        with self._lock:
+            queues = {id(queue) for subscribers in self._subscribers.values() for _, queue in subscribers}
+            return {
+                "connections": len(queues),
+                "watched_wallets": len(self._subscribers),
+                "listening": self._listener is not None,
+            }
+
+    # LISTEN loop --------------------------------------------------------------
+
+    def start(self, engine):
+        if engine.dialect.name != "postgresql" or self._listener:
+            return
+        self._stop.clear()
+        self._listener = threading.Thread(target=self._listen, args=(engine,), name="wallet-events-listener", daemon=True)
+        self._listener.start()
+
+    def stop(self):
+        self._stop.set()
+        self._listener = None
+
+    def _listen(self, engine):
+        import psycopg2
+        dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        backoff = 1
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(dsn)
+                conn.set_session(autocommit=True)
+                conn.cursor().execute(f"LISTEN {CHANNEL}")
+                backoff = 1
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self.dispatch(json.loads(notify.payload))
+            except Exception:
+                logger.exception("wallet event listener failed, reconnecting in %ss", backoff)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+def _offer(queue: asyncio.Queue, message: dict):
+    if queue.full():
+        # Slow consumer: drop the oldest message rather than block the hub
+        queue.get_nowait()
+        metrics.inc("notifications.dropped")
+    queue.put_nowait(message)
+
+hub = NotificationHub()
@@ -0,0 +1,63 @@
+import threading
+from datetime import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from app.core import config
+from app.core.money import to_major
+from app.database.models import OutboxEvent
+
+_WRITTEN_KEY = "outbox_written"
+
+# Set after a commit that wrote outbox rows, so the dispatcher does not wait a full poll interval
+outbox_wakeup = threading.Event()
+
+def enqueue(db: Session, event_type: str, aggregate_type: str, aggregate_id: Optional[int], payload: dict):
+    """
+    TRANSACTIONAL OUTBOX:
+    Adds the event to the caller's unit of work. It becomes visible to the
+    dispatcher exactly when (and only if) the business change commits;
+    no I/O happens while wallet row locks are held. A no-op unless
+    OUTBOX_WRITE_EVENTS (nothing would ever deliver or delete the rows).
+    """
+    if not config.OUTBOX_WRITE_EVENTS:
+        return
+    db.add(OutboxEvent(event_type=event_type, aggregate_type=aggregate_type, aggregate_id=aggregate_id, payload=payload))
+    db.info[_WRITTEN_KEY] = True
+
+def enqueue_many(db: Session, event_type: str, aggregate_type: str, events: Iterable[tuple]):
+    """Multi-row variant for set-based writers: `events` are (aggregate_id, payload) pairs."""
+    if not config.OUTBOX_WRITE_EVENTS:
+        return
+    now = datetime.utcnow()
+    rows = [
+        {"event_type": event_type, "aggregate_type": aggregate_type, "aggregate_id": aggregate_id,
+         "payload": payload, "created_at": now, "attempts": 0}
+        for aggregate_id, payload in events
+    ]
+    if rows:
+        db.execute(insert(OutboxEvent), rows)
+        db.info[_WRITTEN_KEY] = True
+
+def transaction_payload(txn) -> dict:
+    """Ledger entry -> event payload (plain JSON types only, amounts in the API's decimal format)."""
+    return {
+        "transaction_id": txn.id,
+        "from_wallet_id": txn.from_wallet_id,
+        "to_wallet_id": txn.to_wallet_id,
+        "amount": to_major(txn.amount),
+        "idempotency_key": txn.idempotency_key,
+        "batch_id": txn.batch_id,
+        "timestamp": txn.timestamp.isoformat() if txn.timestamp else None,
+    }
+
+@event.listens_for(Session, "after_commit")
+def _wake_dispatcher(session):
+    if session.info.pop(_WRITTEN_KEY, None):
+        outbox_wakeup.set()
+
+@event.listens_for(Session, "after_rollback")
+def _discard_written_flag(session):
+    session.info.pop(_WRITTEN_KEY, None)
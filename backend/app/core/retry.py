@@ -0,0 +1,110 @@
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, TypeVar
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from app.core import config
+from app.core.metrics import metrics
+
+T = TypeVar("T")
+
+# Postgres SQLSTATEs that mean "try again", never "your request is wrong"
+TRANSIENT_PGCODES = {
+    "40P01": "deadlock_detected",
+    "40001": "serialization_failure",
+    "55P03": "lock_not_available",  # lock_timeout expired
+    "57014": "query_canceled",      # statement_timeout expired
+}
+
+def classify(exc: BaseException) -> Optional[str]:
+    """Name of the transient failure class, or None for permanent errors."""
+    if not isinstance(exc, DBAPIError):
+        return None
+    code = getattr(exc.orig, "pgcode", None)
+    if code in TRANSIENT_PGCODES:
+        return TRANSIENT_PGCODES[code]
+    # SQLite's equivalent of a lock timeout (busy_timeout expired)
+    if "database is locked" in str(exc.orig):
+        return "database_locked"
+    return None
+
+class ContentionTracker:
+    """
+    Lock-wait and retry statistics per wallet, bounded to `max_wallets` entries
+    (the least contended entries are evicted) so hot wallets stay visible on /metrics.
+    """
+
+    def __init__(self, max_wallets: int = 1000):
+        self.max_wallets = max_wallets
+        self._lock = threading.Lock()
+        self._wallets: Dict[int, dict] = {}
+
+    def _entry(self, wallet_id: int) -> dict:
+        entry = self._wallets.get(wallet_id)
+        if entry is None:
+            if len(self._wallets) >= self.max_wallets:
+                coldest = min(self._wallets, key=lambda w: self._wallets[w]["wait_seconds"])
+                del self._wallets[coldest]
+            entry = self._wallets[wallet_id] = {"lock_waits": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0, "retries": 0}
+        return entry
+
+    def record_wait(self, wallet_ids: Iterable[int], seconds: float):
+        with self._lock:
+            for wallet_id in set(wallet_ids):
+                entry = self._entry(wallet_id)
+                entry["lock_waits"] += 1
+                entry["wait_seconds"] += seconds
+                entry["max_wait_seconds"] = max(entry["max_wait_seconds"], seconds)
+
+    def record_retry(self, wallet_ids: Iterable[int]):
+        with self._lock:
+            for wallet_id in set(wallet_ids):
+                self._entry(wallet_id)["retries"] += 1
+
+    def top(self, n: int = 20) -> dict:
+        with self._lock:
+            hottest = sorted(self._wallets.items(), key=lambda item: item[1]["wait_seconds"], reverse=True)[:n]
+            return {str(wallet_id): dict(entry) for wallet_id, entry in hottest}
+
+contention = ContentionTracker()
+
+def set_lock_timeout(db: Session, milliseconds: int):
+    """Bounds every lock wait of the current DB transaction (Postgres only; SET LOCAL ends with it)."""
+    if milliseconds and db.get_bind().dialect.name == "postgresql":
+        db.execute(text(f"SET LOCAL lock_timeout = {int(milliseconds)}"))
+
+def run_with_retry(db: Session, work: Callable[[], T], wallet_ids: Iterable[int] = (),
+                   attempts: int = None, lock_timeout_ms: int = None) -> T:
+    """
+    TRANSACTION RUNNER:
+    - Each attempt is one DB transaction, started with SET LOCAL lock_timeout
+    - Transient failures (deadlock, serialization, lock/statement timeout) are
+      rolled back and retried with capped, fully jittered exponential backoff;
+      safe because every transfer carries an idempotency key
+    - Permanent failures propagate unchanged; exhausted retries become 503 + Retry-After
+    """
+    attempts = attempts or config.TRANSFER_RETRY_ATTEMPTS
+    lock_timeout_ms = config.DB_LOCK_TIMEOUT_MS if lock_timeout_ms is None else lock_timeout_ms
+    wallet_ids = list(wallet_ids)
+
+    for attempt in range(attempts):
+        try:
+            set_lock_timeout(db, lock_timeout_ms)
+            return work()
+        except DBAPIError as e:
+            failure = classify(e)
+            db.rollback()
+            if failure is None:
+                raise
+            metrics.inc(f"db_retry.{failure}")
+            if attempt + 1 == attempts:
+                metrics.inc("db_retry.exhausted")
+                raise HTTPException(status_code=503, detail="Transaction contention, please retry", headers={"Retry-After": "1"})
+            contention.record_retry(wallet_ids)
+            ceiling = min(config.TRANSFER_RETRY_MAX_DELAY, config.TRANSFER_RETRY_BASE_DELAY * (2 ** attempt))
+            time.sleep(random.uniform(0, ceiling))
@@ -1,6 +1,6 @@
 import os
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import jwt
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
@@ -39,6 +39,17 @@ def get_pin_hash(pin: str) -> str:
         raise ValueError("PIN must be exactly 4 digits")
     return pwd_context.hash(pin)
 
+def hash_credentials(record: Tuple[str, Optional[str]]) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """
+    (password, pin) -> (password_hash, pin_hash, error).
+    Top-level so it can run in a process pool (PBKDF2 is CPU bound and holds the GIL).
+    """
+    password, pin = record
+    try:
+        return get_password_hash(password), get_pin_hash(pin) if pin else None, None
+    except ValueError as e:
+        return None, None, str(e)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -55,13 +66,19 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
-    except jwt.JWTError:
+    token_data = decode_access_token(token)
+    if token_data is None:
         raise credentials_exception
     # In a real app, you'd fetch the user from DB here to ensure they still exist
     return token_data
+
+def decode_access_token(token: str) -> Optional[TokenData]:
+    """Validates signature and expiry; None for any invalid token. Shared by HTTP and WebSocket auth."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.JWTError:
+        return None
+    username: str = payload.get("sub")
+    if username is None:
+        return None
+    return TokenData(username=username)
@@ -1,8 +1,15 @@
+from sqlalchemy import select, func, update, insert, tuple_
 from sqlalchemy.orm import Session
-from app.database.models import Batch, BatchStatus, Transaction, BatchRow, BatchRowStatus
+from app.core import config
+from app.core.cache import mark_wallets_dirty
+from app.core.notifications import emit_balance_event
+from app.core import outbox
+from app.core.money import major_fields
+from app.database.models import Batch, BatchStatus, Transaction, BatchRow, BatchRowStatus, Wallet, WalletStatus
 from app.schemas.batch import BatchCreate
 from datetime import datetime
-from typing import Optional, List
+from typing import Callable, Iterable, Optional, List
+import time
 
 def create_batch(db: Session, batch: BatchCreate, user_id: int):
     # Check batch-level idempotency
@@ -18,6 +25,10 @@ def create_batch(db: Session, batch: BatchCreate, user_id: int):
         status=BatchStatus.PENDING
     )
     db.add(db_batch)
+    db.flush()
+    outbox.enqueue(db, "batch.created", "batch", db_batch.id, {
+        "batch_id": db_batch.id, "user_id": user_id, "source_wallet_id": batch.source_wallet_id, "status": BatchStatus.PENDING.value
+    })
     db.commit()
     db.refresh(db_batch)
     return db_batch
@@ -31,30 +42,185 @@ def get_batch(db: Session, batch_id: int):
 def get_batches_by_user(db: Session, user_id: int):
     return db.query(Batch).filter(Batch.user_id == user_id).order_by(Batch.timestamp.desc()).all()
 
-def update_batch_progress(db: Session, batch_id: int, status: BatchStatus = None, success: bool = True, amount: float = 0.0, is_item: bool = False, last_index: int = None):
-    db_batch = get_batch(db, batch_id)
-    if not db_batch:
-        return None
-    
+BATCH_COLUMNS = (
+    Batch.source_wallet_id, Batch.idempotency_key, Batch.id, Batch.user_id, Batch.status,
+    Batch.total_amount, Batch.item_count, Batch.success_count, Batch.failure_count,
+    Batch.last_processed_index, Batch.reserved_amount, Batch.content_digest, Batch.timestamp
+)
+BATCH_ROW_COLUMNS = (
+    BatchRow.id, BatchRow.batch_id, BatchRow.row_index, BatchRow.recipient_id, BatchRow.amount,
+    BatchRow.status, BatchRow.transaction_id, BatchRow.error_message
+)
+BATCH_SUMMARY_COLUMNS = (
+    Batch.id, Batch.source_wallet_id, Batch.status, Batch.total_amount,
+    Batch.item_count, Batch.success_count, Batch.failure_count, Batch.timestamp
+)
+
+def _user_batches_page(columns, user_id: int, limit: Optional[int] = None, before: Optional[tuple] = None,
+                       statuses: Optional[List[BatchStatus]] = None, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """
+    Newest-first keyset page over ix_batches_user_timestamp_id.
+    `before` is the (timestamp, id) of the last batch of the previous page.
+    """
+    query = select(*columns).where(Batch.user_id == user_id)
+    if statuses:
+        query = query.where(Batch.status.in_(statuses))
+    if since:
+        query = query.where(Batch.timestamp >= since)
+    if until:
+        query = query.where(Batch.timestamp < until)
+    if before:
+        query = query.where(tuple_(Batch.timestamp, Batch.id) < before)
+    query = query.order_by(Batch.timestamp.desc(), Batch.id.desc())
+    if limit:
+        query = query.limit(limit)
+    return query
+
+def get_batch_rows_by_user(db: Session, user_id: int, **page) -> List[dict]:
+    """
+    FAST PATH for get_batches_by_user: two SELECTs of plain tuples
+    (one page of batches, then all of their rows) instead of one lazy load per batch.
+    Accepts the keyset/filter arguments of _user_batches_page.
+    """
+    batches = [major_fields(dict(row), "total_amount", "reserved_amount") for row in db.execute(_user_batches_page(BATCH_COLUMNS, user_id, **page)).mappings()]
+    by_id = {batch["id"]: batch for batch in batches}
+    for batch in batches:
+        batch["rows"] = []
+    if by_id:
+        rows = db.execute(
+            select(*BATCH_ROW_COLUMNS).where(BatchRow.batch_id.in_(list(by_id))).order_by(BatchRow.batch_id, BatchRow.row_index)
+        ).mappings()
+        for row in rows:
+            by_id[row["batch_id"]]["rows"].append(major_fields(dict(row), "amount"))
+    return batches
+
+def get_batch_summaries_by_user(db: Session, user_id: int, **page) -> List[dict]:
+    """SUMMARY PROJECTION: list-view columns only, no rows and no bookkeeping counters."""
+    return [major_fields(dict(row), "total_amount") for row in db.execute(_user_batches_page(BATCH_SUMMARY_COLUMNS, user_id, **page)).mappings()]
+
+def update_batch_progress(db: Session, batch_id: int, status: BatchStatus = None, success: bool = True, amount: int = 0, is_item: bool = False, last_index: int = None):
+    """
+    Single-statement progress update.
+    Counters are applied as atomic SQL increments (`SET x = x + :n`) so two
+    executors touching the same batch can never lose each other's counts.
+    """
+    values = {}
     if status:
-        db_batch.status = status
-    
+        values[Batch.status] = status
+
     if last_index is not None:
-        db_batch.last_processed_index = last_index
-    
+        values[Batch.last_processed_index] = last_index
+
     if is_item:
-        db_batch.item_count += 1
+        values[Batch.item_count] = Batch.item_count + 1
         if success:
-            db_batch.success_count += 1
-            db_batch.total_amount += amount
+            values[Batch.success_count] = Batch.success_count + 1
+            values[Batch.total_amount] = Batch.total_amount + amount
         else:
-            db_batch.failure_count += 1
-        
+            values[Batch.failure_count] = Batch.failure_count + 1
+
+    if values:
+        updated = db.query(Batch).filter(Batch.id == batch_id).update(values, synchronize_session=False)
+        if updated and status:
+            outbox.enqueue(db, "batch.status_changed", "batch", batch_id, {"batch_id": batch_id, "status": status.value})
+        db.commit()
+        if not updated:
+            return None
+
+    return get_batch(db, batch_id)
+
+def derive_batch_counts(db: Session, batch_id: int, last_index: Optional[int] = None):
+    """
+    DERIVED-COUNT MODE:
+    Recomputes the batch counters from `batch_rows` status in one statement.
+    Self-healing: whatever happened to the in-memory counters, the result
+    always matches the row-level truth.
+    """
+    rows = BatchRow.__table__
+    processed = rows.c.status.in_([BatchRowStatus.SUCCESS, BatchRowStatus.FAILED])
+    succeeded = rows.c.status == BatchRowStatus.SUCCESS
+    failed = rows.c.status == BatchRowStatus.FAILED
+
+    def _row_count(condition):
+        return select(func.count()).select_from(rows).where(rows.c.batch_id == batch_id, condition).scalar_subquery()
+
+    values = {
+        Batch.item_count: _row_count(processed),
+        Batch.success_count: _row_count(succeeded),
+        Batch.failure_count: _row_count(failed),
+        Batch.total_amount: select(func.coalesce(func.sum(rows.c.amount), 0))
+            .where(rows.c.batch_id == batch_id, succeeded).scalar_subquery(),
+    }
+    if last_index is not None:
+        values[Batch.last_processed_index] = last_index
+
+    db.query(Batch).filter(Batch.id == batch_id).update(values, synchronize_session=False)
     db.commit()
-    db.refresh(db_batch)
-    return db_batch
 
-def create_batch_row(db: Session, batch_id: int, index: int, recipient_id: int, amount: float):
+class BatchProgressAggregator:
+    """
+    PROGRESS AGGREGATION LAYER:
+    Accumulates row outcomes in memory and flushes them every `flush_rows`
+    rows or `flush_interval` seconds as one UPDATE carrying both the counter
+    deltas and the `last_processed_index` checkpoint.
+
+    Resumability is preserved: counters and checkpoint move together, so rows
+    after the last flush are simply re-processed (and re-counted exactly once)
+    on resume, while their idempotency keys keep the ledger safe.
+    """
+
+    def __init__(self, db: Session, batch_id: int, flush_rows: int = None, flush_interval: float = None, mode: str = None, on_flush: Optional[Callable] = None):
+        self.db = db
+        self.batch_id = batch_id
+        self.flush_rows = flush_rows or config.BATCH_PROGRESS_FLUSH_ROWS
+        self.flush_interval = flush_interval if flush_interval is not None else config.BATCH_PROGRESS_FLUSH_SECONDS
+        self.mode = mode or config.BATCH_PROGRESS_MODE
+        # Called after every committed flush: on_flush(items, success, failure, amount, last_index)
+        self.on_flush = on_flush
+        self._reset()
+        self._last_flush = time.monotonic()
+
+    def _reset(self):
+        self.pending_items = 0
+        self.pending_success = 0
+        self.pending_failure = 0
+        self.pending_amount = 0
+        self.last_index = None
+
+    def record(self, index: int, success: bool, amount: int = 0):
+        self.pending_items += 1
+        if success:
+            self.pending_success += 1
+            self.pending_amount += amount
+        else:
+            self.pending_failure += 1
+        self.last_index = index
+
+        if self.pending_items >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.pending_items == 0:
+            return
+
+        if self.mode == "derived":
+            derive_batch_counts(self.db, self.batch_id, last_index=self.last_index)
+        else:
+            self.db.query(Batch).filter(Batch.id == self.batch_id).update({
+                Batch.item_count: Batch.item_count + self.pending_items,
+                Batch.success_count: Batch.success_count + self.pending_success,
+                Batch.failure_count: Batch.failure_count + self.pending_failure,
+                Batch.total_amount: Batch.total_amount + self.pending_amount,
+                Batch.last_processed_index: self.last_index,
+            }, synchronize_session=False)
+            self.db.commit()
+
+        if self.on_flush:
+            self.on_flush(self.pending_items, self.pending_success, self.pending_failure, self.pending_amount, self.last_index)
+        self._reset()
+        self._last_flush = time.monotonic()
+
+def create_batch_row(db: Session, batch_id: int, index: int, recipient_id: int, amount: int):
     db_row = BatchRow(
         batch_id=batch_id,
         row_index=index,
@@ -67,6 +233,40 @@ def create_batch_row(db: Session, batch_id: int, index: int, recipient_id: int,
     db.refresh(db_row)
     return db_row
 
+def create_batch_rows(db: Session, batch_id: int, rows: Iterable[tuple], content_digest: str) -> bool:
+    """
+    ROW SYNC (one DB transaction):
+    Claims the batch by setting its content digest, then inserts every
+    (recipient_id, amount) row (a list or payout_files.PayoutRows) in one
+    multi-row INSERT. A crash can no longer leave a partial row set behind.
+    Returns False if another upload already claimed the batch.
+    """
+    claimed = db.execute(
+        update(Batch).where(Batch.id == batch_id, Batch.content_digest.is_(None))
+        .values(content_digest=content_digest).execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        db.rollback()
+        return False
+    if rows:
+        db.execute(insert(BatchRow), [
+            {"batch_id": batch_id, "row_index": index, "recipient_id": recipient_id, "amount": amount, "status": BatchRowStatus.SKIPPED}
+            for index, (recipient_id, amount) in enumerate(rows)
+        ])
+    db.commit()
+    return True
+
+def get_batch_row_totals(db: Session, batch_id: int) -> tuple:
+    """(row count, total amount) of a batch's synced rows."""
+    return db.query(func.count(BatchRow.id), func.coalesce(func.sum(BatchRow.amount), 0)).filter(BatchRow.batch_id == batch_id).one()
+
+def find_batches_by_digest(db: Session, user_id: int, content_digest: str, exclude_batch_id: Optional[int] = None) -> List[int]:
+    """Ids of this user's batches synced from an identical file (ix_batches_user_content_digest)."""
+    query = db.query(Batch.id).filter(Batch.user_id == user_id, Batch.content_digest == content_digest)
+    if exclude_batch_id is not None:
+        query = query.filter(Batch.id != exclude_batch_id)
+    return [batch_id for (batch_id,) in query.order_by(Batch.id)]
+
 def update_batch_row(db: Session, row_id: int, status: BatchRowStatus, transaction_id: Optional[int] = None, error_message: Optional[str] = None):
     db_row = db.query(BatchRow).filter(BatchRow.id == row_id).first()
     if db_row:
@@ -79,3 +279,156 @@ def update_batch_row(db: Session, row_id: int, status: BatchRowStatus, transacti
 
 def get_batch_rows(db: Session, batch_id: int) -> List[BatchRow]:
     return db.query(BatchRow).filter(BatchRow.batch_id == batch_id).order_by(BatchRow.row_index).all()
+
+def count_batch_rows(db: Session, batch_id: int) -> int:
+    return db.query(func.count(BatchRow.id)).filter(BatchRow.batch_id == batch_id).scalar()
+
+def get_batch_rows_version(db: Session, batch_id: int) -> List[tuple]:
+    """
+    Row-level version marker of a batch: per row status, the row count, newest row
+    id, sum of ledger ids and number of error messages. Any row transition (status,
+    transaction link, error) changes it, even when the batch counters do not.
+    """
+    return [tuple(row) for row in db.execute(
+        select(
+            BatchRow.status, func.count(BatchRow.id), func.max(BatchRow.id),
+            func.sum(BatchRow.transaction_id), func.count(BatchRow.error_message)
+        ).where(BatchRow.batch_id == batch_id).group_by(BatchRow.status).order_by(BatchRow.status)
+    )]
+
+def get_compensable_rows(db: Session, batch_id: int, start_index: Optional[int] = None, end_index: Optional[int] = None):
+    """
+    Successful rows (as lightweight column tuples) eligible for reversal,
+    optionally restricted to an inclusive index range.
+    """
+    query = db.query(BatchRow.row_index, BatchRow.recipient_id, BatchRow.amount).filter(
+        BatchRow.batch_id == batch_id,
+        BatchRow.status == BatchRowStatus.SUCCESS,
+        BatchRow.transaction_id.isnot(None)
+    )
+    if start_index is not None:
+        query = query.filter(BatchRow.row_index >= start_index)
+    if end_index is not None:
+        query = query.filter(BatchRow.row_index <= end_index)
+    return query.order_by(BatchRow.row_index).all()
+
+def batch_row_key(batch_id: int, row_index: int) -> str:
+    return f"batch_{batch_id}_row_{row_index}"
+
+def reserve_chunk(db: Session, batch_id: int, source_wallet_id: int, rows: list):
+    """
+    FAN-OUT RESERVATION (one locked step per chunk):
+    Debits the aggregate amount of the chunk from the source wallet and parks it
+    in `batches.reserved_amount`; reserved rows are marked RESERVED in the same commit.
+
+    `rows` are (row_id, row_index, recipient_id, amount) tuples.
+    Returns (reserved_rows, outcomes) where outcomes maps row_index to
+    (success, transaction_id, error_message) for rows decided here.
+    """
+    keys = {index: batch_row_key(batch_id, index) for _, index, _, _ in rows}
+    existing = dict(
+        db.query(Transaction.idempotency_key, Transaction.id)
+        .filter(Transaction.idempotency_key.in_(list(keys.values())))
+        .all()
+    )
+
+    try:
+        source = db.query(Wallet).filter(Wallet.id == source_wallet_id).with_for_update().first()
+    except Exception:
+        db.rollback()
+        raise
+
+    reserved, outcomes, row_updates = [], {}, []
+    available = source.balance if source else 0
+    for row_id, index, recipient_id, amount in rows:
+        if keys[index] in existing:
+            # Credited by an earlier (interrupted) run: idempotent success
+            outcomes[index] = (True, existing[keys[index]], None)
+        elif not source:
+            outcomes[index] = (False, None, "404: One or more wallets not found")
+        elif source.status != WalletStatus.ACTIVE:
+            outcomes[index] = (False, None, "400: Sender wallet inactive")
+        elif amount <= 0:
+            outcomes[index] = (False, None, "400: Amount must be positive")
+        elif amount > available:
+            outcomes[index] = (False, None, "400: Insufficient funds")
+        else:
+            available -= amount
+            reserved.append((row_id, index, recipient_id, amount))
+            row_updates.append({"id": row_id, "status": BatchRowStatus.RESERVED, "error_message": None})
+            continue
+
+        success, transaction_id, error = outcomes[index]
+        row_updates.append({
+            "id": row_id,
+            "status": BatchRowStatus.SUCCESS if success else BatchRowStatus.FAILED,
+            "transaction_id": transaction_id,
+            "error_message": error,
+        })
+
+    total = sum(amount for _, _, _, amount in reserved)
+    if total:
+        db.query(Wallet).filter(Wallet.id == source_wallet_id).update(
+            {Wallet.balance: Wallet.balance - total}, synchronize_session=False
+        )
+        mark_wallets_dirty(db, [source_wallet_id])
+        emit_balance_event(db, {source_wallet_id: source.balance - total})
+        db.query(Batch).filter(Batch.id == batch_id).update(
+            {Batch.reserved_amount: Batch.reserved_amount + total}, synchronize_session=False
+        )
+    if row_updates:
+        db.execute(update(BatchRow), row_updates)
+    db.commit()
+    return reserved, outcomes
+
+def settle_reservation(db: Session, batch_id: int, source_wallet_id: int, errors: Optional[dict] = None):
+    """
+    Releases whatever part of `reserved_amount` was not credited back to the source
+    wallet and finalizes RESERVED rows, in one commit.
+
+    Rows with a committed credit become SUCCESS. Rows without one become FAILED
+    with their error from `errors`, or go back to SKIPPED (re-processed on resume)
+    when settling after a crash.
+    """
+    errors = errors or {}
+    try:
+        source = db.query(Wallet).filter(Wallet.id == source_wallet_id).with_for_update().first()
+    except Exception:
+        db.rollback()
+        raise
+    batch = db.query(Batch).filter(Batch.id == batch_id).with_for_update().first()
+
+    reserved_rows = db.query(BatchRow.id, BatchRow.row_index, BatchRow.amount).filter(
+        BatchRow.batch_id == batch_id, BatchRow.status == BatchRowStatus.RESERVED
+    ).all()
+    keys = {row.row_index: batch_row_key(batch_id, row.row_index) for row in reserved_rows}
+    credited = dict(
+        db.query(Transaction.idempotency_key, Transaction.id)
+        .filter(Transaction.idempotency_key.in_(list(keys.values())))
+        .all()
+    ) if keys else {}
+
+    settled_amount = 0
+    row_updates = []
+    for row in reserved_rows:
+        transaction_id = credited.get(keys[row.row_index])
+        if transaction_id:
+            settled_amount += row.amount
+            row_updates.append({"id": row.id, "status": BatchRowStatus.SUCCESS, "transaction_id": transaction_id, "error_message": None})
+        elif row.row_index in errors:
+            row_updates.append({"id": row.id, "status": BatchRowStatus.FAILED, "error_message": errors[row.row_index]})
+        else:
+            row_updates.append({"id": row.id, "status": BatchRowStatus.SKIPPED})
+
+    release = (batch.reserved_amount or 0) - settled_amount
+    if release and source:
+        db.query(Wallet).filter(Wallet.id == source_wallet_id).update(
+            {Wallet.balance: Wallet.balance + release}, synchronize_session=False
+        )
+        mark_wallets_dirty(db, [source_wallet_id])
+        emit_balance_event(db, {source_wallet_id: source.balance + release})
+    batch.reserved_amount = 0
+    if row_updates:
+        db.execute(update(BatchRow), row_updates)
+    db.commit()
+    return credited
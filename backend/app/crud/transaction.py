@@ -1,8 +1,30 @@
 from sqlalchemy.orm import Session
 from app.database.models import Transaction, Wallet, WalletStatus
-from app.schemas.transaction import TransactionCreate
+from app.schemas.transaction import TransactionCreate, MultiTransferCreate, MULTI_LEG_KEY_PREFIX
 from fastapi import HTTPException
-from sqlalchemy import or_
+from app.core.cache import mark_wallets_dirty
+from app.core.notifications import emit_transaction_event, emit_balance_event
+from app.core import outbox
+from app.core.money import major_fields, to_major
+from app.core.wallet_locks import wallet_locks
+from app.core.retry import run_with_retry, classify, contention
+from sqlalchemy import or_, select, func, update, insert, bindparam
+from sqlalchemy.exc import IntegrityError
+from collections import defaultdict
+from datetime import datetime
+from typing import List
+import time
+
+def release_connection(db: Session):
+    """
+    Return the session's connection to the pool before (possibly) waiting on a
+    lock stripe. Only the caller's read transaction is ended: if the session holds
+    unflushed work it is left alone, a CRUD helper never commits on the caller's behalf.
+    Without an open transaction (e.g. right after the previous transfer's commit)
+    there is nothing to release, and the caller's loaded objects are not expired.
+    """
+    if db.in_transaction() and not (db.new or db.dirty or db.deleted):
+        db.rollback()
 
 def create_transfer_secure(db: Session, transaction: TransactionCreate):
     """
@@ -11,8 +33,16 @@ def create_transfer_secure(db: Session, transaction: TransactionCreate):
     - Concurrency: Uses SELECT ... FOR UPDATE (row locking)
     - Idempotency: Checks for existence of idempotency_key
     - Consistency: Enforces ordering to prevent deadlocks
+    - Serialization: same-wallet transfers in this worker queue on in-process
+      lock stripes first, without holding a DB connection
     """
-    
+    release_connection(db)
+    wallet_ids = (transaction.from_wallet_id, transaction.to_wallet_id)
+    with wallet_locks.hold(*wallet_ids):
+        # Deadlocks / lock timeouts are retried here instead of surfacing as 400s
+        return run_with_retry(db, lambda: _create_transfer_locked(db, transaction), wallet_ids=wallet_ids)
+
+def _create_transfer_locked(db: Session, transaction: TransactionCreate):
     # 1. IDEMPOTENCY CHECK
     # Check if a transaction with this key already exists
     existing_txn = db.query(Transaction).filter(
@@ -32,12 +62,14 @@ def create_transfer_secure(db: Session, transaction: TransactionCreate):
     # Lock rows
     # populate_existing() ensures we refresh correctly
     # with_for_update() adds "FOR UPDATE" clause
+    lock_started = time.perf_counter()
     try:
         w1 = db.query(Wallet).filter(Wallet.id == first_id).with_for_update().first()
         w2 = db.query(Wallet).filter(Wallet.id == second_id).with_for_update().first()
     except Exception as e:
         db.rollback()
         raise e
+    contention.record_wait((first_id, second_id), time.perf_counter() - lock_started)
 
     if not w1 or not w2:
         db.rollback()
@@ -72,15 +104,279 @@ def create_transfer_secure(db: Session, transaction: TransactionCreate):
     
     # 6. COMMIT
     # If any error happens before this, DB rolls back automatically or we caught it.
+    # The push event is queued on the session and only leaves once the commit succeeds.
     try:
+        db.flush()
+        outbox.enqueue(db, "transfer.committed", "transaction", db_txn.id, outbox.transaction_payload(db_txn))
+        emit_transaction_event(
+            db, db_txn.id, sender.id, receiver.id, transaction.amount, transaction.batch_id,
+            balances={sender.id: sender.balance, receiver.id: receiver.balance}
+        )
         db.commit()
         db.refresh(db_txn)
     except Exception as e:
         db.rollback()
+        if classify(e):
+            # Transient (deadlock, serialization failure, lock timeout): let the runner retry
+            raise
         raise HTTPException(status_code=400, detail=f"Transaction failed: {str(e)}")
         
     return db_txn
 
+def multi_leg_key(group_key: str, leg_index: int) -> str:
+    return f"{MULTI_LEG_KEY_PREFIX}{group_key}_leg_{leg_index}"
+
+def get_multi_transfer(db: Session, group_key: str, leg_count: int) -> List[Transaction]:
+    keys = [multi_leg_key(group_key, index) for index in range(leg_count)]
+    return db.query(Transaction).filter(Transaction.idempotency_key.in_(keys)).order_by(Transaction.id).all()
+
+def create_multi_transfer_secure(db: Session, transfer: MultiTransferCreate) -> List[Transaction]:
+    """
+    MULTI-LEG TRANSFER (split payments, one DB transaction):
+    - Idempotency: the group key covers every leg; legs are stored as
+      multi_{key}_leg_{i}; a replay of the same legs returns the committed group,
+      anything else under that key is a 409
+    - Locking: every involved wallet locked once, in ascending ID order, in one statement
+    - Validation: net debit per wallet against its locked balance, so only the
+      final state has to be covered, not each leg on its own
+    - Persistence: one executemany balance UPDATE, one multi-row ledger INSERT, single commit
+    """
+    release_connection(db)
+    wallet_ids = {leg.from_wallet_id for leg in transfer.legs} | {leg.to_wallet_id for leg in transfer.legs}
+    with wallet_locks.hold(*wallet_ids):
+        return run_with_retry(db, lambda: _create_multi_transfer_locked(db, transfer), wallet_ids=wallet_ids)
+
+def _replayed_group(db: Session, transfer: MultiTransferCreate) -> List[Transaction]:
+    """The committed group for this key, if any; 409 if it is not this exact request."""
+    existing = get_multi_transfer(db, transfer.idempotency_key, len(transfer.legs))
+    if not existing:
+        return existing
+    by_key = {txn.idempotency_key: txn for txn in existing}
+    for index, leg in enumerate(transfer.legs):
+        txn = by_key.get(multi_leg_key(transfer.idempotency_key, index))
+        if txn is None or (txn.from_wallet_id, txn.to_wallet_id, txn.amount) != (leg.from_wallet_id, leg.to_wallet_id, leg.amount):
+            db.rollback()
+            raise HTTPException(status_code=409, detail="Idempotency key already used for a different multi-leg transfer")
+    # A longer earlier group under the same key is not this request either
+    if db.query(Transaction.id).filter(
+        Transaction.idempotency_key == multi_leg_key(transfer.idempotency_key, len(transfer.legs))
+    ).first():
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Idempotency key already used for a different multi-leg transfer")
+    return existing
+
+def _create_multi_transfer_locked(db: Session, transfer: MultiTransferCreate) -> List[Transaction]:
+    existing = _replayed_group(db, transfer)
+    if existing:
+        return existing
+
+    net = defaultdict(int)
+    for leg in transfer.legs:
+        net[leg.from_wallet_id] -= leg.amount
+        net[leg.to_wallet_id] += leg.amount
+
+    lock_started = time.perf_counter()
+    try:
+        locked = db.query(Wallet).filter(Wallet.id.in_(sorted(net))).order_by(Wallet.id).with_for_update().all()
+    except Exception:
+        db.rollback()
+        raise
+    contention.record_wait(net.keys(), time.perf_counter() - lock_started)
+    wallets = {w.id: w for w in locked}
+
+    if len(wallets) != len(net):
+        db.rollback()
+        raise HTTPException(status_code=404, detail="One or more wallets not found")
+    for leg in transfer.legs:
+        if wallets[leg.from_wallet_id].status != WalletStatus.ACTIVE:
+            db.rollback()
+            raise HTTPException(status_code=400, detail=f"Sender wallet {leg.from_wallet_id} inactive")
+    for wallet_id, delta in net.items():
+        if wallets[wallet_id].balance + delta < 0:
+            db.rollback()
+            raise HTTPException(status_code=400, detail=f"Insufficient funds in wallet {wallet_id}")
+
+    now = datetime.utcnow()
+    ledger = [
+        {
+            "from_wallet_id": leg.from_wallet_id,
+            "to_wallet_id": leg.to_wallet_id,
+            "amount": leg.amount,
+            "idempotency_key": multi_leg_key(transfer.idempotency_key, index),
+            "batch_id": None,
+            "timestamp": now,
+        }
+        for index, leg in enumerate(transfer.legs)
+    ]
+    balances = {wallet_id: wallets[wallet_id].balance + delta for wallet_id, delta in net.items()}
+    try:
+        changed = sorted(wallet_id for wallet_id, delta in net.items() if delta)
+        if changed:
+            db.execute(
+                update(Wallet.__table__)
+                .where(Wallet.__table__.c.id == bindparam("wallet_id"))
+                .values(balance=Wallet.__table__.c.balance + bindparam("delta")),
+                [{"wallet_id": wallet_id, "delta": net[wallet_id]} for wallet_id in changed]
+            )
+        transaction_ids = db.scalars(
+            insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True), ledger
+        ).all()
+        outbox.enqueue_many(db, "transfer.committed", "transaction", [
+            (txn_id, {**entry, "amount": to_major(entry["amount"]), "transaction_id": txn_id, "timestamp": now.isoformat()})
+            for txn_id, entry in zip(transaction_ids, ledger)
+        ])
+        for txn_id, entry in zip(transaction_ids, ledger):
+            emit_transaction_event(db, txn_id, entry["from_wallet_id"], entry["to_wallet_id"], entry["amount"])
+        emit_balance_event(db, balances)
+        mark_wallets_dirty(db, net.keys())
+        db.commit()
+    except IntegrityError:
+        # Same group key committed concurrently
+        db.rollback()
+        return _replayed_group(db, transfer)
+    except Exception as e:
+        db.rollback()
+        if classify(e):
+            raise
+        raise HTTPException(status_code=400, detail=f"Transaction failed: {str(e)}")
+
+    return get_multi_transfer(db, transfer.idempotency_key, len(transfer.legs))
+
+def credit_reserved_transfer(db: Session, batch_id: int, source_wallet_id: int, recipient_id: int, amount: int, idempotency_key: str) -> int:
+    """
+    Credit half of a fan-out batch row: the debit was already reserved from the
+    source wallet (see batch_crud.reserve_chunk), so only the recipient row is touched.
+    Safe to run concurrently across connections; returns the ledger transaction id.
+    """
+    existing_txn = db.query(Transaction.id).filter(Transaction.idempotency_key == idempotency_key).first()
+    if existing_txn:
+        return existing_txn.id
+
+    # Single atomic increment: the UPDATE itself takes the recipient row lock
+    try:
+        credited = db.execute(
+            update(Wallet).where(Wallet.id == recipient_id)
+            .values(balance=Wallet.balance + amount).returning(Wallet.balance)
+            .execution_options(synchronize_session=False)
+        ).first()
+    except Exception:
+        db.rollback()
+        raise
+
+    if credited is None:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="One or more wallets not found")
+    mark_wallets_dirty(db, [recipient_id])
+
+    db_txn = Transaction(
+        from_wallet_id=source_wallet_id,
+        to_wallet_id=recipient_id,
+        amount=amount,
+        idempotency_key=idempotency_key,
+        batch_id=batch_id
+    )
+    db.add(db_txn)
+
+    try:
+        db.flush()
+        transaction_id = db_txn.id
+        outbox.enqueue(db, "transfer.committed", "transaction", transaction_id, outbox.transaction_payload(db_txn))
+        emit_transaction_event(
+            db, transaction_id, source_wallet_id, recipient_id, amount, batch_id,
+            balances={recipient_id: credited.balance}
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Transaction failed: {str(e)}")
+
+    return transaction_id
+
+def reversal_key(batch_id: int, row_index: int) -> str:
+    return f"reversal_batch_{batch_id}_row_{row_index}"
+
+def create_reversals_bulk(db: Session, batch_id: int, source_wallet_id: int, rows: list) -> List[dict]:
+    """
+    SET-BASED COMPENSATION (one chunk, one DB transaction):
+    - Idempotency: one IN lookup for all reversal keys of the chunk
+    - Locking: every involved wallet locked once, in ascending ID order
+    - Validation: applied row by row against the locked in-memory balances
+    - Persistence: balance UPDATEs and ledger INSERTs flushed together, single commit
+
+    `rows` are (row_index, recipient_id, amount) tuples, see batch_crud.get_compensable_rows.
+    """
+    keys = {row.row_index: reversal_key(batch_id, row.row_index) for row in rows}
+    already_done = {
+        key for (key,) in db.query(Transaction.idempotency_key)
+        .filter(Transaction.idempotency_key.in_(list(keys.values())))
+    }
+    pending = [row for row in rows if keys[row.row_index] not in already_done]
+
+    results = {
+        row.row_index: {"index": row.row_index, "status": "Compensated", "detail": "Already reversed"}
+        for row in rows if keys[row.row_index] in already_done
+    }
+    if not pending:
+        db.rollback()
+        return [results[row.row_index] for row in rows]
+
+    # Deterministic lock order (Low ID first) for the whole chunk in one statement
+    wallet_ids = sorted({row.recipient_id for row in pending} | {source_wallet_id})
+    try:
+        locked = db.query(Wallet).filter(Wallet.id.in_(wallet_ids)).order_by(Wallet.id).with_for_update().all()
+    except Exception:
+        db.rollback()
+        raise
+    wallets = {w.id: w for w in locked}
+
+    source = wallets.get(source_wallet_id)
+    if not source:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Source wallet not found")
+
+    applied, reversals = [], []
+    for row in pending:
+        sender = wallets.get(row.recipient_id)
+        if not sender:
+            results[row.row_index] = {"index": row.row_index, "status": "Failed", "detail": "One or more wallets not found"}
+            continue
+        if sender.status != WalletStatus.ACTIVE:
+            results[row.row_index] = {"index": row.row_index, "status": "Failed", "detail": "Sender wallet inactive"}
+            continue
+        if sender.balance < row.amount:
+            results[row.row_index] = {"index": row.row_index, "status": "Failed", "detail": "Insufficient funds"}
+            continue
+
+        sender.balance -= row.amount
+        source.balance += row.amount
+        reversal = Transaction(
+            from_wallet_id=row.recipient_id,
+            to_wallet_id=source_wallet_id,
+            amount=row.amount,
+            idempotency_key=keys[row.row_index]
+        )
+        db.add(reversal)
+        applied.append(row.row_index)
+        reversals.append(reversal)
+
+    try:
+        if applied:
+            db.flush()
+            outbox.enqueue_many(db, "transfer.reversed", "transaction", [(r.id, outbox.transaction_payload(r)) for r in reversals])
+            touched = {source_wallet_id} | {reversal.from_wallet_id for reversal in reversals}
+            emit_balance_event(db, {wid: wallets[wid].balance for wid in touched})
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        for idx in applied:
+            results[idx] = {"index": idx, "status": "Failed", "detail": f"Transaction failed: {str(e)}"}
+        applied = []
+
+    for idx in applied:
+        results[idx] = {"index": idx, "status": "Compensated"}
+
+    return [results[row.row_index] for row in rows]
+
 # Keep vulnerable version for reference or legacy compatibility if needed, 
 # but API should call secure version.
 def create_transfer_vulnerable(db: Session, transaction: TransactionCreate):
@@ -94,3 +390,36 @@ def get_transactions_by_wallet(db: Session, wallet_id: int):
             Transaction.to_wallet_id == wallet_id
         )
     ).order_by(Transaction.timestamp.desc()).all()
+
+TRANSACTION_COLUMNS = (
+    Transaction.id, Transaction.from_wallet_id, Transaction.to_wallet_id, Transaction.amount,
+    Transaction.idempotency_key, Transaction.timestamp, Transaction.batch_id
+)
+
+def get_transaction_rows_by_wallet(db: Session, wallet_id: int) -> List[dict]:
+    """
+    FAST PATH: same result as get_transactions_by_wallet, fetched as plain
+    column tuples (no ORM identity map, no pydantic validation).
+    """
+    result = db.execute(
+        select(*TRANSACTION_COLUMNS).where(
+            or_(
+                Transaction.from_wallet_id == wallet_id,
+                Transaction.to_wallet_id == wallet_id
+            )
+        ).order_by(Transaction.timestamp.desc())
+    )
+    return [major_fields(dict(row), "amount") for row in result.mappings()]
+
+def get_wallet_history_version(db: Session, wallet_id: int):
+    """
+    (newest transaction id, transaction count) for a wallet: the history page's version marker.
+    One aggregate per side, each an index range (ix_transactions_from/to_wallet_id) instead of
+    an OR over the whole table; a ledger row never has the same wallet on both sides.
+    """
+    sides = [
+        db.execute(select(func.max(Transaction.id), func.count(Transaction.id)).where(column == wallet_id)).one()
+        for column in (Transaction.from_wallet_id, Transaction.to_wallet_id)
+    ]
+    newest = max((last_id for last_id, _ in sides if last_id is not None), default=None)
+    return newest, sum(count for _, count in sides)
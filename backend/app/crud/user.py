@@ -1,7 +1,11 @@
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from typing import List, Optional
 from app.database.models import User, Wallet
 from app.schemas.user import UserCreate
 from app.core import security
+from app.core.money import to_major
 
 def get_user(db: Session, user_id: int):
     return db.query(User).filter(User.id == user_id).first()
@@ -20,7 +24,7 @@ def create_user(db: Session, user: UserCreate):
     db.refresh(db_user)
     
     # Create associated wallet
-    db_wallet = Wallet(user_id=db_user.id, balance=0.0)
+    db_wallet = Wallet(user_id=db_user.id, balance=0)
     db.add(db_wallet)
     db.commit()
     db.refresh(db_user)
@@ -30,6 +34,44 @@ def create_user(db: Session, user: UserCreate):
 def get_users(db: Session, skip: int = 0, limit: int = 100):
     return db.query(User).offset(skip).limit(limit).all()
 
+def get_user_rows(db: Session, limit: int = 100, after_id: Optional[int] = None, skip: int = 0) -> List[dict]:
+    """
+    FAST PATH for get_users: users and their wallet in one LEFT JOIN,
+    shaped like schemas.user.User without building ORM objects.
+    Keyset paging on the primary key: `after_id` is the last id of the previous page.
+    """
+    page = select(User.id).order_by(User.id).limit(limit)
+    if after_id is not None:
+        page = page.where(User.id > after_id)
+    elif skip:
+        # Legacy offset paging, kept for existing clients
+        page = page.offset(skip)
+    page = page.subquery()
+    result = db.execute(
+        select(
+            User.id, User.username, User.email,
+            User.transaction_pin_hash.isnot(None).label("has_pin"),
+            Wallet.id.label("wallet_id"), Wallet.user_id.label("wallet_user_id"),
+            Wallet.balance, Wallet.status
+        )
+        .join(page, page.c.id == User.id)
+        .outerjoin(Wallet, Wallet.user_id == User.id)
+        .order_by(User.id, Wallet.id)
+    )
+    users = {}
+    for row in result:
+        if row.id in users:
+            continue
+        users[row.id] = {
+            "username": row.username,
+            "email": row.email,
+            "id": row.id,
+            "wallet": {"id": row.wallet_id, "user_id": row.wallet_user_id, "balance": to_major(row.balance), "status": row.status}
+            if row.wallet_id is not None else None,
+            "has_pin": bool(row.has_pin),
+        }
+    return list(users.values())
+
 def get_user_by_username(db: Session, username: str):
     return db.query(User).filter(User.username == username).first()
 
@@ -40,3 +82,70 @@ def update_user_pin(db: Session, user_id: int, hashed_pin: str):
         db.commit()
         db.refresh(db_user)
     return db_user
+
+def bulk_create_users(db: Session, records: List[dict]) -> List[dict]:
+    """
+    BULK PROVISIONING (one chunk, one commit):
+    `records` carry line, username, email, hashed_password, transaction_pin_hash.
+    Duplicates (inside the chunk or against existing users) are reported per row;
+    the rest are inserted with one multi-row INSERT for users and one for wallets.
+    """
+    usernames = [r["username"] for r in records]
+    emails = [r["email"] for r in records]
+    taken_usernames = {u for (u,) in db.query(User.username).filter(User.username.in_(usernames))}
+    taken_emails = {e for (e,) in db.query(User.email).filter(User.email.in_(emails))}
+
+    results = {}
+    accepted = []
+    for record in records:
+        if record["username"] in taken_usernames:
+            results[record["line"]] = {"line": record["line"], "username": record["username"], "status": "Conflict", "detail": "Username already exists"}
+        elif record["email"] in taken_emails:
+            results[record["line"]] = {"line": record["line"], "username": record["username"], "status": "Conflict", "detail": "Email already exists"}
+        else:
+            taken_usernames.add(record["username"])
+            taken_emails.add(record["email"])
+            accepted.append(record)
+
+    if accepted:
+        try:
+            _insert_users_with_wallets(db, accepted, results)
+            db.commit()
+        except IntegrityError:
+            # Lost a race with a concurrent registration: fall back to row-by-row savepoints
+            db.rollback()
+            for record in accepted:
+                try:
+                    with db.begin_nested():
+                        _insert_users_with_wallets(db, [record], results)
+                except IntegrityError:
+                    results[record["line"]] = {"line": record["line"], "username": record["username"], "status": "Conflict", "detail": "Username or email already exists"}
+            db.commit()
+
+    return [results[r["line"]] for r in records]
+
+def _insert_users_with_wallets(db: Session, records: List[dict], results: dict):
+    user_rows = db.execute(
+        insert(User).returning(User.id, User.username, sort_by_parameter_order=True),
+        [
+            {
+                "username": r["username"],
+                "email": r["email"],
+                "hashed_password": r["hashed_password"],
+                "transaction_pin_hash": r["transaction_pin_hash"],
+            }
+            for r in records
+        ]
+    ).all()
+    wallet_rows = db.execute(
+        insert(Wallet).returning(Wallet.id, Wallet.user_id, sort_by_parameter_order=True),
+        [{"user_id": row.id, "balance": 0} for row in user_rows]
+    ).all()
+    for record, user_row, wallet_row in zip(records, user_rows, wallet_rows):
+        results[record["line"]] = {
+            "line": record["line"],
+            "username": user_row.username,
+            "status": "Created",
+            "user_id": user_row.id,
+            "wallet_id": wallet_row.id,
+        }
@@ -1,8 +1,17 @@
 from fastapi import HTTPException
+from sqlalchemy import update, insert, bindparam, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.database.models import Wallet
-from typing import List
-from app.schemas.wallet import WalletCreate
+from app.database.models import Wallet, Transaction
+from typing import List, Optional
+from collections import defaultdict
+from datetime import datetime
+import uuid
+from app.core.cache import wallet_cache, mark_wallets_dirty
+from app.core.notifications import emit_transaction_event, emit_balance_event
+from app.core import outbox
+from app.core.money import major_fields, to_major
+from app.schemas.wallet import WalletCreate, WalletDepositItem
 
 def create_wallet(db: Session, wallet: WalletCreate):
     db_wallet = Wallet(user_id=wallet.user_id)
@@ -14,19 +23,154 @@ def create_wallet(db: Session, wallet: WalletCreate):
 def get_wallet(db: Session, wallet_id: int):
     return db.query(Wallet).filter(Wallet.id == wallet_id).first()
 
+def get_wallet_snapshot(db: Session, wallet_id: int) -> Optional[dict]:
+    """
+    Cached read path for hot lookups (balance polling, ownership checks).
+    Returns a plain dict; the cache is invalidated after every committed balance change.
+    """
+    def load():
+        row = db.query(Wallet.id, Wallet.user_id, Wallet.balance, Wallet.status).filter(Wallet.id == wallet_id).first()
+        return {"id": row.id, "user_id": row.user_id, "balance": row.balance, "status": row.status.value} if row else None
+
+    return wallet_cache.get_or_load(wallet_id, load)
+
 def get_wallets_by_user(db: Session, user_id: int):
     return db.query(Wallet).filter(Wallet.user_id == user_id).all()
 
-def deposit_wallet(db: Session, wallet_id: int, amount: float):
+def deposit_wallet(db: Session, wallet_id: int, amount: int, idempotency_key: Optional[str] = None):
+    """
+    ATOMIC DEPOSIT:
+    One `UPDATE ... SET balance = balance + :x RETURNING` statement plus a ledger
+    entry (from_wallet_id = NULL) in the same DB transaction. The UPDATE takes the
+    row lock itself, so concurrent transfers can no longer lose the deposit.
+    """
     if amount <= 0:
         raise HTTPException(status_code=400, detail="Deposit amount must be positive. Use /transfer/ for movements.")
-    wallet = get_wallet(db, wallet_id)
-    if wallet:
-        wallet.balance += amount
+
+    if idempotency_key and replay_deposit(db, wallet_id, idempotency_key):
+        return get_wallet(db, wallet_id)
+
+    row = db.execute(
+        update(Wallet)
+        .where(Wallet.id == wallet_id)
+        .values(balance=Wallet.balance + amount)
+        .returning(Wallet.id, Wallet.user_id, Wallet.balance, Wallet.status),
+        execution_options={"synchronize_session": False}
+    ).first()
+    if not row:
+        db.rollback()
+        return None
+
+    db_txn = Transaction(
+        from_wallet_id=None,
+        to_wallet_id=wallet_id,
+        amount=amount,
+        idempotency_key=idempotency_key or deposit_key()
+    )
+    db.add(db_txn)
+    mark_wallets_dirty(db, [wallet_id])
+    try:
+        db.flush()
+        outbox.enqueue(db, "deposit.committed", "transaction", db_txn.id, outbox.transaction_payload(db_txn))
+        emit_transaction_event(db, db_txn.id, None, wallet_id, amount, balances={wallet_id: row.balance})
         db.commit()
-        db.refresh(wallet)
-    return wallet
-    return wallet
+    except IntegrityError:
+        # Same idempotency key committed concurrently
+        db.rollback()
+        replay_deposit(db, wallet_id, idempotency_key)
+        return get_wallet(db, wallet_id)
+
+    return {"id": row.id, "user_id": row.user_id, "balance": row.balance, "status": row.status}
+
+def replay_deposit(db: Session, wallet_id: int, idempotency_key: str) -> bool:
+    """
+    True if `idempotency_key` already funded this wallet (the deposit is a replay).
+    A key that belongs to another wallet or to a transfer is a conflict, not a replay.
+    """
+    existing = db.query(Transaction.from_wallet_id, Transaction.to_wallet_id).filter(
+        Transaction.idempotency_key == idempotency_key
+    ).first()
+    if existing and (existing.from_wallet_id is not None or existing.to_wallet_id != wallet_id):
+        raise HTTPException(status_code=409, detail="Idempotency key was already used for a different operation")
+    return existing is not None
+
+def deposit_key() -> str:
+    return f"deposit_{uuid.uuid4().hex}"
+
+def deposit_wallets_bulk(db: Session, deposits: List[WalletDepositItem], chunk_size: int = 1000) -> List[dict]:
+    """
+    BULK FUNDING:
+    Per chunk: one existence/idempotency lookup each, one executemany UPDATE
+    (`balance = balance + :amount`, amounts pre-aggregated per wallet), one
+    multi-row ledger INSERT and one commit. Returns per-item results in input order.
+    """
+    results: List[dict] = []
+    for offset in range(0, len(deposits), chunk_size):
+        chunk = list(enumerate(deposits[offset:offset + chunk_size], start=offset))
+        chunk_results = {}
+
+        keys = [item.idempotency_key for _, item in chunk if item.idempotency_key]
+        # key -> wallet it funded (None for transfer keys), so a replay aimed at another wallet conflicts
+        seen_keys = {
+            key: target if source is None else None
+            for key, source, target in db.query(
+                Transaction.idempotency_key, Transaction.from_wallet_id, Transaction.to_wallet_id
+            ).filter(Transaction.idempotency_key.in_(keys))
+        } if keys else {}
+        wallet_ids = {item.wallet_id for _, item in chunk}
+        existing_wallets = {wid for (wid,) in db.query(Wallet.id).filter(Wallet.id.in_(wallet_ids))}
+
+        totals = defaultdict(int)
+        ledger = []
+        for index, item in chunk:
+            if item.amount <= 0:
+                chunk_results[index] = {"index": index, "wallet_id": item.wallet_id, "status": "Failed", "detail": "Deposit amount must be positive"}
+            elif item.wallet_id not in existing_wallets:
+                chunk_results[index] = {"index": index, "wallet_id": item.wallet_id, "status": "Failed", "detail": "Wallet not found"}
+            elif item.idempotency_key in seen_keys and seen_keys[item.idempotency_key] != item.wallet_id:
+                chunk_results[index] = {"index": index, "wallet_id": item.wallet_id, "status": "Failed", "detail": "Idempotency key was already used for a different operation"}
+            elif item.idempotency_key in seen_keys:
+                chunk_results[index] = {"index": index, "wallet_id": item.wallet_id, "status": "Deposited", "detail": "Duplicate idempotency key"}
+            else:
+                if item.idempotency_key:
+                    seen_keys[item.idempotency_key] = item.wallet_id
+                totals[item.wallet_id] += item.amount
+                ledger.append({
+                    "from_wallet_id": None,
+                    "to_wallet_id": item.wallet_id,
+                    "amount": item.amount,
+                    "idempotency_key": item.idempotency_key or deposit_key(),
+                    "timestamp": datetime.utcnow(),
+                })
+                chunk_results[index] = {"index": index, "wallet_id": item.wallet_id, "status": "Deposited"}
+
+        if ledger:
+            try:
+                db.execute(
+                    update(Wallet.__table__)
+                    .where(Wallet.__table__.c.id == bindparam("wallet_id"))
+                    .values(balance=Wallet.__table__.c.balance + bindparam("amount")),
+                    [{"wallet_id": wid, "amount": total} for wid, total in sorted(totals.items())]
+                )
+                transaction_ids = db.scalars(
+                    insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True), ledger
+                ).all()
+                outbox.enqueue_many(db, "deposit.committed", "transaction", [
+                    (txn_id, {**entry, "amount": to_major(entry["amount"]), "transaction_id": txn_id, "batch_id": None, "timestamp": entry["timestamp"].isoformat()})
+                    for txn_id, entry in zip(transaction_ids, ledger)
+                ])
+                mark_wallets_dirty(db, totals.keys())
+                # The credited rows are locked by the UPDATE, so this read is the committed balance
+                emit_balance_event(db, dict(db.query(Wallet.id, Wallet.balance).filter(Wallet.id.in_(totals.keys())).all()))
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                for index, result in chunk_results.items():
+                    if result["status"] == "Deposited" and "detail" not in result:
+                        chunk_results[index] = {"index": index, "wallet_id": result["wallet_id"], "status": "Failed", "detail": f"Transaction failed: {str(e)}"}
+
+        results.extend(chunk_results[index] for index, _ in chunk)
+    return results
 
 def get_wallets_balances(db: Session, wallet_ids: List[int]):
     """
@@ -38,3 +182,10 @@ def get_wallets_balances(db: Session, wallet_ids: List[int]):
     for all rows matched by the statement.
     """
     return db.query(Wallet).filter(Wallet.id.in_(wallet_ids)).all()
+
+WALLET_COLUMNS = (Wallet.id, Wallet.user_id, Wallet.balance, Wallet.status)
+
+def get_wallet_rows_balances(db: Session, wallet_ids: List[int]) -> List[dict]:
+    """FAST PATH for get_wallets_balances: one SELECT, plain dicts."""
+    result = db.execute(select(*WALLET_COLUMNS).where(Wallet.id.in_(wallet_ids)))
+    return [major_fields(dict(row), "balance") for row in result.mappings()]
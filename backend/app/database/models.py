@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Enum, CheckConstraint
+from sqlalchemy import BigInteger, Column, Integer, String, ForeignKey, Date, DateTime, Enum, CheckConstraint, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -19,6 +19,7 @@ class BatchRowStatus(str, enum.Enum):
     SUCCESS = "SUCCESS"
     FAILED = "FAILED"
     SKIPPED = "SKIPPED"
+    RESERVED = "RESERVED"
 
 class User(Base):
     __tablename__ = "users"
@@ -40,7 +41,8 @@ class Wallet(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    balance = Column(Float, default=0.0)
+    # Money columns hold integer minor units (see app/core/money.py)
+    balance = Column(BigInteger, default=0)
     status = Column(Enum(WalletStatus), default=WalletStatus.ACTIVE)
 
     __table_args__ = (
@@ -58,13 +60,24 @@ class Batch(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     source_wallet_id = Column(Integer, ForeignKey("wallets.id"))
     status = Column(Enum(BatchStatus), default=BatchStatus.PENDING)
-    total_amount = Column(Float, default=0.0)
+    total_amount = Column(BigInteger, default=0)
     item_count = Column(Integer, default=0)
     success_count = Column(Integer, default=0)
     failure_count = Column(Integer, default=0)
     timestamp = Column(DateTime, default=datetime.utcnow)
     idempotency_key = Column(String, unique=True, index=True, nullable=True)
     last_processed_index = Column(Integer, default=-1)
+    # Funds debited from the source for the in-flight fan-out chunk, not yet credited
+    reserved_amount = Column(BigInteger, default=0)
+    # SHA-256 of the uploaded file the rows were synced from
+    content_digest = Column(String(64), nullable=True)
+
+    __table_args__ = (
+        # Newest-first keyset pagination of a user's batches
+        Index("ix_batches_user_timestamp_id", "user_id", "timestamp", "id"),
+        # Duplicate-upload lookup: same file already synced into another batch of this user
+        Index("ix_batches_user_content_digest", "user_id", "content_digest"),
+    )
 
     transactions = relationship("Transaction", back_populates="batch")
     rows = relationship("BatchRow", back_populates="batch")
@@ -75,11 +88,17 @@ class Transaction(Base):
     id = Column(Integer, primary_key=True, index=True)
     from_wallet_id = Column(Integer, ForeignKey("wallets.id"))
     to_wallet_id = Column(Integer, ForeignKey("wallets.id"))
-    amount = Column(Float)
+    amount = Column(BigInteger)
     timestamp = Column(DateTime, default=datetime.utcnow)
     idempotency_key = Column(String, unique=True, index=True, nullable=True)
     batch_id = Column(Integer, ForeignKey("batches.id"), nullable=True)
 
+    __table_args__ = (
+        # Wallet history and its ETag marker (newest id, count): one range per side
+        Index("ix_transactions_from_wallet_id", "from_wallet_id", "id"),
+        Index("ix_transactions_to_wallet_id", "to_wallet_id", "id"),
+    )
+
     batch = relationship("Batch", back_populates="transactions")
     batch_row = relationship("BatchRow", back_populates="transaction", uselist=False)
 
@@ -90,10 +109,61 @@ class BatchRow(Base):
     batch_id = Column(Integer, ForeignKey("batches.id"))
     row_index = Column(Integer)
     recipient_id = Column(Integer)
-    amount = Column(Float)
+    amount = Column(BigInteger)
     status = Column(Enum(BatchRowStatus), default=BatchRowStatus.SKIPPED)
     transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=True)
     error_message = Column(String, nullable=True)
 
+    __table_args__ = (
+        # A batch's rows in order: detail page, compensation ranges, ETag row marker
+        Index("ix_batch_rows_batch_id_row_index", "batch_id", "row_index"),
+    )
+
     batch = relationship("Batch", back_populates="rows")
     transaction = relationship("Transaction", back_populates="batch_row")
+
+
+class OutboxEvent(Base):
+    """Integration events written in the same DB transaction as the change they describe."""
+    __tablename__ = "outbox_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_type = Column(String, nullable=False)
+    aggregate_type = Column(String, nullable=False)
+    aggregate_id = Column(Integer, nullable=True)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    dispatched_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(String, nullable=True)
+
+    __table_args__ = (
+        # The dispatcher only ever scans undelivered events, oldest first
+        Index("ix_outbox_events_pending", "id", postgresql_where=dispatched_at.is_(None), sqlite_where=dispatched_at.is_(None)),
+    )
+
+class JobCheckpoint(Base):
+    """Resume position of an incremental background job (e.g. the ledger reconciliation)."""
+    __tablename__ = "job_checkpoints"
+
+    name = Column(String, primary_key=True)
+    position = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class WalletLedgerTotal(Base):
+    """Per-wallet net ledger flow up to the reconciliation checkpoint."""
+    __tablename__ = "wallet_ledger_totals"
+
+    wallet_id = Column(Integer, ForeignKey("wallets.id"), primary_key=True)
+    net = Column(BigInteger, default=0, nullable=False)
+
+class WalletDailyRollup(Base):
+    """Per-wallet, per-UTC-day ledger aggregates up to the rollup checkpoint (see app/services/rollups.py)."""
+    __tablename__ = "wallet_daily_rollups"
+
+    wallet_id = Column(Integer, ForeignKey("wallets.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    inflow = Column(BigInteger, default=0, nullable=False)
+    outflow = Column(BigInteger, default=0, nullable=False)
+    credit_count = Column(Integer, default=0, nullable=False)
+    debit_count = Column(Integer, default=0, nullable=False)
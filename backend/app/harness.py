@@ -0,0 +1,267 @@
+"""
+In-process harness: drives the real ASGI app through Starlette's TestClient, with
+no server and no docker-compose stack. Run from the backend directory:
+    python -m app.harness check     correctness checks (exit status 1 on any failure)
+    python -m app.harness bench     transfer / bulk / batch throughput
+DATABASE_URL defaults to a fresh SQLite file (WAL, BEGIN IMMEDIATE; see db.py);
+point it at Postgres to run the same checks against the production engine.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+PIN = "1234"
+
+def _prepare_environment(workdir: str):
+    # Must run before anything under app/ is imported: the engine and config read the environment once
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'harness.db')}")
+    os.environ.setdefault("OUTBOX_DISPATCHER_ENABLED", "1")
+    os.environ.setdefault("ROLLUP_JOB_ENABLED", "1")
+    os.environ.setdefault("OUTBOX_FILE_PATH", os.path.join(workdir, "outbox-events.ndjson"))
+    # Admission would shed most of a same-wallet burst with 429 before it reaches the database
+    os.environ.setdefault("ADMISSION_MAX_PER_SOURCE", "64")
+
+class Harness:
+    """Thin client helpers; every user gets a run-unique name so a persistent Postgres can be reused."""
+
+    def __init__(self, client):
+        self.client = client
+        self.run_id = uuid.uuid4().hex[:8]
+        self._users = 0
+
+    def user(self, deposit: float = 0):
+        self._users += 1
+        name = f"harness_{self.run_id}_{self._users}"
+        r = self.client.post("/users/", json={"username": name, "email": f"{name}@example.com", "password": "harness", "pin": PIN})
+        r.raise_for_status()
+        token = self.client.post("/users/token", data={"username": name, "password": "harness"}).json()["access_token"]
+        wallet_id = r.json()["wallet"]["id"]
+        if deposit:
+            self.client.post(f"/wallets/{wallet_id}/deposit", json={"amount": deposit}).raise_for_status()
+        return wallet_id, {"Authorization": f"Bearer {token}"}
+
+    def key(self, label: str) -> str:
+        return f"harness-{self.run_id}-{label}"
+
+    def transfer(self, headers: dict, source: int, target: int, amount: float, key: str):
+        return self.client.post("/transfer/", headers=headers, json={
+            "from_wallet_id": source, "to_wallet_id": target, "amount": amount, "idempotency_key": key, "pin": PIN,
+        })
+
+    def balances(self, *wallet_ids: int) -> list:
+        return [w["balance"] for w in self.client.post("/wallets/balances", json=list(wallet_ids)).json()]
+
+    def run_batch(self, headers: dict, source: int, rows: list):
+        batch_id = self.client.post("/batches/", json={"source_wallet_id": source}, headers=headers).json()["id"]
+        payload = "recipient_id,amount\n" + "".join(f"{recipient},{amount}\n" for recipient, amount in rows)
+        r = self.client.post(f"/batches/{batch_id}/execute", files={"file": ("payouts.csv", payload)},
+                             data={"pin": PIN, "allow_duplicate": "true"}, headers=headers)
+        r.raise_for_status()
+        return self.client.get(f"/batches/{batch_id}", headers=headers).json()
+
+# Checks ------------------------------------------------------------------------
+
+def check_engine_profile(h: Harness):
+    """SQLite only: WAL, foreign keys, and the write lock being held from BEGIN (the FOR UPDATE stand-in)."""
+    from sqlalchemy import text
+    from app.database.db import SessionLocal, engine
+
+    if engine.dialect.name != "sqlite":
+        return True, {"dialect": engine.dialect.name, "skipped": "SQLite profile only"}
+    with engine.connect() as conn:
+        journal_mode = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+        foreign_keys = conn.exec_driver_sql("PRAGMA foreign_keys").scalar()
+
+    # A read-only transaction is opened, then a second connection tries to take the write lock without waiting
+    reader = SessionLocal()
+    try:
+        reader.execute(text("SELECT 1"))
+        probe = sqlite3.connect(engine.url.database, timeout=0, isolation_level=None)
+        try:
+            probe.execute("BEGIN IMMEDIATE")
+            probe.execute("ROLLBACK")
+            write_lock_held = False
+        except sqlite3.OperationalError:
+            write_lock_held = True
+        finally:
+            probe.close()
+    finally:
+        reader.close()
+
+    ok = journal_mode == "wal" and foreign_keys == 1 and write_lock_held
+    return ok, {"journal_mode": journal_mode, "foreign_keys": foreign_keys, "write_lock_held_from_begin": write_lock_held}
+
+def check_no_double_spend(h: Harness):
+    """20 concurrent 10.00 transfers from a 100.00 wallet: exactly 10 commit, the balance never goes negative."""
+    source, headers = h.user(deposit=100)
+    target, _ = h.user()
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        codes = list(pool.map(lambda i: h.transfer(headers, source, target, 10, h.key(f"spend-{i}")).status_code, range(20)))
+    balances = h.balances(source, target)
+    ok = codes.count(200) == 10 and codes.count(400) == 10 and balances == [0.0, 100.0]
+    return ok, {"status_codes": sorted(codes), "balances": balances}
+
+def check_idempotent_replay(h: Harness):
+    """The same idempotency key sent concurrently commits once and every response names that one transaction."""
+    source, headers = h.user(deposit=50)
+    target, _ = h.user()
+    key = h.key("replay")
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(pool.map(lambda _: h.transfer(headers, source, target, 5, key), range(8)))
+    ids = {r.json().get("id") for r in responses if r.status_code == 200}
+    balances = h.balances(source, target)
+    ok = all(r.status_code == 200 for r in responses) and len(ids) == 1 and balances == [45.0, 5.0]
+    return ok, {"status_codes": sorted(r.status_code for r in responses), "transaction_ids": sorted(ids), "balances": balances}
+
+def check_multi_leg_atomic(h: Harness):
+    """A multi-leg transfer whose net debit exceeds the balance applies no leg at all."""
+    source, headers = h.user(deposit=30)
+    first, _ = h.user()
+    second, _ = h.user()
+    r = h.client.post("/transfer/multi", headers=headers, json={"idempotency_key": h.key("multi"), "pin": PIN, "legs": [
+        {"from_wallet_id": source, "to_wallet_id": first, "amount": 20},
+        {"from_wallet_id": source, "to_wallet_id": second, "amount": 20},
+    ]})
+    balances = h.balances(source, first, second)
+    return r.status_code == 400 and balances == [30.0, 0.0, 0.0], {"status_code": r.status_code, "balances": balances}
+
+def check_batch_payout(h: Harness):
+    """CSV batch with one unknown recipient: the other rows pay out, that row fails, counters match."""
+    source, headers = h.user(deposit=1000)
+    recipient, _ = h.user()
+    rows = [(recipient, "1.25")] * 49 + [(2 ** 31 - 1, "1.00")]
+    batch = h.run_batch(headers, source, rows)
+    balances = h.balances(source, recipient)
+    ok = (batch["success_count"], batch["failure_count"]) == (49, 1) and balances == [938.75, 61.25]
+    return ok, {"status": batch["status"], "success_count": batch["success_count"],
+                "failure_count": batch["failure_count"], "balances": balances}
+
+def check_ledger_reconciles(h: Harness):
+    """Every balance equals its ledger flows (full re-scan, nothing left unsettled)."""
+    from app.database.db import SessionLocal
+    from app.services import reconciliation
+
+    db = SessionLocal()
+    try:
+        report = reconciliation.reconcile(db, full=True, settle_seconds=0)
+    finally:
+        db.close()
+    return report["ok"], {key: report[key] for key in ("wallets_checked", "wallet_discrepancy_count", "batches_checked", "batch_discrepancy_count")}
+
+CHECKS = [
+    check_engine_profile,
+    check_no_double_spend,
+    check_idempotent_replay,
+    check_multi_leg_atomic,
+    check_batch_payout,
+    check_ledger_reconciles,
+]
+
+def run_checks(h: Harness) -> bool:
+    all_ok = True
+    for check in CHECKS:
+        name = check.__name__[len("check_"):]
+        started = time.perf_counter()
+        try:
+            ok, details = check(h)
+        except Exception as e:
+            ok, details = False, {"error": repr(e)}
+        all_ok = all_ok and ok
+        result = {"check": name, "ok": ok, "seconds": round(time.perf_counter() - started, 3), **details}
+        sys.stdout.write(json.dumps(result) + "\n")
+    return all_ok
+
+# Benchmarks --------------------------------------------------------------------
+
+def _rate(operations: int, seconds: float) -> dict:
+    return {"operations": operations, "seconds": round(seconds, 3), "per_second": round(operations / seconds, 1) if seconds else None}
+
+def bench_transfers(h: Harness, transfers: int, threads: int) -> dict:
+    """POST /transfer/ from `threads` senders at once (PIN check included, as in production)."""
+    senders = [h.user(deposit=transfers) for _ in range(threads)]
+    target, _ = h.user()
+    latencies = []
+
+    def send(i):
+        source, headers = senders[i % threads]
+        started = time.perf_counter()
+        r = h.transfer(headers, source, target, 1, h.key(f"bench-{i}"))
+        latencies.append(time.perf_counter() - started)
+        return r.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        codes = list(pool.map(send, range(transfers)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {"bench": "transfers", "threads": threads, **_rate(transfers, elapsed),
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+            "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 2),
+            "non_200": len(codes) - codes.count(200)}
+
+def bench_bulk_transfers(h: Harness, items: int) -> dict:
+    """POST /transfer/bulk: one NDJSON stream, PIN verified once."""
+    source, headers = h.user(deposit=items)
+    target, _ = h.user()
+    body = "".join(
+        json.dumps({"from_wallet_id": source, "to_wallet_id": target, "amount": 1, "idempotency_key": h.key(f"bulk-{i}")}) + "\n"
+        for i in range(items)
+    )
+    started = time.perf_counter()
+    r = h.client.post("/transfer/bulk", content=body, headers={**headers, "X-Transaction-PIN": PIN})
+    elapsed = time.perf_counter() - started
+    summary = json.loads(r.text.strip().splitlines()[-1])["summary"]
+    return {"bench": "bulk_transfers", **_rate(items, elapsed), "summary": summary}
+
+def bench_batch(h: Harness, rows: int) -> dict:
+    """CSV batch payout: upload, row sync and execution of `rows` payouts."""
+    source, headers = h.user(deposit=rows)
+    recipients = [h.user()[0] for _ in range(10)]
+    started = time.perf_counter()
+    batch = h.run_batch(headers, source, [(recipients[i % 10], "1.00") for i in range(rows)])
+    elapsed = time.perf_counter() - started
+    return {"bench": "batch", **_rate(rows, elapsed), "status": batch["status"], "success_count": batch["success_count"]}
+
+def run_bench(h: Harness, args) -> bool:
+    for result in (
+        bench_transfers(h, args.transfers, args.threads),
+        bench_bulk_transfers(h, args.bulk_items),
+        bench_batch(h, args.batch_rows),
+    ):
+        sys.stdout.write(json.dumps(result) + "\n")
+    return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.harness", description="In-process correctness checks and benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("check", help="Run the correctness checks (exit status 1 on failure)")
+    bench = commands.add_parser("bench", help="Measure transfer, bulk transfer and batch throughput")
+    bench.add_argument("--transfers", type=int, default=200)
+    bench.add_argument("--threads", type=int, default=8)
+    bench.add_argument("--bulk-items", type=int, default=2000)
+    bench.add_argument("--batch-rows", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="gwallet-harness-") as workdir:
+        _prepare_environment(workdir)
+        from fastapi.testclient import TestClient
+        from app.database.db import engine
+        from app.main import app
+
+        sys.stdout.write(json.dumps({"database": engine.url.render_as_string(hide_password=True)}) + "\n")
+        # Entering the client runs the lifespan: outbox dispatcher, rollup job, scheduler as in a worker
+        with TestClient(app) as client:
+            h = Harness(client)
+            ok = run_checks(h) if args.command == "check" else run_bench(h, args)
+        engine.dispose()
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
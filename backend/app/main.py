@@ -1,12 +1,55 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from app.database import models, db
-from app.api import users, wallets, transfer, batch
+from app.api import users, wallets, transfer, batch, notifications
+from app.core.metrics import metrics, aggregate_snapshots
+from app.core.conditional import SelectiveGZipMiddleware
+from app.services.batch_scheduler import batch_scheduler
+from app.core.notifications import hub
+from app.core.admission import transfer_admission
+from app.core.retry import contention
+from app.core import config
+from app.services.outbox_dispatcher import build_dispatcher
+from app.services.rollups import RollupJob
+from app.services import provisioning
 
 # Create tables
-models.Base.metadata.create_all(bind=db.engine)
+db.init_schema()
 
-app = FastAPI(title="G-Wallet Backend (Decoupled)")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One LISTEN connection per worker process feeds its WebSocket subscribers
+    hub.start(db.engine)
+    # Outbox delivery stays off the request path (opt-in); SKIP LOCKED lets every worker run one
+    dispatcher = build_dispatcher() if config.OUTBOX_DISPATCHER_ENABLED else None
+    if dispatcher:
+        dispatcher.start()
+    # Daily statement rollups, advanced from their checkpoint off the request path
+    rollup_job = RollupJob() if config.ROLLUP_JOB_ENABLED else None
+    if rollup_job:
+        rollup_job.start()
+    # Batches left PROCESSING by a recycled or crashed worker are resumed by whoever sees them first
+    batch_scheduler.start_recovery()
+    # Under the multi-worker launcher every worker publishes its metrics for /metrics
+    metrics_sharing = metrics.start_sharing(config.METRICS_MULTIPROC_DIR, config.METRICS_SHARE_INTERVAL) \
+        if config.METRICS_MULTIPROC_DIR else None
+    yield
+    if metrics_sharing:
+        metrics_sharing.set()
+        metrics.write_snapshot(config.METRICS_MULTIPROC_DIR)
+    batch_scheduler.stop_recovery()
+    if rollup_job:
+        rollup_job.stop()
+    if dispatcher:
+        dispatcher.stop()
+    # Hashing processes are started lazily by the first bulk provisioning request
+    provisioning.shutdown_pool()
+    hub.stop()
+
+# orjson-backed responses app-wide; list endpoints return pre-shaped rows directly
+app = FastAPI(title="G-Wallet Backend (Decoupled)", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # Enable CORS for the frontend container
 app.add_middleware(
@@ -15,9 +58,27 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+# Compress large payloads (history pages, batch listings)
+app.add_middleware(SelectiveGZipMiddleware, minimum_size=1024)
+
 app.include_router(users.router, prefix="/users", tags=["users"])
 app.include_router(wallets.router, prefix="/wallets", tags=["wallets"])
 app.include_router(transfer.router, prefix="/transfer", tags=["transfer"])
 app.include_router(batch.router, prefix="/batches", tags=["batches"])
+app.include_router(notifications.router, prefix="/ws", tags=["notifications"])
+
+metrics.register_collector("batch_scheduler", batch_scheduler.stats)
+metrics.register_collector("notifications", hub.stats)
+metrics.register_collector("admission", transfer_admission.stats)
+metrics.register_collector("contention", contention.top)
+
+@app.get("/metrics", tags=["ops"])
+def read_metrics():
+    if config.METRICS_MULTIPROC_DIR:
+        # Publish our own numbers first so this worker's view is never stale
+        metrics.write_snapshot(config.METRICS_MULTIPROC_DIR)
+        return aggregate_snapshots(config.METRICS_MULTIPROC_DIR)
+    return metrics.snapshot()
@@ -1,8 +1,9 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 from typing import List, Optional
 from datetime import datetime
 from .transaction import Transaction
 from app.database.models import BatchStatus, BatchRowStatus
+from app.core.money import Money, MoneyIn
 
 class BatchBase(BaseModel):
     source_wallet_id: int
@@ -13,7 +14,7 @@ class BatchCreate(BatchBase):
 
 class BatchItem(BaseModel):
     recipient_id: int
-    amount: float
+    amount: MoneyIn
 
 class BatchExecute(BaseModel):
     items: List[BatchItem]
@@ -24,7 +25,7 @@ class BatchRow(BaseModel):
     batch_id: int
     row_index: int
     recipient_id: int
-    amount: float
+    amount: Money
     status: BatchRowStatus
     transaction_id: Optional[int] = None
     error_message: Optional[str] = None
@@ -36,17 +37,51 @@ class Batch(BatchBase):
     id: int
     user_id: int
     status: BatchStatus
-    total_amount: float
+    total_amount: Money
     item_count: int
     success_count: int
     failure_count: int
     last_processed_index: int
+    reserved_amount: Optional[Money] = 0
+    content_digest: Optional[str] = None
     timestamp: datetime
     rows: List[BatchRow] = []
 
     class Config:
         from_attributes = True
 
+class BatchSummary(BaseModel):
+    """List-view projection of a batch (GET /batches/?view=summary)."""
+    id: int
+    source_wallet_id: int
+    status: BatchStatus
+    total_amount: Money
+    item_count: int
+    success_count: int
+    failure_count: int
+    timestamp: datetime
+
+    class Config:
+        from_attributes = True
+
 class BatchCompensationRequest(BaseModel):
     row_indices: List[int]
     pin: str
+
+class BatchBulkCompensationRequest(BaseModel):
+    """
+    Bulk reversal selector: either an inclusive index range or every successful row.
+    """
+    pin: str
+    start_index: Optional[int] = Field(None, ge=0)
+    end_index: Optional[int] = Field(None, ge=0)
+    all_successful: bool = False
+    chunk_size: int = Field(500, gt=0, le=5000)
+
+    @model_validator(mode="after")
+    def check_selector(self):
+        if not self.all_successful and (self.start_index is None or self.end_index is None):
+            raise ValueError("Provide start_index and end_index, or set all_successful")
+        if not self.all_successful and self.start_index > self.end_index:
+            raise ValueError("start_index must be <= end_index")
+        return self
@@ -1,18 +1,41 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, field_validator, model_validator
+from typing import List, Optional
 from datetime import datetime
+from app.core import config
+from app.core.money import Money, MoneyIn
+
+# Ledger keys of multi-leg transfer legs (multi_{key}_leg_{i}), reserved for /transfer/multi
+MULTI_LEG_KEY_PREFIX = "multi_"
+# Every namespace the service writes ledger keys into itself: batch rows, their reversals,
+# keyless deposits and multi-leg legs. A caller key in one of them could pre-occupy a future entry
+RESERVED_KEY_PREFIXES = (MULTI_LEG_KEY_PREFIX, "batch_", "reversal_batch_", "deposit_")
+
+def check_caller_key(key: Optional[str]) -> Optional[str]:
+    """Rejects caller-supplied idempotency keys in a reserved namespace (422 via the schema)."""
+    for prefix in RESERVED_KEY_PREFIXES:
+        if key and key.startswith(prefix):
+            raise ValueError(f"Idempotency keys starting with '{prefix}' are reserved")
+    return key
 
 class TransactionBase(BaseModel):
     from_wallet_id: int
     to_wallet_id: int
-    amount: float
 
 class TransactionCreate(TransactionBase):
+    amount: MoneyIn
     idempotency_key: str
     pin: str
     batch_id: Optional[int] = None
 
+    @field_validator("idempotency_key")
+    @classmethod
+    def check_key(cls, key: str) -> str:
+        return check_caller_key(key)
+
 class Transaction(TransactionBase):
+    # Deposits are ledger entries without a source wallet
+    from_wallet_id: Optional[int] = None
+    amount: Money
     id: int
     idempotency_key: str
     timestamp: datetime
@@ -20,3 +43,32 @@ class Transaction(TransactionBase):
 
     class Config:
         from_attributes = True
+
+class TransferLeg(TransactionBase):
+    amount: MoneyIn
+
+class MultiTransferCreate(BaseModel):
+    """
+    Split payment: every leg commits together or none does.
+    `idempotency_key` covers the whole group.
+    """
+    legs: List[TransferLeg]
+    idempotency_key: str
+    pin: str
+
+    @model_validator(mode="after")
+    def check_legs(self):
+        if not self.legs:
+            raise ValueError("At least one leg is required")
+        if len(self.legs) > config.TRANSFER_MAX_LEGS:
+            raise ValueError(f"At most {config.TRANSFER_MAX_LEGS} legs per transfer")
+        for leg in self.legs:
+            if leg.amount <= 0:
+                raise ValueError("Leg amounts must be positive")
+            if leg.from_wallet_id == leg.to_wallet_id:
+                raise ValueError("A leg cannot move funds from a wallet to itself")
+        return self
+
+class MultiTransfer(BaseModel):
+    idempotency_key: str
+    transactions: List[Transaction]
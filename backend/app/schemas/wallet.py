@@ -1,6 +1,9 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, field_validator
+from typing import List, Optional
+from datetime import date
 from app.database.models import WalletStatus
+from app.core.money import Money, MoneyIn
+from app.schemas.transaction import check_caller_key
 
 class WalletBase(BaseModel):
     pass
@@ -11,11 +14,43 @@ class WalletCreate(WalletBase):
 class Wallet(WalletBase):
     id: int
     user_id: int
-    balance: float
+    balance: Money
     status: WalletStatus
 
     class Config:
         from_attributes = True
 
 class WalletDeposit(BaseModel):
-    amount: float
+    amount: MoneyIn
+    idempotency_key: Optional[str] = None
+
+    @field_validator("idempotency_key")
+    @classmethod
+    def check_key(cls, key: Optional[str]) -> Optional[str]:
+        return check_caller_key(key)
+
+class WalletDepositItem(WalletDeposit):
+    wallet_id: int
+
+class WalletBulkDeposit(BaseModel):
+    deposits: List[WalletDepositItem]
+
+class WalletFlowTotals(BaseModel):
+    inflow: Money
+    outflow: Money
+    net: Money
+    credit_count: int
+    debit_count: int
+
+class WalletDailyTotals(WalletFlowTotals):
+    day: date
+
+class WalletTotals(BaseModel):
+    """Date-range totals (since <= day < until, UTC days) served from the daily rollups."""
+    wallet_id: int
+    since: Optional[date] = None
+    until: Optional[date] = None
+    totals: WalletFlowTotals
+
+class WalletStatement(WalletTotals):
+    days: List[WalletDailyTotals]
@@ -0,0 +1,158 @@
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.orm import Session
+from app.core import config
+from app.database.db import SessionLocal
+from app.schemas import transaction as transaction_schema
+from app.crud import batch as batch_crud
+from app.crud import transaction as transaction_crud
+from app.core import events
+from app.database.models import BatchStatus, BatchRowStatus
+
+def process_batch_rows(db: Session, batch_id: int) -> BatchStatus:
+    """
+    Row execution loop shared by every batch entry point.
+    Works purely from the persisted `batch_rows`, so it can run outside the
+    request that uploaded the file (see services.batch_scheduler).
+    Publishes progress events on each aggregated flush.
+    """
+    if config.BATCH_FANOUT_WORKERS > 1:
+        return process_batch_rows_parallel(db, batch_id, config.BATCH_FANOUT_WORKERS, config.BATCH_FANOUT_CHUNK_SIZE)
+
+    batch = batch_crud.get_batch(db, batch_id)
+    source_wallet_id = batch.source_wallet_id
+    if batch.reserved_amount:
+        # Left behind by a fan-out run that died (or ran with BATCH_FANOUT_WORKERS > 1)
+        batch_crud.settle_reservation(db, batch_id, source_wallet_id)
+        batch = batch_crud.get_batch(db, batch_id)
+    db_rows = batch_crud.get_batch_rows(db, batch_id)
+
+    # Update Status to PROCESSING
+    if batch.status == BatchStatus.PENDING:
+        batch_crud.update_batch_progress(db, batch_id, status=BatchStatus.PROCESSING)
+
+    # Process Rows starting from last_processed_index + 1
+    # This provides RESUMABILITY if the server crashed previously
+    start_index = batch.last_processed_index + 1
+    reporter = events.BatchProgressReporter(
+        batch_id, total_rows=len(db_rows), start_index=start_index,
+        success_count=batch.success_count, failure_count=batch.failure_count
+    )
+    # Counters + checkpoint are aggregated in memory and flushed as atomic increments
+    progress = batch_crud.BatchProgressAggregator(db, batch_id, on_flush=reporter.on_flush)
+    reporter.started()
+
+    # Plain values: ORM rows expire on every per-row commit. Drop the rows too, or
+    # each commit walks all of them again (quadratic in the batch size)
+    pending = [(row.id, row.row_index, row.recipient_id, row.amount) for row in db_rows[start_index:]]
+    del db_rows
+
+    for row_id, index, recipient_id, amount in pending:
+        try:
+            # Idempotency Key: batch_{id}_row_{index}
+            # Reuse logic to ensure retries are safe
+            idempotency_key = f"batch_{batch_id}_row_{index}"
+
+            # Stored minor units: already exact, so skip the decimal request parser
+            tx_data = transaction_schema.TransactionCreate.model_construct(
+                from_wallet_id=source_wallet_id,
+                to_wallet_id=recipient_id,
+                amount=amount,
+                idempotency_key=idempotency_key,
+                batch_id=batch_id,
+                pin="BATCH_EXECUTION"
+            )
+
+            # Core transfer logic (Hardened)
+            tx = transaction_crud.create_transfer_secure(db, tx_data)
+
+            # Update row tracking
+            batch_crud.update_batch_row(db, row_id, status=BatchRowStatus.SUCCESS, transaction_id=tx.id)
+            # Update batch progress
+            progress.record(index, success=True, amount=amount)
+
+        except Exception as e:
+            # Individual row failure: Track error but don't stop the whole batch
+            batch_crud.update_batch_row(db, row_id, status=BatchRowStatus.FAILED, error_message=str(e))
+            progress.record(index, success=False)
+
+    progress.flush()
+
+    # Final Status Transition
+    batch = batch_crud.get_batch(db, batch_id)
+    final_status = BatchStatus.COMPLETED if batch.failure_count == 0 else BatchStatus.PARTIALLY_FAILED
+    batch_crud.update_batch_progress(db, batch_id, status=final_status)
+    reporter.finished(final_status.value)
+    return final_status
+
+def _credit_row(batch_id: int, source_wallet_id: int, row: tuple):
+    # Each fan-out task runs on its own pooled connection
+    db = SessionLocal()
+    try:
+        _, index, recipient_id, amount = row
+        return transaction_crud.credit_reserved_transfer(
+            db, batch_id, source_wallet_id, recipient_id, amount, batch_crud.batch_row_key(batch_id, index)
+        )
+    finally:
+        db.close()
+
+def process_batch_rows_parallel(db: Session, batch_id: int, workers: int, chunk_size: int) -> BatchStatus:
+    """
+    PARALLEL FAN-OUT MODE:
+    The source wallet debit is the only real serialization point, so per chunk:
+    1. Reserve: one locked step debits the chunk's aggregate amount from the source.
+    2. Credit: recipients are credited in parallel across `workers` connections,
+       each with its own idempotency key (batch_{id}_row_{index}).
+    3. Settle: unused reservation goes back to the source, rows are finalized.
+    A reservation left behind by a crash is settled before anything else runs.
+    """
+    batch = batch_crud.get_batch(db, batch_id)
+    source_wallet_id = batch.source_wallet_id
+
+    if batch.reserved_amount:
+        batch_crud.settle_reservation(db, batch_id, source_wallet_id)
+        batch = batch_crud.get_batch(db, batch_id)
+
+    if batch.status == BatchStatus.PENDING:
+        batch_crud.update_batch_progress(db, batch_id, status=BatchStatus.PROCESSING)
+
+    db_rows = batch_crud.get_batch_rows(db, batch_id)
+    start_index = batch.last_processed_index + 1
+    reporter = events.BatchProgressReporter(
+        batch_id, total_rows=len(db_rows), start_index=start_index,
+        success_count=batch.success_count, failure_count=batch.failure_count
+    )
+    # Flushed explicitly once per chunk, after the chunk is settled
+    progress = batch_crud.BatchProgressAggregator(
+        db, batch_id, flush_rows=len(db_rows) + 1, flush_interval=float("inf"), on_flush=reporter.on_flush
+    )
+    reporter.started()
+
+    pending = [(row.id, row.row_index, row.recipient_id, row.amount) for row in db_rows[start_index:]]
+    del db_rows
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"batch-{batch_id}-fanout") as pool:
+        for offset in range(0, len(pending), chunk_size):
+            chunk = pending[offset:offset + chunk_size]
+            reserved, outcomes = batch_crud.reserve_chunk(db, batch_id, source_wallet_id, chunk)
+
+            futures = {row[1]: pool.submit(_credit_row, batch_id, source_wallet_id, row) for row in reserved}
+            errors = {}
+            for index, future in futures.items():
+                try:
+                    outcomes[index] = (True, future.result(), None)
+                except Exception as e:
+                    errors[index] = str(e)
+                    outcomes[index] = (False, None, str(e))
+
+            batch_crud.settle_reservation(db, batch_id, source_wallet_id, errors)
+
+            for _, index, _, amount in chunk:
+                progress.record(index, success=outcomes[index][0], amount=amount)
+            progress.flush()
+
+    # Final Status Transition
+    batch = batch_crud.get_batch(db, batch_id)
+    final_status = BatchStatus.COMPLETED if batch.failure_count == 0 else BatchStatus.PARTIALLY_FAILED
+    batch_crud.update_batch_progress(db, batch_id, status=final_status)
+    reporter.finished(final_status.value)
+    return final_status
@@ -0,0 +1,220 @@
+import itertools
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core import config
+from app.crud import batch as batch_crud
+from app.database.db import SessionLocal, engine
+from app.database.models import Batch, BatchStatus
+from app.services.batch_executor import process_batch_rows
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for pg_advisory_lock(key, source_wallet_id), next to db.SCHEMA_LOCK_KEY
+SOURCE_LOCK_KEY = 7_240_312
+
+@contextmanager
+def source_wallet_lock(source_wallet_id: int):
+    """
+    CROSS-PROCESS SERIALIZATION: the scheduler's queues only cover its own worker
+    process, so a run also holds a session-level Postgres advisory lock on the
+    source wallet, on a dedicated autocommit connection (no idle transaction).
+    A second worker asked to run a batch on the same source waits here; the lock
+    dies with the connection if the worker does. No-op on SQLite (single process).
+    """
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    params = {"key": SOURCE_LOCK_KEY, "source": source_wallet_id}
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:key, :source)"), params)
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key, :source)"), params)
+
+def source_wallet_busy(source_wallet_id: int) -> bool:
+    """
+    True if some worker holds source_wallet_lock for this source, i.e. is running a
+    batch on it. A non-blocking probe (try-lock, released at once). Always False on
+    SQLite, where the scheduler of the single process knows its own runs.
+    """
+    if engine.dialect.name != "postgresql":
+        return False
+    params = {"key": SOURCE_LOCK_KEY, "source": source_wallet_id}
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key, :source)"), params).scalar()
+        if acquired:
+            conn.execute(text("SELECT pg_advisory_unlock(:key, :source)"), params)
+    return not acquired
+
+@dataclass
+class _Job:
+    batch_id: int
+    source_wallet_id: int
+    tenant_id: int
+    seq: int
+    future: Future = field(default_factory=Future)
+
+class BatchScheduler:
+    """
+    PER-SOURCE BATCH SCHEDULER:
+    - Serialization: at most one batch per source wallet runs at a time, so batches
+      sharing a source never interleave FOR UPDATE locks on that wallet row. Within
+      a process by the queues below, across gunicorn workers by source_wallet_lock.
+    - Parallelism: different sources run concurrently up to `max_workers`.
+    - Fairness: when a worker frees up, the tenant (batch owner) served least
+      recently goes first; FIFO within a tenant.
+    """
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers or config.BATCH_SCHEDULER_WORKERS
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="batch-worker")
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._queues: Dict[int, Deque[_Job]] = {}
+        self._jobs: Dict[int, _Job] = {}
+        self._active_sources: Set[int] = set()
+        # tenant -> dispatch tick of its last started batch (not its submission seq:
+        # an old job dispatched late must still count as recently served)
+        self._last_served: Dict[int, int] = {}
+        self._dispatch_tick = 0
+        self._recovery_stop: Optional[threading.Event] = None
+
+    def submit(self, batch_id: int, source_wallet_id: int, tenant_id: int) -> Future:
+        """
+        Queues a batch and returns a Future resolving to its final BatchStatus.
+        Submitting a batch that is already queued or running returns the existing Future.
+        """
+        with self._lock:
+            existing = self._jobs.get(batch_id)
+            if existing:
+                return existing.future
+            job = _Job(batch_id, source_wallet_id, tenant_id, next(self._seq))
+            self._jobs[batch_id] = job
+            self._queues.setdefault(source_wallet_id, deque()).append(job)
+            self._dispatch()
+            return job.future
+
+    def resume_orphaned(self, db: Session) -> List[int]:
+        """
+        RECOVERY SWEEP: a batch is PROCESSING only while a worker holds its source
+        wallet lock, so a PROCESSING batch that is neither queued here nor locked by
+        anyone was abandoned (worker recycled by max_requests, killed or crashed).
+        It is resubmitted: the run settles any reservation left behind and resumes
+        after last_processed_index. Returns the resubmitted batch ids.
+        """
+        stuck = db.query(Batch.id, Batch.source_wallet_id, Batch.user_id).filter(Batch.status == BatchStatus.PROCESSING).all()
+        db.rollback()
+        resumed = []
+        for batch_id, source_wallet_id, user_id in stuck:
+            with self._lock:
+                known = batch_id in self._jobs
+            if known or source_wallet_busy(source_wallet_id):
+                continue
+            self.submit(batch_id, source_wallet_id, user_id)
+            resumed.append(batch_id)
+        return resumed
+
+    def start_recovery(self, interval: float = None):
+        """Runs resume_orphaned now and then every `interval` seconds in a daemon thread."""
+        interval = config.BATCH_RECOVERY_INTERVAL if interval is None else interval
+        if not interval or self._recovery_stop:
+            return
+        self._recovery_stop = threading.Event()
+        threading.Thread(target=self._recover, args=(self._recovery_stop, interval), name="batch-recovery", daemon=True).start()
+
+    def stop_recovery(self):
+        if self._recovery_stop:
+            self._recovery_stop.set()
+        self._recovery_stop = None
+
+    def _recover(self, stop: threading.Event, interval: float):
+        while not stop.is_set():
+            db = SessionLocal()
+            try:
+                resumed = self.resume_orphaned(db)
+                if resumed:
+                    logger.warning("resumed orphaned batches %s", resumed)
+            except Exception:
+                db.rollback()
+                logger.exception("batch recovery sweep failed")
+            finally:
+                db.close()
+            stop.wait(interval)
+
+    def queue_position(self, batch_id: int) -> Optional[int]:
+        """0 = running, N = N batches ahead of it on the same source, None = unknown."""
+        with self._lock:
+            job = self._jobs.get(batch_id)
+            if not job:
+                return None
+            queue = self._queues.get(job.source_wallet_id, ())
+            if job not in queue:
+                return 0
+            return list(queue).index(job) + (1 if job.source_wallet_id in self._active_sources else 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "running": len(self._active_sources),
+                "queued": sum(len(q) for q in self._queues.values()),
+                "sources_waiting": sum(1 for src, q in self._queues.items() if q and src in self._active_sources),
+            }
+
+    def _dispatch(self):
+        # Caller holds self._lock
+        while len(self._active_sources) < self.max_workers:
+            job = self._next_job()
+            if not job:
+                return
+            self._queues[job.source_wallet_id].popleft()
+            self._active_sources.add(job.source_wallet_id)
+            self._dispatch_tick += 1
+            self._last_served[job.tenant_id] = self._dispatch_tick
+            self._executor.submit(self._run, job)
+
+    def _next_job(self) -> Optional[_Job]:
+        candidates = [
+            queue[0] for source, queue in self._queues.items()
+            if queue and source not in self._active_sources
+        ]
+        if not candidates:
+            return None
+        # Least recently served tenant first, then submission order
+        return min(candidates, key=lambda job: (self._last_served.get(job.tenant_id, 0), job.seq))
+
+    def _run(self, job: _Job):
+        db = SessionLocal()
+        try:
+            with source_wallet_lock(job.source_wallet_id):
+                # Read under the lock: another worker may just have finished this very batch
+                batch = batch_crud.get_batch(db, job.batch_id)
+                if batch is None:
+                    raise LookupError(f"Batch {job.batch_id} not found")
+                if batch.status in (BatchStatus.PENDING, BatchStatus.PROCESSING):
+                    result = process_batch_rows(db, job.batch_id)
+                else:
+                    result = batch.status
+            job.future.set_result(result)
+        except Exception as e:
+            job.future.set_exception(e)
+        finally:
+            db.close()
+            with self._lock:
+                self._active_sources.discard(job.source_wallet_id)
+                self._jobs.pop(job.batch_id, None)
+                if not self._queues.get(job.source_wallet_id):
+                    self._queues.pop(job.source_wallet_id, None)
+                self._dispatch()
+
+batch_scheduler = BatchScheduler()
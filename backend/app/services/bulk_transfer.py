@@ -0,0 +1,57 @@
+import json
+from typing import Dict, List, Tuple
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from app.crud import transaction as transaction_crud
+from app.crud import wallet as wallet_crud
+from app.schemas import transaction as transaction_schema
+
+def parse_item(line_no: int, raw: bytes, pin: str):
+    """NDJSON line -> TransactionCreate, or an error result. The PIN was verified once for the stream."""
+    try:
+        data = json.loads(raw)
+        if not isinstance(data, dict):
+            raise ValueError("Each line must be a JSON object")
+        data["pin"] = pin
+        return transaction_schema.TransactionCreate(**data), None
+    except (ValueError, ValidationError) as e:
+        return None, {"line": line_no, "status": "Invalid", "detail": str(e)}
+
+def process_transfer_chunk(db: Session, user_id: int, chunk: List[Tuple[int, object]], owned: Dict[int, bool]) -> List[dict]:
+    """
+    Executes one pipelined chunk of bulk transfers.
+    Every item goes through create_transfer_secure with its own idempotency key,
+    so a re-sent stream replays committed items instead of paying twice.
+    `owned` memoizes source-wallet ownership across chunks of the same stream.
+    """
+    results = []
+    for line_no, item in chunk:
+        if isinstance(item, dict):
+            # Parse error produced upstream
+            results.append(item)
+            continue
+
+        if item.from_wallet_id not in owned:
+            wallet = wallet_crud.get_wallet_snapshot(db, wallet_id=item.from_wallet_id)
+            owned[item.from_wallet_id] = bool(wallet) and wallet["user_id"] == user_id
+        if not owned[item.from_wallet_id]:
+            results.append({"line": line_no, "idempotency_key": item.idempotency_key, "status": "Failed", "detail": "You do not own the source wallet"})
+            continue
+
+        try:
+            txn = transaction_crud.create_transfer_secure(db, item)
+            results.append({
+                "line": line_no,
+                "idempotency_key": item.idempotency_key,
+                "status": "Committed",
+                "transaction": transaction_schema.Transaction.model_validate(txn).model_dump(mode="json"),
+            })
+        except HTTPException as e:
+            results.append({"line": line_no, "idempotency_key": item.idempotency_key, "status": "Failed", "detail": e.detail})
+        except Exception as e:
+            db.rollback()
+            results.append({"line": line_no, "idempotency_key": item.idempotency_key, "status": "Failed", "detail": str(e)})
+    return results
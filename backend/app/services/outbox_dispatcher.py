@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import requests
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from app.core import config
+from app.core.metrics import metrics
+from app.core.outbox import outbox_wakeup
+from app.database.db import SessionLocal
+from app.database.models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# --- Sinks -------------------------------------------------------------------------
+# A sink receives a list of event dicts and raises on failure; the whole batch is
+# then retried. Delivery is at-least-once: consumers de-duplicate on event "id".
+
+class FileSink:
+    """Appends events as NDJSON to a local file (fsynced per batch)."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def deliver(self, events: List[dict]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(event) + "\n" for event in events)
+            f.flush()
+            os.fsync(f.fileno())
+
+class QueueSink:
+    """In-process stand-in for a message broker (tests, local consumers)."""
+
+    def __init__(self, maxsize: int = 100000):
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def deliver(self, events: List[dict]):
+        for event in events:
+            self.queue.put(event, timeout=5)
+
+class WebhookSink:
+    """POSTs each batch as {"events": [...]} to a webhook; any non-2xx is a failure."""
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def deliver(self, events: List[dict]):
+        response = self._session.post(self.url, json={"events": events}, timeout=self.timeout)
+        response.raise_for_status()
+
+def build_sink(name: str = None):
+    name = name or config.OUTBOX_SINK
+    if name == "file":
+        return FileSink(config.OUTBOX_FILE_PATH)
+    if name == "queue":
+        return QueueSink()
+    if name == "webhook":
+        if not config.OUTBOX_WEBHOOK_URL:
+            raise ValueError("OUTBOX_WEBHOOK_URL is required for the webhook sink")
+        return WebhookSink(config.OUTBOX_WEBHOOK_URL)
+    return None
+
+# --- Dispatcher --------------------------------------------------------------------
+
+def _serialize(event: OutboxEvent) -> dict:
+    return {
+        "id": event.id,
+        "type": event.event_type,
+        "aggregate_type": event.aggregate_type,
+        "aggregate_id": event.aggregate_id,
+        "created_at": event.created_at.isoformat(),
+        "payload": event.payload,
+    }
+
+class OutboxDispatcher:
+    """
+    OUTBOX DISPATCHER:
+    - Claim: up to `batch_size` undelivered events, oldest first, with
+      FOR UPDATE SKIP LOCKED so several dispatchers (one per worker) split the
+      backlog instead of queueing on each other's row locks
+    - Deliver: one sink call per batch, outside of any wallet lock
+    - Acknowledge: dispatched_at set in the same transaction that holds the claim;
+      on sink failure the batch is released with attempts/last_error recorded
+    - Lag: `outbox.lag_seconds` (created -> delivered) and `outbox.oldest_pending_seconds`
+    - Retention: dispatched events older than `retention_seconds` are deleted
+      every OUTBOX_PURGE_INTERVAL, so the table holds the backlog plus a short tail
+    """
+
+    def __init__(self, sink, batch_size: int = None, poll_interval: float = None, retention_seconds: int = None):
+        self.sink = sink
+        self.batch_size = batch_size or config.OUTBOX_BATCH_SIZE
+        self.poll_interval = poll_interval or config.OUTBOX_POLL_INTERVAL
+        self.retention_seconds = config.OUTBOX_RETENTION_SECONDS if retention_seconds is None else retention_seconds
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._next_purge = 0.0
+
+    def run_once(self, db: Session) -> int:
+        """Delivers one batch; returns the number of events delivered."""
+        events = db.execute(
+            select(OutboxEvent)
+            .where(OutboxEvent.dispatched_at.is_(None))
+            .order_by(OutboxEvent.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not events:
+            db.rollback()
+            metrics.set_gauge("outbox.oldest_pending_seconds", 0.0)
+            return 0
+
+        started = time.perf_counter()
+        ids = [event.id for event in events]
+        try:
+            self.sink.deliver([_serialize(event) for event in events])
+        except Exception as e:
+            metrics.inc("outbox.delivery_failures")
+            db.execute(
+                update(OutboxEvent).where(OutboxEvent.id.in_(ids))
+                .values(attempts=OutboxEvent.attempts + 1, last_error=str(e)[:500])
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            raise
+
+        now = datetime.utcnow()
+        db.execute(
+            update(OutboxEvent).where(OutboxEvent.id.in_(ids))
+            .values(dispatched_at=now, attempts=OutboxEvent.attempts + 1, last_error=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+        metrics.inc("outbox.delivered", len(events))
+        metrics.observe("outbox.batch_seconds", time.perf_counter() - started)
+        for event in events:
+            metrics.observe("outbox.lag_seconds", (now - event.created_at).total_seconds())
+        self._record_backlog(db)
+        return len(events)
+
+    def drain(self, db: Session) -> int:
+        """Delivers until the backlog is empty (CLI / shutdown)."""
+        total = 0
+        while True:
+            delivered = self.run_once(db)
+            total += delivered
+            if delivered < self.batch_size:
+                return total
+
+    def purge(self, db: Session, chunk_size: int = 5000) -> int:
+        """Deletes dispatched events older than the retention window, `chunk_size` per transaction; returns the count."""
+        if not self.retention_seconds:
+            return 0
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention_seconds)
+        total = 0
+        while True:
+            # Oldest ids first: delivered rows sit at the low end of the primary key
+            ids = select(OutboxEvent.id).where(OutboxEvent.dispatched_at < cutoff).order_by(OutboxEvent.id).limit(chunk_size)
+            deleted = db.execute(
+                delete(OutboxEvent).where(OutboxEvent.id.in_(ids.scalar_subquery())).execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            total += deleted
+            if deleted < chunk_size:
+                break
+        metrics.inc("outbox.purged", total)
+        return total
+
+    def _record_backlog(self, db: Session):
+        # Oldest undelivered id, served by the partial pending index
+        oldest = db.execute(
+            select(OutboxEvent.created_at).where(OutboxEvent.dispatched_at.is_(None)).order_by(OutboxEvent.id).limit(1)
+        ).scalar()
+        db.rollback()
+        age = (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0
+        metrics.set_gauge("outbox.oldest_pending_seconds", age)
+
+    # Background loop ----------------------------------------------------------------
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        outbox_wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        self._thread = None
+
+    def _run(self):
+        backoff = self.poll_interval
+        while not self._stop.is_set():
+            outbox_wakeup.clear()
+            db = SessionLocal()
+            try:
+                delivered = self.run_once(db)
+                backoff = self.poll_interval
+                if time.monotonic() >= self._next_purge:
+                    self._next_purge = time.monotonic() + config.OUTBOX_PURGE_INTERVAL
+                    self.purge(db)
+            except Exception:
+                delivered = 0
+                backoff = min(backoff * 2, 60)
+                logger.exception("outbox delivery failed, retrying in %.1fs", backoff)
+            finally:
+                db.close()
+
+            if delivered < self.batch_size:
+                # Idle (or failing): sleep until the next poll or a commit that wrote events
+                outbox_wakeup.wait(backoff)
+
+def build_dispatcher() -> Optional[OutboxDispatcher]:
+    sink = build_sink()
+    return OutboxDispatcher(sink) if sink else None
@@ -0,0 +1,245 @@
+import csv
+import gzip
+import io
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.money import SCALE, to_minor
+
+# Rows per Arrow record batch when reading Parquet
+RECORD_BATCH_ROWS = 65536
+# Floats above 2**53 are not exact integers of minor units
+_MAX_EXACT_FLOAT = float(2 ** 53)
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_PARQUET_MAGIC = b"PAR1"
+_ARROW_FILE_MAGIC = b"ARROW1"
+_ARROW_STREAM_MAGIC = b"\xff\xff\xff\xff"
+
+# recipient_id is a 32-bit INTEGER column
+_MAX_RECIPIENT_ID = 2 ** 31 - 1
+
+class UnsupportedFormat(ValueError):
+    """The upload is in a format this server cannot read (e.g. its optional package is missing)."""
+
+class PayoutRows:
+    """
+    Parsed payout file as two int64 columns (recipient ids, amounts in minor units).
+    Validation and totals run on the arrays; rows only become Python tuples when
+    iterated for the row INSERT.
+    """
+
+    def __init__(self, recipients: np.ndarray, amounts: np.ndarray):
+        self.recipients = recipients
+        self.amounts = amounts
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return zip(self.recipients.tolist(), self.amounts.tolist())
+
+    def total(self) -> int:
+        """Exact sum of the amounts: the high and low 32 bits are summed separately, so int64 cannot overflow."""
+        high = int(np.sum(self.amounts >> 32))
+        low = int(np.sum(self.amounts & 0xFFFFFFFF))
+        return (high << 32) + low
+
+def detect_format(fileobj: BinaryIO) -> str:
+    """Sniffs the leading magic bytes (never the filename) and rewinds: csv, csv.gz, csv.zst, parquet, arrow or arrow-stream."""
+    head = fileobj.read(8)
+    fileobj.seek(0)
+    if head.startswith(_GZIP_MAGIC):
+        return "csv.gz"
+    if head.startswith(_ZSTD_MAGIC):
+        return "csv.zst"
+    if head.startswith(_PARQUET_MAGIC):
+        return "parquet"
+    if head.startswith(_ARROW_FILE_MAGIC):
+        return "arrow"
+    if head.startswith(_ARROW_STREAM_MAGIC):
+        return "arrow-stream"
+    return "csv"
+
+def read_payout_rows(fileobj: BinaryIO) -> PayoutRows:
+    """
+    PAYOUT FILE INGESTION -> PayoutRows (recipient ids, amounts in minor units):
+    - CSV, plain or gzip/zstd compressed: decompressed while streaming and read
+      with csv.reader (one list per row, no dict), amount text parsed exactly
+    - Parquet / Arrow IPC: read in record batches into typed numpy arrays; amounts
+      come from an `amount_minor` integer column or are converted from `amount`
+    - Recipient ids are range-checked on the whole column at once
+    Raises ValueError ("Invalid ... row N: ...") on bad content, UnsupportedFormat
+    when the reader for the format is not installed.
+    """
+    kind = detect_format(fileobj)
+    if kind.startswith("csv"):
+        rows = _read_csv(_open_text(fileobj, kind))
+    else:
+        rows = _read_columnar(fileobj, kind)
+    _check_recipients(rows.recipients)
+    return rows
+
+def _check_recipients(recipients: np.ndarray):
+    bad = (recipients <= 0) | (recipients > _MAX_RECIPIENT_ID)
+    if bad.any():
+        index = int(bad.argmax())
+        raise ValueError(f"Invalid row {index}: recipient_id {recipients[index]} is out of range")
+
+def _open_text(fileobj: BinaryIO, kind: str) -> io.TextIOWrapper:
+    if kind == "csv.gz":
+        raw = gzip.GzipFile(fileobj=fileobj, mode="rb")
+    elif kind == "csv.zst":
+        try:
+            import zstandard
+        except ImportError:
+            raise UnsupportedFormat("zstd-compressed uploads require the 'zstandard' package on the server")
+        raw = zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True)
+    else:
+        raw = fileobj
+    # utf-8-sig: spreadsheet exports often start with a BOM
+    return io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+
+def _read_csv(text: io.TextIOWrapper) -> PayoutRows:
+    reader = csv.reader(text)
+    try:
+        header = next(reader, [])
+        missing = [c for c in ("recipient_id", "amount") if c not in header]
+        if missing:
+            raise ValueError(f"Missing CSV columns: {', '.join(missing)}")
+        recipient_col, amount_col = header.index("recipient_id"), header.index("amount")
+
+        recipients, amounts = [], []
+        for row in reader:
+            if not row:
+                continue
+            try:
+                recipient, amount = int(row[recipient_col]), to_minor(row[amount_col])
+            except (IndexError, ValueError) as e:
+                raise ValueError(f"Invalid CSV row {len(amounts)}: {e}")
+            recipients.append(recipient)
+            amounts.append(amount)
+    except (UnicodeDecodeError, EOFError, OSError) as e:
+        # Truncated/corrupt compressed stream or non UTF-8 text
+        raise ValueError(f"Unreadable CSV upload: {e}")
+    try:
+        return PayoutRows(np.array(recipients, dtype=np.int64), np.array(amounts, dtype=np.int64))
+    except OverflowError:
+        raise ValueError("Invalid CSV upload: recipient_id out of range")
+
+def _read_columnar(fileobj: BinaryIO, kind: str) -> PayoutRows:
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise UnsupportedFormat("Parquet/Arrow uploads require the 'pyarrow' package on the server")
+
+    try:
+        if kind == "parquet":
+            parquet = pq.ParquetFile(fileobj)
+            columns = _payout_columns(parquet.schema_arrow.names)
+            batches = parquet.iter_batches(batch_size=RECORD_BATCH_ROWS, columns=columns)
+        elif kind == "arrow":
+            reader = ipc.open_file(fileobj)
+            columns = _payout_columns(reader.schema.names)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        else:
+            reader = ipc.open_stream(fileobj)
+            columns = _payout_columns(reader.schema.names)
+            batches = iter(reader)
+
+        recipients, amounts = [], []
+        offset = 0
+        for batch in batches:
+            recipients.append(_recipient_array(batch.column(columns[0]), offset))
+            amounts.append(_minor_array(batch.column(columns[1]), columns[1], offset))
+            offset += batch.num_rows
+    except pa.ArrowException as e:
+        raise ValueError(f"Unreadable {kind} upload: {e}")
+
+    if not recipients:
+        return PayoutRows(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    return PayoutRows(np.concatenate(recipients), np.concatenate(amounts))
+
+def _payout_columns(names: List[str]) -> List[str]:
+    amount = "amount_minor" if "amount_minor" in names else "amount"
+    missing = [c for c in ("recipient_id", amount) if c not in names]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    return ["recipient_id", amount]
+
+def _first_null(column) -> Optional[int]:
+    if not column.null_count:
+        return None
+    return column.is_null().to_numpy(zero_copy_only=False).argmax().item()
+
+def _row_error(offset: int, index: int, reason) -> ValueError:
+    return ValueError(f"Invalid row {offset + index}: {reason}")
+
+def _recipient_array(column, offset: int) -> np.ndarray:
+    import pyarrow as pa
+
+    null = _first_null(column)
+    if null is not None:
+        raise _row_error(offset, null, "recipient_id is empty")
+    if pa.types.is_integer(column.type):
+        return column.cast(pa.int64()).to_numpy()
+    # Text or float ids: per value, so the failing row can be reported
+    values = column.to_pylist()
+    out = np.empty(len(values), dtype=np.int64)
+    for index, value in enumerate(values):
+        try:
+            if isinstance(value, float) and not value.is_integer():
+                raise ValueError(f"invalid recipient_id {value!r}")
+            out[index] = int(value)
+        except (TypeError, ValueError, OverflowError) as e:
+            raise _row_error(offset, index, e)
+    return out
+
+def _minor_array(column, name: str, offset: int) -> np.ndarray:
+    """
+    Column -> int64 minor units, vectorized per record batch:
+    - amount_minor (integer): taken as is
+    - amount: integer = major units, decimal = exact rescale, float = nearest cent
+      only if that cent converts back to the same double (so 10.1 -> 1010 but
+      10.105 is rejected), text = parsed exactly per value
+    Anything the fast path refuses is re-parsed per value to name the bad row.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    null = _first_null(column)
+    if null is not None:
+        raise _row_error(offset, null, f"{name} is empty")
+
+    kind = column.type
+    try:
+        if name == "amount_minor":
+            if not pa.types.is_integer(kind):
+                raise ValueError(f"amount_minor must be an integer column, got {kind}")
+            return column.cast(pa.int64()).to_numpy()
+        if pa.types.is_integer(kind):
+            return pc.multiply_checked(column.cast(pa.int64()), SCALE).to_numpy()
+        if pa.types.is_decimal(kind):
+            # Casting to int64 fails if any value has a fraction of a cent left
+            return pc.multiply(column, pa.scalar(SCALE, pa.decimal128(3, 0))).cast(pa.int64()).to_numpy()
+        if pa.types.is_floating(kind):
+            values = column.cast(pa.float64()).to_numpy()
+            minor = np.rint(values * SCALE)
+            if np.all(np.abs(minor) < _MAX_EXACT_FLOAT) and np.array_equal(minor / SCALE, values):
+                return minor.astype(np.int64)
+    except pa.ArrowException:
+        pass
+
+    if name == "amount_minor":
+        raise ValueError(f"amount_minor must be an integer column, got {kind}")
+    out = np.empty(len(column), dtype=np.int64)
+    for index, value in enumerate(column.to_pylist()):
+        try:
+            out[index] = to_minor(value)
+        except (TypeError, ValueError) as e:
+            raise _row_error(offset, index, e)
+    return out
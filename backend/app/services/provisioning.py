@@ -0,0 +1,97 @@
+import csv
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from typing import Iterable, Iterator, Optional, TextIO
+
+from sqlalchemy.orm import Session
+
+from app.core import config, security
+from app.crud import user as user_crud
+
+REQUIRED_COLUMNS = ("username", "email", "password")
+
+# Hashing pool shared by every provisioning run of this process: started on first use,
+# shut down by the app lifespan / CLI (see shutdown_pool)
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def get_pool(processes: Optional[int] = None) -> ProcessPoolExecutor:
+    """The shared hashing pool; `processes` only applies when this call creates it."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # forkserver: never fork the (threaded) API process itself
+            context = multiprocessing.get_context("forkserver")
+            _pool = ProcessPoolExecutor(max_workers=processes or config.PROVISIONING_PROCESSES, mp_context=context)
+        return _pool
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def provision_users(db: Session, source: TextIO, chunk_size: int = None, processes: Optional[int] = None) -> Iterator[dict]:
+    """
+    BULK USER + WALLET PROVISIONING PIPELINE:
+    1. Stream the CSV (username,email,password[,pin]) chunk by chunk, never loading the file.
+    2. Hash passwords/PINs for the chunk in the shared process pool (PBKDF2 is CPU bound).
+    3. Insert users and wallets with multi-row INSERTs, one commit per chunk.
+    Yields one result dict per input line as soon as its chunk commits.
+    """
+    chunk_size = chunk_size or config.PROVISIONING_CHUNK_SIZE
+    reader = csv.DictReader(source)
+    missing = [c for c in REQUIRED_COLUMNS if c not in (reader.fieldnames or [])]
+    if missing:
+        yield {"status": "Error", "detail": f"Missing columns: {', '.join(missing)}"}
+        return
+
+    pool = get_pool(processes)
+    # Line 1 is the header
+    lines = enumerate(reader, start=2)
+    try:
+        while True:
+            chunk = list(islice(lines, chunk_size))
+            if not chunk:
+                break
+            yield from _provision_chunk(db, chunk, pool)
+    except BrokenProcessPool:
+        # A hashing process died: the next run starts a fresh pool
+        shutdown_pool()
+        raise
+
+def _provision_chunk(db: Session, chunk: Iterable, pool: ProcessPoolExecutor) -> Iterator[dict]:
+    results = {}
+    valid = []
+    for line, row in chunk:
+        username = (row.get("username") or "").strip()
+        email = (row.get("email") or "").strip()
+        if not username or not email or not row.get("password"):
+            results[line] = {"line": line, "username": username, "status": "Invalid", "detail": "username, email and password are required"}
+        else:
+            valid.append((line, username, email, row["password"], (row.get("pin") or "").strip() or None))
+
+    hashes = pool.map(security.hash_credentials, [(password, pin) for _, _, _, password, pin in valid], chunksize=max(1, len(valid) // 32))
+    records = []
+    for (line, username, email, _, _), (password_hash, pin_hash, error) in zip(valid, hashes):
+        if error:
+            results[line] = {"line": line, "username": username, "status": "Invalid", "detail": error}
+            continue
+        records.append({
+            "line": line,
+            "username": username,
+            "email": email,
+            "hashed_password": password_hash,
+            "transaction_pin_hash": pin_hash,
+        })
+
+    if records:
+        for result in user_crud.bulk_create_users(db, records):
+            results[result["line"]] = result
+
+    for line in sorted(results):
+        yield results[line]
@@ -0,0 +1,228 @@
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.core import config
+from app.core.money import to_major
+from app.database.models import (
+    Batch, BatchRow, BatchRowStatus, BatchStatus, JobCheckpoint, Transaction, Wallet, WalletLedgerTotal
+)
+
+CHECKPOINT = "ledger_reconciliation"
+REPORT_LIMIT = 1000
+
+# Wallet ids are dense serial integers, so per-wallet aggregates live in plain int64
+# arrays (minor units, exact) indexed by wallet id. Index 0 stands for "outside the
+# ledger" (deposits have no source).
+
+def _grow(array: np.ndarray, size: int) -> np.ndarray:
+    if size <= len(array):
+        return array
+    grown = np.zeros(size, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+def _accumulate_flows(flows: np.ndarray, partition) -> np.ndarray:
+    """
+    Adds one chunk of (from_id, to_id, amount) rows to `flows`. Integer
+    scatter-adds (bincount would go through float64 weights), so sums are exact.
+    """
+    data = np.asarray(partition, dtype=np.int64)
+    sources, targets, amounts = data[:, 0], data[:, 1], data[:, 2]
+    size = max(len(flows), int(sources.max()) + 1, int(targets.max()) + 1)
+    flows = _grow(flows, size)
+    np.add.at(flows, targets, amounts)
+    np.subtract.at(flows, sources, amounts)
+    return flows
+
+def _stream_flows(db: Session, after_id: int, up_to_id: Optional[int], chunk_size: int):
+    """Net flow per wallet for transactions after_id < id <= up_to_id, streamed in id order."""
+    query = select(
+        func.coalesce(Transaction.from_wallet_id, 0), Transaction.to_wallet_id, Transaction.amount
+    ).where(Transaction.id > after_id)
+    if up_to_id is not None:
+        query = query.where(Transaction.id <= up_to_id)
+    # Server-side cursor on Postgres: memory stays at one chunk whatever the ledger size
+    result = db.execute(query.order_by(Transaction.id).execution_options(stream_results=True, yield_per=chunk_size))
+
+    flows = np.zeros(1, dtype=np.int64)
+    scanned = 0
+    for partition in result.partitions(chunk_size):
+        flows = _accumulate_flows(flows, partition)
+        scanned += len(partition)
+    flows[0] = 0
+    return flows, scanned
+
+def _upsert_totals(db: Session, delta: np.ndarray):
+    wallet_ids = np.flatnonzero(delta)
+    if not len(wallet_ids):
+        return
+    rows = [{"wallet_id": int(w), "net": int(delta[w])} for w in wallet_ids]
+    dialect = db.get_bind().dialect.name
+    insert = pg_insert if dialect == "postgresql" else sqlite_insert
+    stmt = insert(WalletLedgerTotal)
+    db.execute(
+        stmt.on_conflict_do_update(index_elements=[WalletLedgerTotal.wallet_id], set_={"net": WalletLedgerTotal.net + stmt.excluded.net}),
+        rows
+    )
+
+def advance_checkpoint(db: Session, chunk_size: int = None, settle_seconds: int = None) -> dict:
+    """
+    INCREMENTAL PHASE:
+    Folds every transaction up to the settle horizon into wallet_ledger_totals and
+    moves the checkpoint, in one DB transaction. The horizon is the newest id older
+    than `settle_seconds`; ids at or below it can no longer be filled in by a
+    commit still in flight.
+    """
+    chunk_size = chunk_size or config.RECONCILE_CHUNK_SIZE
+    settle_seconds = config.RECONCILE_SETTLE_SECONDS if settle_seconds is None else settle_seconds
+
+    checkpoint = db.get(JobCheckpoint, CHECKPOINT, with_for_update=True)
+    if checkpoint is None:
+        checkpoint = JobCheckpoint(name=CHECKPOINT, position=0)
+        db.add(checkpoint)
+    start = checkpoint.position
+
+    horizon = db.execute(
+        select(func.max(Transaction.id)).where(Transaction.timestamp < datetime.utcnow() - timedelta(seconds=settle_seconds))
+    ).scalar() or 0
+
+    scanned = 0
+    if horizon > start:
+        delta, scanned = _stream_flows(db, start, horizon, chunk_size)
+        _upsert_totals(db, delta)
+        checkpoint.position = horizon
+    db.commit()
+    return {"from_id": start, "to_id": max(start, horizon), "transactions_folded": scanned}
+
+def _dense(pairs, size: int = 1) -> np.ndarray:
+    """(wallet_id, value) rows -> dense array; np.add.at because ids may repeat."""
+    pairs = list(pairs)
+    if not pairs:
+        return np.zeros(size, dtype=np.int64)
+    data = np.asarray(pairs, dtype=np.int64)
+    ids = data[:, 0]
+    out = np.zeros(max(size, int(ids.max()) + 1), dtype=np.int64)
+    np.add.at(out, ids, data[:, 1])
+    return out
+
+def check_wallets(db: Session, chunk_size: int, tolerance: int) -> dict:
+    """
+    VERIFY PHASE (one consistent snapshot):
+    expected balance = checkpointed net + net of the tail after the checkpoint
+                       - funds parked in batches.reserved_amount (fan-out reservations)
+    """
+    position = db.execute(select(JobCheckpoint.position).where(JobCheckpoint.name == CHECKPOINT)).scalar() or 0
+    expected = _dense(db.execute(select(WalletLedgerTotal.wallet_id, WalletLedgerTotal.net)))
+    tail, tail_scanned = _stream_flows(db, position, None, chunk_size)
+    reserved = _dense(db.execute(
+        select(Batch.source_wallet_id, Batch.reserved_amount).where(Batch.reserved_amount != 0)
+    ))
+
+    wallets = np.asarray(db.execute(select(Wallet.id, Wallet.balance).order_by(Wallet.id)).all(), dtype=np.int64).reshape(-1, 2)
+    ids = wallets[:, 0]
+    size = int(ids.max()) + 1 if len(ids) else 1
+    expected = _grow(expected, size) + _grow(tail, size) - _grow(reserved, size)
+
+    difference = wallets[:, 1] - expected[ids]
+    bad = np.flatnonzero(np.abs(difference) > tolerance)
+    known = np.zeros(len(expected), dtype=bool)
+    known[ids] = True
+    orphans = np.flatnonzero((np.abs(expected) > tolerance) & ~known)
+    orphans = orphans[orphans > 0]
+
+    return {
+        "checkpoint_id": position,
+        "tail_transactions": tail_scanned,
+        "wallets_checked": len(ids),
+        "wallet_discrepancy_count": len(bad),
+        "wallet_discrepancies": [
+            {
+                "wallet_id": int(ids[i]),
+                "balance": to_major(int(wallets[i, 1])),
+                "expected_balance": to_major(int(expected[ids[i]])),
+                "difference": to_major(int(difference[i])),
+            }
+            for i in bad[:REPORT_LIMIT]
+        ],
+        "ledger_wallets_missing": [int(w) for w in orphans[:REPORT_LIMIT]],
+    }
+
+def check_batches(db: Session, tolerance: int) -> dict:
+    """Finished batches: counters must equal the batch_rows aggregates (see derive_batch_counts)."""
+    rows = BatchRow.__table__
+    succeeded = rows.c.status == BatchRowStatus.SUCCESS
+    failed = rows.c.status == BatchRowStatus.FAILED
+    aggregates = select(
+        rows.c.batch_id,
+        func.sum(case((succeeded, 1), else_=0)).label("success"),
+        func.sum(case((failed, 1), else_=0)).label("failure"),
+        func.sum(case((succeeded, rows.c.amount), else_=0)).label("amount"),
+    ).group_by(rows.c.batch_id).subquery()
+
+    result = db.execute(
+        select(
+            Batch.id, Batch.success_count, Batch.failure_count, Batch.item_count, Batch.total_amount,
+            func.coalesce(aggregates.c.success, 0), func.coalesce(aggregates.c.failure, 0), func.coalesce(aggregates.c.amount, 0)
+        )
+        .outerjoin(aggregates, aggregates.c.batch_id == Batch.id)
+        .where(Batch.status.in_([BatchStatus.COMPLETED, BatchStatus.PARTIALLY_FAILED, BatchStatus.FAILED]))
+        .order_by(Batch.id)
+    ).all()
+    data = np.asarray(result, dtype=np.int64).reshape(-1, 8)
+    batch_id, success, failure, items, amount, row_success, row_failure, row_amount = data.T
+    bad = np.flatnonzero(
+        (success != row_success) | (failure != row_failure)
+        | (items != row_success + row_failure) | (np.abs(amount - row_amount) > tolerance)
+    )
+    return {
+        "batches_checked": len(data),
+        "batch_discrepancy_count": len(bad),
+        "batch_discrepancies": [
+            {
+                "batch_id": int(batch_id[i]),
+                "counters": {"success": int(success[i]), "failure": int(failure[i]), "items": int(items[i]), "amount": to_major(int(amount[i]))},
+                "rows": {"success": int(row_success[i]), "failure": int(row_failure[i]), "amount": to_major(int(row_amount[i]))},
+            }
+            for i in bad[:REPORT_LIMIT]
+        ],
+    }
+
+def reconcile(db: Session, full: bool = False, chunk_size: int = None, settle_seconds: int = None, tolerance: int = None) -> dict:
+    """
+    LEDGER RECONCILIATION:
+    1. Advance: fold new settled transactions into the per-wallet totals (incremental)
+    2. Verify: compare every wallet balance and every finished batch's counters
+       against the ledger, inside one snapshot
+    `full` drops the checkpoint and totals first and re-scans the whole ledger.
+    Amounts are integer minor units, so the default tolerance is 0 (exact match).
+    """
+    started = time.perf_counter()
+    chunk_size = chunk_size or config.RECONCILE_CHUNK_SIZE
+    tolerance = config.RECONCILE_TOLERANCE if tolerance is None else tolerance
+
+    if full:
+        db.query(WalletLedgerTotal).delete(synchronize_session=False)
+        db.query(JobCheckpoint).filter(JobCheckpoint.name == CHECKPOINT).delete(synchronize_session=False)
+        db.commit()
+
+    report = {"advanced": advance_checkpoint(db, chunk_size, settle_seconds)}
+
+    # Balances, tail and reservations must come from the same snapshot
+    if db.get_bind().dialect.name == "postgresql":
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    try:
+        report.update(check_wallets(db, chunk_size, tolerance))
+        report.update(check_batches(db, tolerance))
+    finally:
+        db.rollback()
+
+    report["ok"] = not report["wallet_discrepancy_count"] and not report["batch_discrepancy_count"]
+    report["duration_seconds"] = round(time.perf_counter() - started, 3)
+    return report
@@ -0,0 +1,220 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.core import config
+from app.core.metrics import metrics
+from app.database.db import SessionLocal, engine
+from app.database.models import JobCheckpoint, Transaction, WalletDailyRollup
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT = "wallet_daily_rollups"
+# Arbitrary key for pg_try_advisory_lock, next to db.SCHEMA_LOCK_KEY and the batch scheduler's
+ROLLUP_LOCK_KEY = 7_240_313
+# Ledger timestamps are naive UTC, so rollup days are UTC days
+_DAY = func.date(Transaction.timestamp)
+
+def _as_date(value) -> date:
+    # date() yields a date on Postgres and ISO text on SQLite
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+def _aggregate(db: Session, condition, wallet_id: Optional[int] = None) -> Dict[tuple, list]:
+    """
+    (wallet_id, day) -> [inflow, outflow, credit_count, debit_count] over the
+    ledger rows matching `condition`: one GROUP BY per direction.
+    """
+    buckets = defaultdict(lambda: [0, 0, 0, 0])
+    credits = select(Transaction.to_wallet_id, _DAY, func.sum(Transaction.amount), func.count()).where(condition)
+    debits = select(Transaction.from_wallet_id, _DAY, func.sum(Transaction.amount), func.count()).where(
+        condition, Transaction.from_wallet_id.isnot(None)
+    )
+    if wallet_id is not None:
+        credits = credits.where(Transaction.to_wallet_id == wallet_id)
+        debits = debits.where(Transaction.from_wallet_id == wallet_id)
+
+    for query, amount_slot, count_slot in ((credits, 0, 2), (debits, 1, 3)):
+        for wid, day, total, count in db.execute(query.group_by(query.selected_columns[0], _DAY)):
+            bucket = buckets[(wid, _as_date(day))]
+            # sum(bigint) is NUMERIC on Postgres
+            bucket[amount_slot] += int(total)
+            bucket[count_slot] += count
+    return buckets
+
+def _upsert(db: Session, buckets: Dict[tuple, list]):
+    if not buckets:
+        return
+    rows = [
+        {"wallet_id": wid, "day": day, "inflow": b[0], "outflow": b[1], "credit_count": b[2], "debit_count": b[3]}
+        for (wid, day), b in buckets.items()
+    ]
+    insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(WalletDailyRollup)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[WalletDailyRollup.wallet_id, WalletDailyRollup.day],
+            set_={
+                column: getattr(WalletDailyRollup, column) + getattr(stmt.excluded, column)
+                for column in ("inflow", "outflow", "credit_count", "debit_count")
+            },
+        ),
+        rows
+    )
+
+def advance_rollups(db: Session, chunk_size: int = None, settle_seconds: int = None) -> dict:
+    """
+    INCREMENTAL ROLLUP (high-water mark in job_checkpoints):
+    - Horizon: newest transaction id older than `settle_seconds`; ids at or below
+      it can no longer be filled in by a commit still in flight
+    - Each window of `chunk_size` ids is aggregated in SQL, added to
+      wallet_daily_rollups and the checkpoint moved, in one DB transaction,
+      so a crash resumes exactly where it stopped and nothing is counted twice
+    """
+    chunk_size = chunk_size or config.ROLLUP_CHUNK_SIZE
+    settle_seconds = config.ROLLUP_SETTLE_SECONDS if settle_seconds is None else settle_seconds
+    horizon = db.execute(
+        select(func.max(Transaction.id)).where(Transaction.timestamp < datetime.utcnow() - timedelta(seconds=settle_seconds))
+    ).scalar() or 0
+    db.rollback()
+
+    start = None
+    folded = 0
+    while True:
+        checkpoint = db.get(JobCheckpoint, CHECKPOINT, with_for_update=True)
+        if checkpoint is None:
+            checkpoint = JobCheckpoint(name=CHECKPOINT, position=0)
+            db.add(checkpoint)
+        position = checkpoint.position
+        start = position if start is None else start
+        if position >= horizon:
+            db.rollback()
+            break
+        upper = min(position + chunk_size, horizon)
+        buckets = _aggregate(db, and_(Transaction.id > position, Transaction.id <= upper))
+        _upsert(db, buckets)
+        checkpoint.position = upper
+        db.commit()
+        # Every ledger row has exactly one credit side
+        folded += sum(bucket[2] for bucket in buckets.values())
+
+    metrics.inc("rollups.folded", folded)
+    return {"from_id": start, "to_id": max(start, horizon), "transactions_folded": folded}
+
+def rebuild_rollups(db: Session, chunk_size: int = None, settle_seconds: int = None) -> dict:
+    """Drops every rollup and the checkpoint, then folds the whole ledger again."""
+    db.query(WalletDailyRollup).delete(synchronize_session=False)
+    db.query(JobCheckpoint).filter(JobCheckpoint.name == CHECKPOINT).delete(synchronize_session=False)
+    db.commit()
+    return advance_rollups(db, chunk_size, settle_seconds)
+
+def wallet_daily_totals(wallet_id: int, since: Optional[date] = None, until: Optional[date] = None) -> List[dict]:
+    """
+    STATEMENT READ PATH (since <= day < until, UTC days):
+    - Rolled-up days: primary-key range scan of wallet_daily_rollups
+    - Tail: ledger rows after the checkpoint, aggregated live (only the
+      last settle window, whatever the range), so totals are exact
+    Both reads must see the same checkpoint: on Postgres they share one
+    REPEATABLE READ snapshot, on a session of its own (the caller's request
+    session is never committed). On SQLite the caller must not be holding the
+    write lock (BEGIN IMMEDIATE) while this runs.
+    """
+    with SessionLocal() as db:
+        if db.get_bind().dialect.name == "postgresql":
+            db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        position = db.execute(select(JobCheckpoint.position).where(JobCheckpoint.name == CHECKPOINT)).scalar() or 0
+
+        query = select(
+            WalletDailyRollup.day, WalletDailyRollup.inflow, WalletDailyRollup.outflow,
+            WalletDailyRollup.credit_count, WalletDailyRollup.debit_count
+        ).where(WalletDailyRollup.wallet_id == wallet_id)
+        tail = [Transaction.id > position]
+        if since:
+            query = query.where(WalletDailyRollup.day >= since)
+            tail.append(Transaction.timestamp >= datetime.combine(since, datetime.min.time()))
+        if until:
+            query = query.where(WalletDailyRollup.day < until)
+            tail.append(Transaction.timestamp < datetime.combine(until, datetime.min.time()))
+
+        days = {row.day: [row.inflow, row.outflow, row.credit_count, row.debit_count] for row in db.execute(query)}
+        for (_, day), bucket in _aggregate(db, and_(*tail), wallet_id).items():
+            merged = days.setdefault(day, [0, 0, 0, 0])
+            for slot, value in enumerate(bucket):
+                merged[slot] += value
+
+    return [
+        {"day": day, "inflow": b[0], "outflow": b[1], "net": b[0] - b[1], "credit_count": b[2], "debit_count": b[3]}
+        for day, b in sorted(days.items())
+    ]
+
+def sum_totals(days: List[dict]) -> dict:
+    totals = {"inflow": 0, "outflow": 0, "net": 0, "credit_count": 0, "debit_count": 0}
+    for day in days:
+        for key in totals:
+            totals[key] += day[key]
+    return totals
+
+@contextmanager
+def rollup_leader():
+    """
+    Yields True for the one caller across workers and containers that may advance
+    the rollups this round: a session-level Postgres advisory try-lock on a dedicated
+    autocommit connection, released on exit or with the connection if the worker dies.
+    Everyone else skips the round instead of queueing on the checkpoint row.
+    Always True on SQLite (one host; BEGIN IMMEDIATE serializes any overlap).
+    """
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+    params = {"key": ROLLUP_LOCK_KEY}
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        leader = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), params).scalar()
+        try:
+            yield leader
+        finally:
+            if leader:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), params)
+
+class RollupJob:
+    """Background loop: every `interval` seconds the elected worker (rollup_leader) advances the rollups."""
+
+    def __init__(self, interval: float = None):
+        self.interval = interval or config.ROLLUP_INTERVAL_SECONDS
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="wallet-rollups", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            db = SessionLocal()
+            started = time.perf_counter()
+            try:
+                with rollup_leader() as leader:
+                    if leader:
+                        advance_rollups(db)
+                        metrics.observe("rollups.run_seconds", time.perf_counter() - started)
+            except Exception:
+                db.rollback()
+                logger.exception("wallet rollup run failed")
+            finally:
+                db.close()
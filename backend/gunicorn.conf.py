@@ -0,0 +1,73 @@
+"""
+Multi-process launcher:  gunicorn -c gunicorn.conf.py app.main:app
+
+- One uvicorn worker per core (WEB_CONCURRENCY), so PBKDF2, CSV parsing and
+  serialization are no longer serialized on a single GIL.
+- preload_app: the app (and the schema creation in app.main) is imported once in
+  the master, then forked; workers do not race each other on create_all.
+- DB_CONNECTION_BUDGET is the total number of Postgres connections this container
+  may open. It is split evenly across workers as a hard per-worker pool cap; if it
+  cannot give every worker a pool of 2 plus its LISTEN connection, fewer workers start.
+- max_requests (+ jitter) recycles workers gracefully to bound memory growth. A batch
+  still running when graceful_timeout expires is left PROCESSING; the recovery sweep
+  (BATCH_RECOVERY_INTERVAL) in the remaining workers resumes it and settles its reservation.
+- Workers publish metrics to METRICS_MULTIPROC_DIR; GET /metrics aggregates them.
+"""
+import multiprocessing
+import os
+import shutil
+
+workers = int(os.getenv("WEB_CONCURRENCY", "0")) or multiprocessing.cpu_count()
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.getenv("BIND", "0.0.0.0:4000")
+preload_app = True
+
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "5000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "500"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "60"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+keepalive = 5
+
+# --- Connection budget ---------------------------------------------------------
+# Per worker: 1 LISTEN connection (notifications hub) outside the pool, the rest pooled.
+# The budget is a hard cap: fewer workers are started rather than exceeding it.
+MIN_POOL_PER_WORKER = 2
+connection_budget = int(os.getenv("DB_CONNECTION_BUDGET", "80"))
+if connection_budget < MIN_POOL_PER_WORKER + 1:
+    raise RuntimeError(f"DB_CONNECTION_BUDGET={connection_budget} is below one worker's minimum of {MIN_POOL_PER_WORKER + 1}")
+requested_workers = workers
+workers = min(workers, connection_budget // (MIN_POOL_PER_WORKER + 1))
+per_worker = connection_budget // workers - 1
+assert workers * (per_worker + 1) <= connection_budget
+os.environ.setdefault("DB_POOL_SIZE", str(per_worker))
+os.environ.setdefault("DB_MAX_OVERFLOW", "0")
+
+# Scheduler + fan-out threads draw from the same pool; never let them exceed it.
+# A running batch holds two pooled connections: its session and its source-wallet lock.
+os.environ.setdefault("BATCH_SCHEDULER_WORKERS", str(max(1, min(4, per_worker // 2))))
+
+# The per-process LRU cannot see other workers' invalidations; share it on the host
+os.environ.setdefault("WALLET_CACHE_BACKEND", "sqlite")
+
+# --- Shared metrics --------------------------------------------------------------
+metrics_dir = os.environ.setdefault("METRICS_MULTIPROC_DIR", "/tmp/gwallet-metrics")
+
+def on_starting(server):
+    # Totals start fresh with every master (not with every recycled worker)
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+    if workers < requested_workers:
+        server.log.warning("WEB_CONCURRENCY=%s reduced to %s workers to fit DB_CONNECTION_BUDGET=%s",
+                           requested_workers, workers, connection_budget)
+    server.log.info("workers=%s db_pool_size=%s (budget %s)", workers, os.environ["DB_POOL_SIZE"], connection_budget)
+
+def post_fork(server, worker):
+    # Inherited from the preloading master: pooled DB sockets and SQLite handles
+    from app.database.db import reset_after_fork
+    from app.core.cache import wallet_cache
+    reset_after_fork()
+    wallet_cache.after_fork()
+
+def child_exit(server, worker):
+    from app.core.metrics import retire_worker_snapshot
+    retire_worker_snapshot(metrics_dir, worker.pid)
@@ -0,0 +1,41 @@
+"""
+Behaviour tests, run in-process against the embedded SQLite profile (or the
+database in DATABASE_URL, like the harness). From backend/:  python -m pytest
+"""
+import os
+import tempfile
+
+import pytest
+
+from app import harness
+
+_workdir = tempfile.TemporaryDirectory(prefix="gwallet-tests-")
+# Rollup tests drive the checkpoint themselves; everything else as in `python -m app.harness`
+os.environ.setdefault("ROLLUP_JOB_ENABLED", "0")
+# Must run before anything else under app/ is imported
+harness._prepare_environment(_workdir.name)
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from app.database.db import engine
+    from app.main import app
+
+    # Entering the client runs the lifespan, as in a worker
+    with TestClient(app) as client:
+        yield client
+    engine.dispose()
+    _workdir.cleanup()
+
+@pytest.fixture
+def h(client):
+    """Harness helpers: run-unique users and idempotency keys."""
+    return harness.Harness(client)
+
+@pytest.fixture
+def db(client):
+    from app.database.db import SessionLocal
+
+    session = SessionLocal()
+    yield session
+    session.close()
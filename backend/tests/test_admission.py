@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.admission import AdmissionController
+
+def controller(**limits) -> AdmissionController:
+    options = {"max_in_flight": 2, "max_per_source": 1, "max_queue": 2, "queue_timeout": 1.0}
+    options.update(limits)
+    return AdmissionController("test", **options)
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_queued_request_runs_when_a_slot_frees():
+    async def scenario():
+        admission = controller(max_in_flight=1)
+        await admission.acquire(1)
+        waiter = asyncio.create_task(admission.acquire(2))
+        await asyncio.sleep(0)
+        assert admission.stats()["queued"] == 1
+
+        admission.release(1, 0.01)
+        waited = await waiter
+        return admission.stats(), waited
+
+    stats, waited = run(scenario())
+    assert (stats["in_flight"], stats["queued"]) == (1, 0)
+    assert waited >= 0
+
+def test_full_queue_is_shed_with_503_and_retry_after():
+    async def scenario():
+        admission = controller(max_in_flight=1, max_queue=1)
+        await admission.acquire(None)
+        waiter = asyncio.create_task(admission.acquire(None))
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(HTTPException) as shed:
+                await admission.acquire(None)
+        finally:
+            admission.release(None, 0.01)
+            await waiter
+        return shed.value
+
+    shed = run(scenario())
+    assert shed.status_code == 503
+    assert int(shed.headers["Retry-After"]) >= 1
+
+def test_one_source_cannot_fill_the_queue():
+    async def scenario():
+        admission = controller(max_per_source=1, max_queue=10)
+        await admission.acquire(7)
+        waiter = asyncio.create_task(admission.acquire(7))
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(HTTPException) as shed:
+                await admission.acquire(7)
+            # Other sources are still admitted without waiting for a release
+            assert await asyncio.wait_for(admission.acquire(8), timeout=0.5) < 0.5
+        finally:
+            admission.release(7, 0.01)
+            await waiter
+        return shed.value
+
+    assert run(scenario()).status_code == 429
+
+def test_waiter_blocked_by_its_own_source_does_not_block_others():
+    async def scenario():
+        admission = controller(max_in_flight=3, max_per_source=1)
+        await admission.acquire(7)
+        blocked = asyncio.create_task(admission.acquire(7))
+        await asyncio.sleep(0)
+
+        other = await asyncio.wait_for(admission.acquire(8), timeout=0.5)
+        admission.release(7, 0.01)
+        await blocked
+        return other
+
+    assert run(scenario()) < 0.5
+
+def test_queue_timeout_sheds_and_forgets_the_waiter():
+    async def scenario():
+        admission = controller(max_in_flight=1, queue_timeout=0.05)
+        await admission.acquire(1)
+        with pytest.raises(HTTPException) as shed:
+            await admission.acquire(2)
+        return admission.stats(), shed.value
+
+    stats, shed = run(scenario())
+    assert shed.status_code == 503
+    assert (stats["in_flight"], stats["queued"]) == (1, 0)
+
+def test_transfer_endpoint_returns_429_over_the_source_limit(h, monkeypatch):
+    from app.core.admission import transfer_admission
+
+    source, headers = h.user(deposit=5)
+    target, _ = h.user()
+    # With a per-source share of zero every request from this wallet is over its limit
+    monkeypatch.setattr(transfer_admission, "max_per_source", 0)
+
+    r = h.transfer(headers, source, target, 1, h.key("shed"))
+
+    assert r.status_code == 429
+    assert "Retry-After" in r.headers
+    assert h.balances(source, target) == [5.0, 0.0]
@@ -0,0 +1,34 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app.database.db import engine
+from app.harness import PIN
+
+@contextmanager
+def statements():
+    executed = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield executed
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+def test_compensation_reverses_rows_without_reloading_them(h):
+    source, headers = h.user(deposit=10)
+    recipient, _ = h.user()
+    batch = h.run_batch(headers, source, [(recipient, "1.00")] * 5 + [(2 ** 31 - 1, "1.00")])
+
+    with statements() as executed:
+        r = h.client.post(f"/batches/{batch['id']}/compensate", headers=headers,
+                          json={"row_indices": [0, 1, 2, 3, 5, 0], "pin": PIN})
+
+    assert [result["status"] for result in r.json()["compensation_results"]] == [
+        "Compensated", "Compensated", "Compensated", "Compensated", "Skipped", "Compensated"
+    ]
+    assert h.balances(source, recipient) == [9.0, 1.0]
+    # One read of the rows and of the batch for the whole request, not one per reversed row
+    assert sum("FROM batch_rows" in statement for statement in executed) == 1
+    assert sum("FROM batches" in statement for statement in executed) == 1
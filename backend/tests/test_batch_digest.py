@@ -0,0 +1,103 @@
+import hashlib
+
+import pytest
+
+from app.crud import batch as batch_crud
+from app.harness import PIN
+from app.services import payout_files
+
+def payout_csv(*rows) -> bytes:
+    return ("recipient_id,amount\n" + "".join(f"{recipient},{amount}\n" for recipient, amount in rows)).encode()
+
+def new_batch(h, headers, source) -> int:
+    return h.client.post("/batches/", json={"source_wallet_id": source}, headers=headers).json()["id"]
+
+def execute(h, headers, batch_id, payload: bytes, **form):
+    return h.client.post(f"/batches/{batch_id}/execute", files={"file": ("payouts.csv", payload)},
+                         data={"pin": PIN, **form}, headers=headers)
+
+@pytest.fixture
+def parse_calls(monkeypatch):
+    calls = []
+    read = payout_files.read_payout_rows
+    monkeypatch.setattr(payout_files, "read_payout_rows", lambda fileobj: calls.append(1) or read(fileobj))
+    return calls
+
+def test_digest_is_stored_on_the_batch(h):
+    source, headers = h.user(deposit=10)
+    recipient, _ = h.user()
+    payload = payout_csv((recipient, "1.25"), (recipient, "0.75"))
+    batch_id = new_batch(h, headers, source)
+
+    r = execute(h, headers, batch_id, payload)
+
+    assert r.status_code == 200
+    assert r.json()["content_digest"] == hashlib.sha256(payload).hexdigest()
+    assert h.client.get(f"/batches/{batch_id}", headers=headers).json()["content_digest"] == r.json()["content_digest"]
+
+def test_duplicate_file_is_a_conflict_unless_allowed(h):
+    source, headers = h.user(deposit=10)
+    recipient, _ = h.user()
+    payload = payout_csv((recipient, "1.00"))
+    first = new_batch(h, headers, source)
+    assert execute(h, headers, first, payload).status_code == 200
+
+    second = new_batch(h, headers, source)
+    r = execute(h, headers, second, payload)
+    assert r.status_code == 409
+    assert str(first) in r.json()["detail"]
+    assert h.balances(source, recipient) == [9.0, 1.0]
+
+    r = execute(h, headers, second, payload, allow_duplicate="true")
+    assert r.status_code == 200
+    assert r.json()["duplicate_of"] == [first]
+    assert h.balances(source, recipient) == [8.0, 2.0]
+
+def test_resume_with_the_same_file_skips_parsing(h, db, parse_calls):
+    source, headers = h.user(deposit=10)
+    recipient, _ = h.user()
+    payload = payout_csv((recipient, "1.00"), (recipient, "2.00"))
+    batch_id = new_batch(h, headers, source)
+    # Rows synced by an earlier upload that never started executing
+    assert batch_crud.create_batch_rows(db, batch_id, [(recipient, 100), (recipient, 200)], hashlib.sha256(payload).hexdigest())
+
+    r = execute(h, headers, batch_id, payload)
+
+    assert r.status_code == 200
+    assert r.json()["summary"] == {"total": 2, "success": 2, "failed": 0}
+    assert parse_calls == []
+    assert h.balances(source, recipient) == [7.0, 3.0]
+
+def test_resume_with_a_different_file_is_a_conflict(h, db, parse_calls):
+    source, headers = h.user(deposit=10)
+    recipient, _ = h.user()
+    batch_id = new_batch(h, headers, source)
+    assert batch_crud.create_batch_rows(db, batch_id, [(recipient, 100)], hashlib.sha256(payout_csv((recipient, "1.00"))).hexdigest())
+
+    r = execute(h, headers, batch_id, payout_csv((recipient, "5.00")))
+
+    assert r.status_code == 409
+    assert parse_calls == []
+    assert h.balances(source, recipient) == [10.0, 0.0]
+
+def test_claimed_batch_cannot_be_synced_twice(h, db):
+    source, headers = h.user()
+    batch_id = new_batch(h, headers, source)
+
+    assert batch_crud.create_batch_rows(db, batch_id, [(source, 100)], "a" * 64)
+    assert not batch_crud.create_batch_rows(db, batch_id, [(source, 100)], "b" * 64)
+    assert batch_crud.get_batch_row_totals(db, batch_id) == (1, 100)
+    db.rollback()
+
+def test_empty_upload_does_not_claim_the_batch(h):
+    source, headers = h.user(deposit=10)
+    recipient, _ = h.user()
+    batch_id = new_batch(h, headers, source)
+
+    r = execute(h, headers, batch_id, payout_csv())
+    assert r.status_code == 400
+    assert h.client.get(f"/batches/{batch_id}", headers=headers).json()["content_digest"] is None
+
+    r = execute(h, headers, batch_id, payout_csv((recipient, "4.00")))
+    assert r.status_code == 200
+    assert h.balances(source, recipient) == [6.0, 4.0]
@@ -0,0 +1,49 @@
+import pytest
+
+from app.core import config
+
+@pytest.fixture
+def fanout(monkeypatch):
+    monkeypatch.setattr(config, "BATCH_FANOUT_WORKERS", 4)
+    monkeypatch.setattr(config, "BATCH_FANOUT_CHUNK_SIZE", 5)
+
+def test_fanout_pays_every_row_once(h, fanout):
+    source, headers = h.user(deposit=100)
+    first, _ = h.user()
+    second, _ = h.user()
+    rows = [(first, "1.10"), (second, "0.90")] * 11 + [(2 ** 31 - 1, "5.00")]
+
+    batch = h.run_batch(headers, source, rows)
+
+    assert (batch["success_count"], batch["failure_count"]) == (22, 1)
+    assert batch["reserved_amount"] == 0
+    assert h.balances(source, first, second) == [78.0, 12.1, 9.9]
+    statuses = [row["status"] for row in batch["rows"]]
+    assert statuses.count("SUCCESS") == 22 and statuses[-1] == "FAILED"
+
+def test_fanout_releases_unused_reservation(h, fanout):
+    source, headers = h.user(deposit=7)
+    recipient, _ = h.user()
+
+    batch = h.run_batch(headers, source, [(recipient, "1.00")] * 12)
+
+    # Rows the balance covers are paid; the rest fail and their share of the reservation is released
+    assert (batch["success_count"], batch["failure_count"]) == (7, 5)
+    assert batch["reserved_amount"] == 0
+    assert all("Insufficient funds" in row["error_message"] for row in batch["rows"][7:])
+    assert h.balances(source, recipient) == [0.0, 7.0]
+
+def test_fanout_ledger_reconciles(h, fanout):
+    source, headers = h.user(deposit=50)
+    recipient, _ = h.user()
+    h.run_batch(headers, source, [(recipient, "2.50")] * 10)
+
+    from app.database.db import SessionLocal
+    from app.services import reconciliation
+
+    db = SessionLocal()
+    try:
+        report = reconciliation.reconcile(db, full=True, settle_seconds=0)
+    finally:
+        db.close()
+    assert report["ok"], report
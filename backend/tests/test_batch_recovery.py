@@ -0,0 +1,42 @@
+import time
+
+from app.crud import batch as batch_crud
+from app.database.models import Batch, BatchRow, BatchRowStatus, BatchStatus, Wallet
+from app.services.batch_scheduler import batch_scheduler
+
+def wait_for_final_status(h, batch_id: int, headers: dict) -> dict:
+    for _ in range(500):
+        batch = h.client.get(f"/batches/{batch_id}", headers=headers).json()
+        if batch["status"] not in ("PENDING", "PROCESSING"):
+            return batch
+        time.sleep(0.01)
+    raise AssertionError(f"batch {batch_id} is still {batch['status']}")
+
+def test_orphaned_batch_is_resumed_and_its_reservation_settled(h, db):
+    source, headers = h.user(deposit=10)
+    recipient, _ = h.user()
+    batch_id = h.client.post("/batches/", json={"source_wallet_id": source}, headers=headers).json()["id"]
+    assert batch_crud.create_batch_rows(db, batch_id, [(recipient, 100)] * 3, "0" * 64)
+
+    # What a worker killed mid-chunk leaves behind: row 0 reserved (source debited, recipient never credited)
+    db.query(BatchRow).filter(BatchRow.batch_id == batch_id, BatchRow.row_index == 0).update({BatchRow.status: BatchRowStatus.RESERVED})
+    db.query(Wallet).filter(Wallet.id == source).update({Wallet.balance: Wallet.balance - 100})
+    db.query(Batch).filter(Batch.id == batch_id).update({Batch.status: BatchStatus.PROCESSING, Batch.reserved_amount: 100})
+    db.commit()
+
+    resumed = batch_scheduler.resume_orphaned(db)
+    batch = wait_for_final_status(h, batch_id, headers)
+
+    # A sweep in the background may have got there first; either way it ran exactly once
+    assert batch_id in resumed or batch["status"] == "COMPLETED"
+    assert batch["status"] == "COMPLETED"
+    assert batch["reserved_amount"] == 0
+    assert (batch["success_count"], batch["failure_count"]) == (3, 0)
+    assert h.balances(source, recipient) == [7.0, 3.0]
+
+def test_batches_that_are_running_or_finished_are_left_alone(h, db):
+    source, headers = h.user(deposit=5)
+    recipient, _ = h.user()
+    finished = h.run_batch(headers, source, [(recipient, "1.00")])
+
+    assert finished["id"] not in batch_scheduler.resume_orphaned(db)
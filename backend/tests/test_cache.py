@@ -0,0 +1,85 @@
+import sqlite3
+import time
+
+import pytest
+
+from app.core.cache import LRUBackend, SQLiteBackend, WalletCache
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_backend(request, tmp_path):
+    def make(max_entries: int = 1000, ttl: float = 0):
+        if request.param == "sqlite":
+            return SQLiteBackend(str(tmp_path / "cache.sqlite"), max_entries, ttl)
+        return LRUBackend(max_entries, ttl)
+    return make
+
+def test_populate_is_refused_after_a_concurrent_invalidation(make_backend):
+    backend = make_backend()
+    backend.set_if_version(1, {"balance": 100}, backend.version(1))
+
+    # A reader saw version v, then a commit invalidated the key while it read the DB
+    version = backend.version(1)
+    backend.invalidate(1)
+
+    assert backend.set_if_version(1, {"balance": 100}, version) is False
+    assert backend.get(1) is None
+    assert backend.set_if_version(1, {"balance": 50}, backend.version(1)) is True
+    assert backend.get(1) == {"balance": 50}
+
+def test_load_racing_a_commit_is_returned_but_not_cached(make_backend):
+    cache = WalletCache(make_backend())
+    loads = []
+    def stale_load():
+        loads.append(1)
+        # The balance changes and commits while this read is in flight
+        cache.invalidate([7])
+        return {"balance": 100}
+
+    assert cache.get_or_load(7, stale_load) == {"balance": 100}
+    assert cache.get_or_load(7, lambda: {"balance": 90}) == {"balance": 90}
+    assert cache.get_or_load(7, stale_load) == {"balance": 90}
+    assert len(loads) == 1
+
+def test_entries_expire_after_the_ttl(make_backend):
+    backend = make_backend(ttl=0.05)
+    backend.set_if_version(1, {"balance": 100}, backend.version(1))
+    assert backend.get(1) == {"balance": 100}
+
+    time.sleep(0.1)
+
+    assert backend.get(1) is None
+    assert backend.set_if_version(1, {"balance": 90}, backend.version(1)) is True
+    assert backend.get(1) == {"balance": 90}
+
+def test_size_cap_is_enforced(make_backend):
+    backend = make_backend(max_entries=100)
+    for key in range(250):
+        backend.set_if_version(key, {"balance": key}, backend.version(key))
+
+    cached = [key for key in range(250) if backend.get(key) is not None]
+
+    assert len(cached) <= 100
+    assert 249 in cached
+
+def test_sqlite_cache_written_by_an_older_release_is_replaced(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE cache (key TEXT PRIMARY KEY, value TEXT, version INTEGER NOT NULL)")
+        conn.execute("INSERT INTO cache VALUES ('1', '{\"balance\": 1}', 0)")
+
+    backend = SQLiteBackend(path)
+
+    assert backend.get(1) is None
+    assert backend.set_if_version(1, {"balance": 2}, backend.version(1)) is True
+    assert backend.get(1) == {"balance": 2}
+
+def test_committed_transfer_invalidates_both_wallets(h):
+    source, headers = h.user(deposit=5)
+    target, target_headers = h.user()
+    assert h.client.get(f"/wallets/{source}", headers=headers).json()["balance"] == 5.0
+    assert h.client.get(f"/wallets/{target}", headers=target_headers).json()["balance"] == 0.0
+
+    assert h.transfer(headers, source, target, 2, h.key("cache")).status_code == 200
+
+    assert h.client.get(f"/wallets/{source}", headers=headers).json()["balance"] == 3.0
+    assert h.client.get(f"/wallets/{target}", headers=target_headers).json()["balance"] == 2.0
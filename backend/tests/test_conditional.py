@@ -0,0 +1,135 @@
+import asyncio
+import gzip
+
+import pytest
+
+from app.core.conditional import SelectiveGZipMiddleware, is_not_modified, make_etag
+from app.harness import PIN
+
+GZIP = {"Accept-Encoding": "gzip"}
+
+def run_middleware(content_type: bytes, bodies: list) -> list:
+    """Messages the client receives when `bodies` are sent one after another through the middleware."""
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", content_type)]})
+        for index, body in enumerate(bodies):
+            await send({"type": "http.response.body", "body": body, "more_body": index < len(bodies) - 1})
+
+    sent = []
+    async def send(message):
+        sent.append(message)
+    scope = {"type": "http", "path": "/", "headers": [(b"accept-encoding", b"gzip")]}
+    asyncio.run(SelectiveGZipMiddleware(app, minimum_size=16)(scope, None, send))
+    return sent
+
+@pytest.mark.parametrize("content_type", [b"application/x-ndjson", b"text/event-stream", b"text/plain"])
+def test_streams_pass_through_uncompressed(content_type):
+    lines = [b'{"index": %d, "status": "Committed"}\n' % i * 8 for i in range(3)]
+    sent = run_middleware(content_type, lines)
+
+    headers = dict(sent[0]["headers"])
+    assert b"content-encoding" not in headers
+    # Every chunk leaves as soon as it is sent, byte for byte
+    assert [message["body"] for message in sent[1:]] == lines
+
+def test_one_shot_bodies_are_compressed():
+    body = b'{"balance": 10.5}' * 100
+    sent = run_middleware(b"application/json", [body])
+
+    assert dict(sent[0]["headers"])[b"content-encoding"] == b"gzip"
+    assert gzip.decompress(sent[1]["body"]) == body
+
+def test_small_ndjson_is_not_compressed():
+    sent = run_middleware(b"application/x-ndjson", [b'{"summary": {}}\n' * 10])
+    assert b"content-encoding" not in dict(sent[0]["headers"])
+
+def test_bulk_transfer_stream_is_not_gzipped(h):
+    source, headers = h.user(deposit=100)
+    target, _ = h.user()
+    body = "".join(
+        f'{{"from_wallet_id": {source}, "to_wallet_id": {target}, "amount": 1, "idempotency_key": "{h.key(f"gz-{i}")}"}}\n'
+        for i in range(50)
+    )
+
+    r = h.client.post("/transfer/bulk", content=body, headers={**headers, **GZIP, "X-Transaction-PIN": PIN})
+
+    assert r.status_code == 200
+    assert "content-encoding" not in r.headers
+    assert r.text.count('"status": "Committed"') == 50
+
+# ETags / 304 -----------------------------------------------------------------------
+
+def test_etag_matching():
+    etag = make_etag("wallet", 1, 1050)
+    assert etag.startswith('W/"') and etag != make_etag("wallet", 1, 1051)
+
+    class FakeRequest:
+        def __init__(self, header):
+            self.headers = {"if-none-match": header} if header else {}
+    assert is_not_modified(FakeRequest(etag.removeprefix("W/")), etag)
+    assert is_not_modified(FakeRequest(f'W/"other", {etag}'), etag)
+    assert is_not_modified(FakeRequest("*"), etag)
+    assert not is_not_modified(FakeRequest('W/"other"'), etag)
+    assert not is_not_modified(FakeRequest(None), etag)
+
+def revalidate(h, path: str, headers: dict):
+    first = h.client.get(path, headers=headers)
+    assert first.status_code == 200
+    again = h.client.get(path, headers={**headers, "If-None-Match": first.headers["etag"]})
+    return first, again
+
+def test_wallet_304_until_the_balance_changes(h):
+    wallet, headers = h.user(deposit=5)
+
+    first, again = revalidate(h, f"/wallets/{wallet}", headers)
+    assert again.status_code == 304 and again.content == b""
+    assert again.headers["etag"] == first.headers["etag"]
+
+    h.client.post(f"/wallets/{wallet}/deposit", json={"amount": 1}).raise_for_status()
+    changed = h.client.get(f"/wallets/{wallet}", headers={**headers, "If-None-Match": first.headers["etag"]})
+    assert changed.status_code == 200 and changed.json()["balance"] == 6.0
+
+def test_history_304_until_a_new_transaction(h):
+    source, headers = h.user(deposit=5)
+    target, _ = h.user()
+
+    first, again = revalidate(h, f"/transfer/history/{source}", headers)
+    assert again.status_code == 304
+
+    assert h.transfer(headers, source, target, 1, h.key("etag-history")).status_code == 200
+    changed = h.client.get(f"/transfer/history/{source}", headers={**headers, "If-None-Match": first.headers["etag"]})
+    assert changed.status_code == 200 and len(changed.json()) == 2
+
+def test_batch_304_until_a_row_changes(h, db):
+    from app.database.models import BatchRow, BatchRowStatus
+
+    source, headers = h.user(deposit=5)
+    recipient, _ = h.user()
+    batch = h.run_batch(headers, source, [(recipient, "1.00"), (2 ** 31 - 1, "1.00")])
+
+    first, again = revalidate(h, f"/batches/{batch['id']}", headers)
+    assert again.status_code == 304
+
+    # A row-only change (no batch counter moves) must still invalidate
+    row = db.query(BatchRow).filter(BatchRow.batch_id == batch["id"], BatchRow.row_index == 1)
+    original = row.one().error_message
+    row.update({"status": BatchRowStatus.SKIPPED, "error_message": None})
+    db.commit()
+    try:
+        changed = h.client.get(f"/batches/{batch['id']}", headers={**headers, "If-None-Match": first.headers["etag"]})
+        assert changed.status_code == 200
+    finally:
+        # Put the row back so the batch still reconciles
+        row.update({"status": BatchRowStatus.FAILED, "error_message": original})
+        db.commit()
+
+def test_version_markers_are_index_backed(db):
+    """The ETag markers run on every conditional GET; they must be index ranges, not scans."""
+    from sqlalchemy import inspect
+
+    inspector = inspect(db.get_bind())
+    transaction_indexes = {ix["name"]: ix["column_names"] for ix in inspector.get_indexes("transactions")}
+    row_indexes = {ix["name"]: ix["column_names"] for ix in inspector.get_indexes("batch_rows")}
+    assert transaction_indexes["ix_transactions_from_wallet_id"] == ["from_wallet_id", "id"]
+    assert transaction_indexes["ix_transactions_to_wallet_id"] == ["to_wallet_id", "id"]
+    assert row_indexes["ix_batch_rows_batch_id_row_index"] == ["batch_id", "row_index"]
@@ -0,0 +1,60 @@
+import pytest
+
+def deposit(h, wallet: int, amount: float, key: str):
+    return h.client.post(f"/wallets/{wallet}/deposit", json={"amount": amount, "idempotency_key": key})
+
+def bulk(h, *items):
+    return h.client.post("/wallets/deposits/bulk", json={"deposits": [
+        {"wallet_id": wallet, "amount": amount, "idempotency_key": key} for wallet, amount, key in items
+    ]})
+
+def test_replayed_deposit_is_applied_once(h):
+    wallet, _ = h.user()
+
+    assert deposit(h, wallet, 5, h.key("dep")).status_code == 200
+    assert deposit(h, wallet, 5, h.key("dep")).status_code == 200
+
+    assert h.balances(wallet) == [5.0]
+
+@pytest.mark.parametrize("key", ["batch_1_row_0", "reversal_batch_1_row_0", "deposit_0", "multi_x_leg_0"])
+def test_reserved_key_namespaces_are_rejected(h, key):
+    wallet, headers = h.user(deposit=5)
+    target, _ = h.user()
+
+    assert deposit(h, wallet, 1, key).status_code == 422
+    assert bulk(h, (wallet, 1, key)).status_code == 422
+    assert h.transfer(headers, wallet, target, 1, key).status_code == 422
+    assert h.balances(wallet, target) == [5.0, 0.0]
+
+def test_key_replayed_against_another_wallet_conflicts(h):
+    first, _ = h.user()
+    second, _ = h.user()
+    assert deposit(h, first, 5, h.key("dep")).status_code == 200
+
+    r = deposit(h, second, 5, h.key("dep"))
+
+    assert r.status_code == 409
+    assert h.balances(first, second) == [5.0, 0.0]
+
+def test_transfer_key_is_not_a_deposit_replay(h):
+    source, headers = h.user(deposit=5)
+    target, _ = h.user()
+    assert h.transfer(headers, source, target, 1, h.key("tx")).status_code == 200
+
+    assert deposit(h, target, 5, h.key("tx")).status_code == 409
+    assert h.balances(source, target) == [4.0, 1.0]
+
+def test_bulk_replay_against_another_wallet_fails_that_item(h):
+    first, _ = h.user()
+    second, _ = h.user()
+    assert deposit(h, first, 5, h.key("dep")).status_code == 200
+
+    results = bulk(h, (first, 5, h.key("dep")), (second, 5, h.key("dep")), (second, 2, h.key("new")), (first, 2, h.key("new"))).json()["results"]
+
+    assert [(r["status"], r.get("detail")) for r in results] == [
+        ("Deposited", "Duplicate idempotency key"),
+        ("Failed", "Idempotency key was already used for a different operation"),
+        ("Deposited", None),
+        ("Failed", "Idempotency key was already used for a different operation"),
+    ]
+    assert h.balances(first, second) == [5.0, 2.0]
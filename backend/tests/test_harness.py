@@ -0,0 +1,8 @@
+import pytest
+
+from app import harness
+
+@pytest.mark.parametrize("check", harness.CHECKS, ids=lambda check: check.__name__[len("check_"):])
+def test_harness_check(h, check):
+    ok, details = check(h)
+    assert ok, details
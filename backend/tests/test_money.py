@@ -0,0 +1,52 @@
+from decimal import Decimal
+
+import pytest
+
+from app.core.money import MAX_MINOR, format_amount, to_major, to_minor
+
+@pytest.mark.parametrize("value, minor", [
+    ("10.5", 1050),
+    (" 0.01 ", 1),
+    ("1e2", 10000),
+    (Decimal("19.99"), 1999),
+    (7, 700),
+    (10.1, 1010),
+    (0.29, 29),
+    (-2.5, -250),
+])
+def test_to_minor_is_exact(value, minor):
+    assert to_minor(value) == minor
+
+@pytest.mark.parametrize("value", ["10.005", 10.005, 0.001, Decimal("1.234"), "1e-3"])
+def test_to_minor_rejects_sub_cent_amounts(value):
+    with pytest.raises(ValueError, match="decimal places"):
+        to_minor(value)
+
+@pytest.mark.parametrize("value", ["", "abc", "NaN", "Infinity", True, None, 2 ** 62])
+def test_to_minor_rejects_invalid_amounts(value):
+    with pytest.raises(ValueError):
+        to_minor(value)
+
+def test_minor_round_trip():
+    for minor in (0, 1, 29, 1050, 123456789, MAX_MINOR // 2 ** 11):
+        assert to_minor(to_major(minor)) == minor
+    assert format_amount(1050) == "10.50"
+
+def test_api_rejects_sub_cent_amounts(h):
+    source, headers = h.user(deposit=10)
+    target, _ = h.user()
+
+    r = h.transfer(headers, source, target, 1.005, h.key("sub-cent"))
+    assert r.status_code == 422
+    r = h.client.post(f"/wallets/{source}/deposit", json={"amount": "0.001"})
+    assert r.status_code == 422
+    assert h.balances(source, target) == [10.0, 0.0]
+
+def test_api_amounts_stay_exact(h):
+    source, headers = h.user(deposit=0.3)
+    target, _ = h.user()
+
+    # 0.1 + 0.2 in floats is not 0.3; in minor units the two transfers drain the wallet exactly
+    for i, amount in enumerate((0.1, 0.2)):
+        assert h.transfer(headers, source, target, amount, h.key(f"exact-{i}")).status_code == 200
+    assert h.balances(source, target) == [0.0, 0.3]
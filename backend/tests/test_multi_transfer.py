@@ -0,0 +1,89 @@
+from app.harness import PIN
+
+def multi(h, headers, key, legs):
+    return h.client.post("/transfer/multi", headers=headers, json={"idempotency_key": key, "pin": PIN, "legs": [
+        {"from_wallet_id": source, "to_wallet_id": target, "amount": amount} for source, target, amount in legs
+    ]})
+
+def test_legs_commit_together(h):
+    buyer, headers = h.user(deposit=100)
+    seller, _ = h.user()
+    platform, _ = h.user()
+
+    r = multi(h, headers, h.key("order"), [(buyer, seller, 80.5), (buyer, platform, 19.5)])
+
+    assert r.status_code == 200
+    assert [t["idempotency_key"] for t in r.json()["transactions"]] == [
+        f"multi_{h.key('order')}_leg_0", f"multi_{h.key('order')}_leg_1"
+    ]
+    assert h.balances(buyer, seller, platform) == [0.0, 80.5, 19.5]
+
+def test_net_debit_is_validated_not_each_leg(h):
+    wallet, headers = h.user(deposit=10)
+    # Second wallet of the same user, so both legs are debits the caller owns
+    other = h.client.post("/wallets/", json={}, headers=headers).json()["id"]
+
+    # wallet -> other 25 alone exceeds the balance, other -> wallet 20 brings the net debit to 5
+    r = multi(h, headers, h.key("net"), [(wallet, other, 25), (other, wallet, 20)])
+
+    assert r.status_code == 200
+    assert h.balances(wallet, other) == [5.0, 5.0]
+
+def test_net_debit_over_balance_applies_nothing(h):
+    wallet, headers = h.user(deposit=10)
+    first, _ = h.user()
+    second, _ = h.user()
+
+    r = multi(h, headers, h.key("over"), [(wallet, first, 6), (wallet, second, 6)])
+
+    assert r.status_code == 400
+    assert "Insufficient funds" in r.json()["detail"]
+    assert h.balances(wallet, first, second) == [10.0, 0.0, 0.0]
+
+def test_replay_returns_the_committed_group(h):
+    buyer, headers = h.user(deposit=50)
+    seller, _ = h.user()
+    legs = [(buyer, seller, 10), (buyer, seller, 5)]
+    key = h.key("replay")
+
+    first = multi(h, headers, key, legs)
+    replay = multi(h, headers, key, legs)
+
+    assert first.status_code == replay.status_code == 200
+    assert [t["id"] for t in replay.json()["transactions"]] == [t["id"] for t in first.json()["transactions"]]
+    assert h.balances(buyer, seller) == [35.0, 15.0]
+
+def test_replay_with_different_legs_conflicts(h):
+    buyer, headers = h.user(deposit=50)
+    seller, _ = h.user()
+    fee, _ = h.user()
+    key = h.key("conflict")
+    assert multi(h, headers, key, [(buyer, seller, 10), (buyer, fee, 1)]).status_code == 200
+
+    for legs in (
+        [(buyer, seller, 10), (buyer, fee, 2)],
+        [(buyer, seller, 10)],
+        [(buyer, seller, 10), (buyer, fee, 1), (buyer, fee, 1)],
+        [(buyer, fee, 1), (buyer, seller, 10)],
+    ):
+        assert multi(h, headers, key, legs).status_code == 409
+    assert h.balances(buyer, seller, fee) == [39.0, 10.0, 1.0]
+
+def test_single_transfer_cannot_use_a_leg_key(h):
+    source, headers = h.user(deposit=5)
+    target, _ = h.user()
+
+    r = h.transfer(headers, source, target, 1, f"multi_{h.key('taken')}_leg_0")
+
+    assert r.status_code == 422
+    assert h.balances(source, target) == [5.0, 0.0]
+
+def test_invalid_groups_are_rejected(h):
+    wallet, headers = h.user(deposit=5)
+    target, _ = h.user()
+
+    assert multi(h, headers, h.key("empty"), []).status_code == 422
+    assert multi(h, headers, h.key("self"), [(wallet, wallet, 1)]).status_code == 422
+    assert multi(h, headers, h.key("zero"), [(wallet, target, 0)]).status_code == 422
+    assert multi(h, headers, h.key("missing"), [(wallet, 2 ** 31 - 1, 1)]).status_code == 404
+    assert multi(h, headers, h.key("foreign"), [(target, wallet, 1)]).status_code == 403
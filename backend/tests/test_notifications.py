@@ -0,0 +1,68 @@
+import json
+
+import pytest
+from sqlalchemy import insert
+
+from app.core import notifications
+from app.core.money import MAX_MINOR
+from app.crud import wallet as wallet_crud
+from app.database.models import Wallet
+from app.schemas.wallet import WalletDepositItem
+
+@pytest.fixture
+def published(monkeypatch):
+    """Events the local hub receives after commit (the SQLite path of the NOTIFY payloads)."""
+    events = []
+    monkeypatch.setattr(notifications.hub, "dispatch", events.append)
+    return events
+
+@pytest.mark.parametrize("wallets", [1000, 5000])
+def test_balance_events_fit_in_a_notify_payload(db, wallets):
+    # Worst case per entry: the longest ids and balances
+    balances = {2 ** 31 - 1 - i: MAX_MINOR // 1024 - i for i in range(wallets)}
+
+    notifications.emit_balance_event(db, balances)
+    pending = db.info[notifications._PENDING_KEY]
+    db.rollback()
+
+    assert len(pending) > 1
+    assert all(len(json.dumps(payload).encode()) < 8000 for payload in pending)
+    merged = {int(k): v for payload in pending for k, v in payload["balances"].items()}
+    assert merged == {k: notifications.to_major(v) for k, v in balances.items()}
+
+def test_full_bulk_deposit_chunk_is_split(h, db, published):
+    _, headers = h.user()
+    user_id = h.client.get("/users/me", headers=headers).json()["id"]
+    wallet_ids = db.scalars(insert(Wallet).returning(Wallet.id), [{"user_id": user_id, "balance": 0}] * 1000).all()
+    db.commit()
+
+    results = wallet_crud.deposit_wallets_bulk(db, [WalletDepositItem(wallet_id=wid, amount="12345.67") for wid in wallet_ids])
+
+    assert all(result["status"] == "Deposited" for result in results)
+    balance_events = [event for event in published if event["type"] == "balance"]
+    assert all(len(json.dumps(event).encode()) < notifications.NOTIFY_MAX_BYTES for event in balance_events)
+    assert {int(k) for event in balance_events for k in event["balances"]} == set(wallet_ids)
+
+def test_rolled_back_events_are_never_published(db, published):
+    notifications.emit_transaction_event(db, None, 1, 2, 100, balances={1: 0, 2: 100})
+    notifications.emit_balance_event(db, {1: 0})
+
+    db.rollback()
+
+    assert published == []
+
+def test_transfer_is_pushed_to_the_wallet_owners_only(h):
+    source, headers = h.user(deposit=5)
+    target, _ = h.user()
+    token = headers["Authorization"].split()[1]
+
+    with h.client.websocket_connect(f"/ws/wallets?token={token}") as ws:
+        assert ws.receive_json() == {"type": "subscribed", "wallet_ids": [source]}
+        transaction_id = h.transfer(headers, source, target, 2, h.key("push")).json()["id"]
+
+        pushed = [ws.receive_json(), ws.receive_json()]
+
+    assert pushed[0] == {"type": "transaction", "transaction_id": transaction_id, "from_wallet_id": source,
+                         "to_wallet_id": target, "amount": 2.0, "batch_id": None}
+    # The counterparty's balance is not the subscriber's business
+    assert pushed[1] == {"type": "balance", "wallet_id": source, "balance": 3.0}
@@ -0,0 +1,160 @@
+import gzip
+import io
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from app.services.payout_files import PayoutRows, UnsupportedFormat, detect_format, read_payout_rows
+
+CSV = "﻿recipient_id,amount\n7,0.1\n8,1.10\n\n9,2\n".encode()
+ROWS = [(7, 10), (8, 110), (9, 200)]
+
+def read(payload: bytes):
+    return list(read_payout_rows(io.BytesIO(payload)))
+
+def test_plain_csv():
+    assert detect_format(io.BytesIO(CSV)) == "csv"
+    assert read(CSV) == ROWS
+
+def test_gzip_csv():
+    payload = gzip.compress(CSV)
+    assert detect_format(io.BytesIO(payload)) == "csv.gz"
+    assert read(payload) == ROWS
+
+def test_zstd_csv_across_frames():
+    zstandard = pytest.importorskip("zstandard")
+    payload = zstandard.ZstdCompressor().compress(CSV[:20]) + zstandard.ZstdCompressor().compress(CSV[20:])
+    assert detect_format(io.BytesIO(payload)) == "csv.zst"
+    assert read(payload) == ROWS
+
+def test_total_is_exact_past_int64():
+    amounts = np.full(4, 2 ** 62, dtype=np.int64)
+    rows = PayoutRows(np.arange(1, 5, dtype=np.int64), amounts)
+    assert rows.total() == 2 ** 64
+    assert PayoutRows(np.array([1, 2]), np.array([-5, 3])).total() == -2
+
+@pytest.mark.parametrize("payload, message", [
+    (b"recipient_id,amount\n7,1.001\n", "Invalid CSV row 0"),
+    (b"recipient_id,amount\n7,1\n0,1\n", "Invalid row 1: recipient_id 0 is out of range"),
+    (b"recipient_id,amount\n2147483648,1\n", "Invalid row 0: recipient_id 2147483648 is out of range"),
+    (b"recipient_id,amount\n99999999999999999999,1\n", "recipient_id out of range"),
+    (b"recipient_id,amount\n7,1\n8,abc\n", "Invalid CSV row 1"),
+    (b"recipient_id,amount\n7\n", "Invalid CSV row 0"),
+    (b"recipient,amount\n7,1\n", "Missing CSV columns: recipient_id"),
+    (b"recipient_id,amount\n7,\xff\n", "Unreadable CSV upload"),
+    (gzip.compress(CSV)[:-10], "Unreadable CSV upload"),
+])
+def test_bad_csv(payload, message):
+    with pytest.raises(ValueError, match=message):
+        read(payload)
+
+# Columnar formats ---------------------------------------------------------------
+
+@pytest.fixture
+def pa():
+    return pytest.importorskip("pyarrow")
+
+def parquet(table) -> bytes:
+    import pyarrow.parquet as pq
+
+    sink = io.BytesIO()
+    # Small row groups: several record batches, so row numbers must carry across them
+    pq.write_table(table, sink, row_group_size=2)
+    return sink.getvalue()
+
+def arrow(table, stream: bool = False) -> bytes:
+    import pyarrow.ipc as ipc
+
+    sink = io.BytesIO()
+    writer = (ipc.new_stream if stream else ipc.new_file)(sink, table.schema)
+    writer.write_table(table, max_chunksize=2)
+    writer.close()
+    return sink.getvalue()
+
+def payouts(pa, amounts, column: str = "amount"):
+    return pa.table({"recipient_id": pa.array([7, 8, 9][:len(amounts)], pa.int32()), column: amounts})
+
+def test_parquet_float_amounts(pa):
+    payload = parquet(payouts(pa, pa.array([0.1, 1.1, 2.0])))
+    assert detect_format(io.BytesIO(payload)) == "parquet"
+    assert read(payload) == ROWS
+
+def test_columns_stay_typed_arrays(pa):
+    rows = read_payout_rows(io.BytesIO(parquet(payouts(pa, pa.array([0.1, 1.1, 2.0])))))
+    assert rows.recipients.dtype == rows.amounts.dtype == np.int64
+    assert len(rows) == 3 and rows.total() == 320
+
+def test_recipient_range_checked_on_the_column(pa):
+    table = pa.table({"recipient_id": pa.array([7, 8, -1, 2 ** 40], pa.int64()), "amount_minor": [1, 2, 3, 4]})
+    with pytest.raises(ValueError, match="Invalid row 2: recipient_id -1 is out of range"):
+        read(parquet(table))
+
+def test_parquet_decimal_amounts(pa):
+    assert read(parquet(payouts(pa, pa.array([Decimal("0.10"), Decimal("1.1"), Decimal("2")], pa.decimal128(12, 3))))) == ROWS
+
+def test_arrow_file_minor_units(pa):
+    payload = arrow(payouts(pa, pa.array([10, 110, 200], pa.int64()), column="amount_minor"))
+    assert detect_format(io.BytesIO(payload)) == "arrow"
+    assert read(payload) == ROWS
+
+def test_arrow_stream_text_and_integer_amounts(pa):
+    payload = arrow(payouts(pa, pa.array(["0.1", "1.10", "2"])), stream=True)
+    assert detect_format(io.BytesIO(payload)) == "arrow-stream"
+    assert read(payload) == ROWS
+    assert read(arrow(payouts(pa, pa.array([1, 2, 3])))) == [(7, 100), (8, 200), (9, 300)]
+
+def test_text_recipient_ids(pa):
+    table = pa.table({"recipient_id": ["7", "8", "9"], "amount_minor": [10, 110, 200]})
+    assert read(parquet(table)) == ROWS
+
+@pytest.mark.parametrize("make, message", [
+    (lambda pa: payouts(pa, pa.array([0.1, 1.1, 2.105])), "Invalid row 2"),
+    (lambda pa: payouts(pa, pa.array([Decimal("0.1"), Decimal("1.1"), Decimal("2.105")], pa.decimal128(12, 3))), "Invalid row 2"),
+    (lambda pa: payouts(pa, pa.array([0.1, None, 2.0])), "Invalid row 1: amount is empty"),
+    (lambda pa: payouts(pa, pa.array(["0.1", "1.1", "x"])), "Invalid row 2"),
+    (lambda pa: pa.table({"recipient_id": [7, None, 9], "amount": [1, 2, 3]}), "Invalid row 1: recipient_id is empty"),
+    (lambda pa: pa.table({"recipient_id": [7.0, 8.5, 9.0], "amount": [1, 2, 3]}), "Invalid row 1"),
+    (lambda pa: pa.table({"recipient_id": [7], "amount_minor": [1.5]}), "amount_minor must be an integer column"),
+    (lambda pa: pa.table({"recipient_id": [7], "value": [1]}), "Missing columns: amount"),
+])
+def test_bad_columnar_rows(pa, make, message):
+    with pytest.raises(ValueError, match=message):
+        read(parquet(make(pa)))
+
+def test_truncated_parquet(pa):
+    with pytest.raises(ValueError, match="Unreadable parquet upload"):
+        read(parquet(payouts(pa, pa.array([0.1, 1.1, 2.0])))[:-20])
+
+def test_missing_reader_is_unsupported(pa, monkeypatch):
+    import builtins
+
+    real_import = builtins.__import__
+    def no_pyarrow(name, *args, **kwargs):
+        if name.startswith("pyarrow"):
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+    payload = parquet(payouts(pa, pa.array([0.1])))
+    monkeypatch.setattr(builtins, "__import__", no_pyarrow)
+
+    with pytest.raises(UnsupportedFormat):
+        read(payload)
+
+def test_upload_formats_through_the_api(h, pa):
+    from app.harness import PIN
+
+    def execute(payload: bytes):
+        batch_id = h.client.post("/batches/", json={"source_wallet_id": source}, headers=headers).json()["id"]
+        return h.client.post(f"/batches/{batch_id}/execute", files={"file": ("payouts.bin", payload)},
+                             data={"pin": PIN, "allow_duplicate": "true"}, headers=headers)
+
+    source, headers = h.user(deposit=100)
+    recipient, _ = h.user()
+    table = pa.table({"recipient_id": [recipient] * 3, "amount": pa.array([Decimal("0.10"), Decimal("1.1"), Decimal("2")], pa.decimal128(12, 3))})
+
+    for payload in (parquet(table), gzip.compress(f"recipient_id,amount\n{recipient},4.20\n".encode())):
+        r = execute(payload)
+        assert r.status_code == 200, r.text
+    r = execute(parquet(table.set_column(1, "amount", pa.array([0.1, 1.1, 2.105]))))
+    assert r.status_code == 400
+    assert h.balances(source, recipient) == [92.6, 7.4]
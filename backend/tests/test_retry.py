@@ -0,0 +1,90 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app.core import config
+from app.core.retry import ContentionTracker, classify, run_with_retry
+
+class PgError(Exception):
+    """Stand-in for a psycopg2 error: only the SQLSTATE matters to the classifier."""
+
+    def __init__(self, pgcode: str, message: str = "pg error"):
+        super().__init__(message)
+        self.pgcode = pgcode
+
+def db_error(orig: Exception, kind=OperationalError):
+    return kind("UPDATE wallets ...", {}, orig)
+
+@pytest.mark.parametrize("orig, expected", [
+    (PgError("40P01"), "deadlock_detected"),
+    (PgError("40001"), "serialization_failure"),
+    (PgError("55P03"), "lock_not_available"),
+    (PgError("57014"), "query_canceled"),
+    (Exception("database is locked"), "database_locked"),
+    (PgError("23514", "check constraint"), None),
+])
+def test_classify(orig, expected):
+    assert classify(db_error(orig)) == expected
+
+def test_classify_ignores_non_database_errors():
+    assert classify(ValueError("database is locked")) is None
+    assert classify(db_error(PgError("23505", "duplicate key"), IntegrityError)) is None
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(config, "TRANSFER_RETRY_BASE_DELAY", 0)
+    monkeypatch.setattr(config, "TRANSFER_RETRY_MAX_DELAY", 0)
+
+def test_transient_failures_are_retried(db, no_backoff):
+    calls = []
+    def work():
+        calls.append(1)
+        if len(calls) < 3:
+            raise db_error(PgError("40P01"))
+        return "committed"
+
+    assert run_with_retry(db, work, attempts=4) == "committed"
+    assert len(calls) == 3
+
+def test_permanent_failures_are_not_retried(db, no_backoff):
+    calls = []
+    def work():
+        calls.append(1)
+        raise db_error(PgError("23514", "check constraint"))
+
+    with pytest.raises(OperationalError):
+        run_with_retry(db, work, attempts=4)
+    assert len(calls) == 1
+
+def test_exhausted_retries_become_503(db, no_backoff):
+    def work():
+        raise db_error(PgError("55P03"))
+
+    with pytest.raises(HTTPException) as exhausted:
+        run_with_retry(db, work, attempts=2)
+
+    assert exhausted.value.status_code == 503
+    assert exhausted.value.headers["Retry-After"] == "1"
+
+def test_retries_are_attributed_to_the_wallets(db, no_backoff, monkeypatch):
+    from app.core import retry
+
+    tracker = ContentionTracker()
+    monkeypatch.setattr(retry, "contention", tracker)
+    calls = []
+    def work():
+        calls.append(1)
+        if len(calls) == 1:
+            raise db_error(Exception("database is locked"))
+
+    run_with_retry(db, work, wallet_ids=[1, 2, 2])
+
+    assert {wallet: entry["retries"] for wallet, entry in tracker.top().items()} == {"1": 1, "2": 1}
+
+def test_contention_tracker_keeps_the_hottest_wallets():
+    tracker = ContentionTracker(max_wallets=2)
+    tracker.record_wait([1], 0.5)
+    tracker.record_wait([2], 0.1)
+    tracker.record_wait([3], 0.3)
+
+    assert list(tracker.top()) == ["1", "3"]
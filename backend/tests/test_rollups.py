@@ -0,0 +1,125 @@
+import time
+
+import pytest
+from sqlalchemy import func, select
+
+from app.database.models import JobCheckpoint, Transaction, WalletDailyRollup
+from app.services import rollups
+
+def checkpoint(db) -> int:
+    position = db.execute(select(JobCheckpoint.position).where(JobCheckpoint.name == rollups.CHECKPOINT)).scalar() or 0
+    db.rollback()
+    return position
+
+def latest_transaction_id(db) -> int:
+    latest = db.execute(select(func.max(Transaction.id))).scalar()
+    db.rollback()
+    return latest
+
+def rolled_up(db, wallet_id: int) -> tuple:
+    row = db.execute(
+        select(func.sum(WalletDailyRollup.inflow), func.sum(WalletDailyRollup.outflow),
+               func.sum(WalletDailyRollup.credit_count), func.sum(WalletDailyRollup.debit_count))
+        .where(WalletDailyRollup.wallet_id == wallet_id)
+    ).one()
+    db.rollback()
+    return tuple(row)
+
+def statement(h, wallet_id: int, headers: dict) -> dict:
+    r = h.client.get(f"/wallets/{wallet_id}/statement", headers=headers)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+def test_failed_run_resumes_from_its_checkpoint(h, db, monkeypatch):
+    rollups.advance_rollups(db, settle_seconds=0)
+    start = checkpoint(db)
+    source, headers = h.user(deposit=10)
+    target, _ = h.user()
+    for i in range(3):
+        assert h.transfer(headers, source, target, 1.5, h.key(f"rollup-{i}")).status_code == 200
+    latest = latest_transaction_id(db)
+
+    # Crash while folding the second window of one transaction id
+    upsert, calls = rollups._upsert, []
+    def failing_upsert(session, buckets):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("worker died")
+        upsert(session, buckets)
+    monkeypatch.setattr(rollups, "_upsert", failing_upsert)
+    with pytest.raises(RuntimeError):
+        rollups.advance_rollups(db, chunk_size=1, settle_seconds=0)
+    db.rollback()
+    assert checkpoint(db) == start + 1
+
+    monkeypatch.setattr(rollups, "_upsert", upsert)
+    result = rollups.advance_rollups(db, chunk_size=1, settle_seconds=0)
+
+    assert (result["from_id"], result["to_id"]) == (start + 1, latest)
+    assert checkpoint(db) == latest
+    # Nothing folded twice: deposit 10.00 in, 3 x 1.50 out
+    assert rolled_up(db, source) == (1000, 450, 1, 3)
+    assert rolled_up(db, target) == (450, 0, 3, 0)
+
+def test_statement_merges_the_live_tail(h, db):
+    rollups.advance_rollups(db, settle_seconds=0)
+    source, headers = h.user(deposit=20)
+    target, _ = h.user()
+    assert h.transfer(headers, source, target, 2.25, h.key("tail-0")).status_code == 200
+
+    # The deposit and the first transfer are rolled up, the next two stay in the tail
+    rollups.advance_rollups(db, settle_seconds=0)
+    assert h.transfer(headers, source, target, 0.75, h.key("tail-1")).status_code == 200
+    assert h.transfer(headers, source, target, 1.0, h.key("tail-2")).status_code == 200
+    partly = statement(h, source, headers)
+
+    rollups.advance_rollups(db, settle_seconds=0)
+    folded = statement(h, source, headers)
+
+    assert partly == folded
+    assert folded["totals"] == {"inflow": 20.0, "outflow": 4.0, "net": 16.0, "credit_count": 1, "debit_count": 3}
+
+def test_statement_range_excludes_other_days(h, db):
+    source, headers = h.user(deposit=5)
+    r = h.client.get(f"/wallets/{source}/statement", params={"since": "2000-01-01", "until": "2000-01-02"}, headers=headers)
+
+    assert r.status_code == 200
+    assert r.json()["days"] == []
+    assert r.json()["totals"]["inflow"] == 0
+
+def test_statement_read_leaves_the_callers_session_alone(h, db):
+    from app.database.models import Wallet
+
+    source, _ = h.user(deposit=5)
+    pending = Wallet(user_id=None)
+    db.add(pending)
+
+    days = rollups.wallet_daily_totals(source)
+
+    assert rollups.sum_totals(days)["inflow"] == 500
+    assert pending in db.new
+    db.expunge(pending)
+
+@pytest.mark.parametrize("leader", [True, False])
+def test_job_advances_only_on_the_elected_worker(h, db, monkeypatch, leader):
+    from contextlib import contextmanager
+
+    @contextmanager
+    def election():
+        yield leader
+    monkeypatch.setattr(rollups, "rollup_leader", election)
+    monkeypatch.setattr(rollups.config, "ROLLUP_SETTLE_SECONDS", 0)
+    source, headers = h.user(deposit=5)
+    start = checkpoint(db)
+
+    job = rollups.RollupJob(interval=0.01)
+    job.start()
+    try:
+        for _ in range(200):
+            if checkpoint(db) > start:
+                break
+            time.sleep(0.01)
+    finally:
+        job.stop()
+
+    assert (checkpoint(db) > start) is leader
@@ -12,6 +12,13 @@ app.use(['/users', '/wallets', '/transfer', '/batches'], createProxyMiddleware({
     changeOrigin: true,
 }));
 
+// Wallet push channel (WebSocket upgrade proxied to the backend)
+app.use('/ws', createProxyMiddleware({
+    target: BACKEND_URL,
+    changeOrigin: true,
+    ws: true,
+}));
+
 // Serve static files from the public directory
 app.use(express.static(path.join(__dirname, 'public')));
 